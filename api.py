@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+import collections
+import gzip
+import hashlib
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+import metrics
+import publish
+
+
+logger = logging.getLogger(__name__)
+
+# a small read-only HTTP API for pollers. every response is serialized,
+# gzipped and hashed once per refresh (see update()), so answering a request is
+# a dict lookup, and a client that sends back the ETag it got only costs a 304.
+#
+#   /api                        time of the snapshot and the endpoints below
+#   /api/countries              every country, filterable by query string, e.g.
+#                               ?classification=5&test_required=2 (open, no
+#                               test). repeating a key matches any of its values
+#   /api/countries/<slug>       one country (slugs as in web/data/countries/)
+#   /api/changes                the whole changes series
+#   /api/changes/<yyyy-mm>      one month of it
+
+FILTERS = ('classification', 'test_required', 'quarantine_required', 'abbreviation')
+MAX_AGE = 300 # seconds clients may reuse a response without revalidating
+GZIP_MIN_SIZE = 256 # smaller bodies go out as they are
+FILTER_CACHE_SIZE = 256 # filtered lists kept per snapshot
+
+
+class Response:
+    __slots__ = ('body', 'etag', 'gzipped', 'gzip_etag')
+
+    def __init__(self, obj):
+        self.body = publish.dump_json(obj)
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        # strong etags name exact bytes, so the gzipped variant gets its own
+        self.etag = '"%s"' % digest
+        self.gzipped = self.gzip_etag = None
+        if len(self.body) >= GZIP_MIN_SIZE:
+            self.gzipped = gzip.compress(self.body, 6, mtime=0)
+            self.gzip_etag = '"%s-gzip"' % digest
+
+
+# the responses for one get_statuses()/get_changes() result. never modified
+# after it is built except for the filter cache, so request threads share it
+class Snapshot:
+    def __init__(self, statuses, changes, updated=None):
+        self.updated = int(time.time()) if updated is None else updated
+        self.statuses = statuses
+        self.responses = {
+            '/api/countries': Response(statuses),
+            '/api/changes': Response(changes)
+        }
+        for country in statuses:
+            self.responses['/api/countries/' + publish.slugify(country['name'])] = Response(country)
+        months = dict()
+        for day, counts in changes.items():
+            months.setdefault(publish.month_of(day), dict())[day] = counts
+        for month, days in months.items():
+            self.responses['/api/changes/' + month] = Response(days)
+        self.responses['/api'] = Response({
+            'time': self.updated,
+            'filters': FILTERS,
+            'endpoints': sorted(self.responses)
+        })
+
+        self._filtered = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _filter(self, query):
+        filters = dict()
+        for key, values in urllib.parse.parse_qs(query, keep_blank_values=True).items():
+            if key not in FILTERS:
+                raise ValueError('unknown filter %r, expected one of %s' % (key, ', '.join(FILTERS)))
+            if key == 'abbreviation':
+                filters[key] = frozenset(values)
+            else:
+                try:
+                    filters[key] = frozenset(int(value) for value in values)
+                except ValueError:
+                    raise ValueError('%s must be a number' % key)
+
+        key = tuple(sorted((k, tuple(sorted(v))) for k, v in filters.items()))
+        with self._lock:
+            response = self._filtered.get(key)
+            if response is not None:
+                self._filtered.move_to_end(key)
+                return response
+
+        response = Response([country for country in self.statuses if all(country.get(k) in v for k, v in filters.items())])
+        with self._lock:
+            self._filtered[key] = response
+            if len(self._filtered) > FILTER_CACHE_SIZE:
+                self._filtered.popitem(last=False)
+        return response
+
+    # the Response for a path, None if there is none. raises ValueError on bad filters
+    def get(self, path, query=''):
+        path = path.rstrip('/')
+        if query and path == '/api/countries':
+            return self._filter(query)
+        return self.responses.get(path)
+
+
+_snapshot = None
+_serving = False
+
+
+def update(statuses, changes) -> None:
+    global _snapshot
+    # nobody is listening in one-shot runs, so skip the work
+    if not _serving:
+        return
+    with metrics.timer('stage', stage='api_snapshot'):
+        _snapshot = Snapshot(statuses, changes)
+
+
+# a snapshot from a web/data.json, so the API has something to serve before the first run
+def load(filename) -> bool:
+    global _snapshot
+    try:
+        with open(filename, 'r') as f:
+            data = json.loads(f.read())
+    except (OSError, ValueError) as e:
+        logger.warning('Could not load %s for the API: %s' % (filename, e))
+        return False
+    _snapshot = Snapshot(data['countries'], data['changes'], data.get('time'))
+    return True
+
+
+def _accepts_gzip(header):
+    for coding in header.split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            q = params.strip()
+            try:
+                return not q.startswith('q=') or float(q[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    # If-None-Match compares weakly, so a W/ prefix still matches
+    return any(tag.strip().removeprefix('W/') in ('*', etag) for tag in header.split(','))
+
+
+class APIHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, pollers reuse their connection
+    server_version = 'countryscrape'
+    disable_nagle_algorithm = True # headers and body go out in separate writes
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _error(self, status, message, send_body):
+        body = publish.dump_json({'error': message})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _serve(self, send_body):
+        url = urllib.parse.urlsplit(self.path)
+        snapshot = _snapshot # one snapshot for the whole request, even if update() swaps it
+        if snapshot is None:
+            metrics.incr('api_requests', status=503)
+            return self._error(503, 'no data yet', send_body)
+        try:
+            response = snapshot.get(url.path, url.query)
+        except ValueError as e:
+            metrics.incr('api_requests', status=400)
+            return self._error(400, str(e), send_body)
+        if response is None:
+            metrics.incr('api_requests', status=404)
+            return self._error(404, 'not found', send_body)
+
+        use_gzip = response.gzipped is not None and _accepts_gzip(self.headers.get('Accept-Encoding', ''))
+        etag = response.gzip_etag if use_gzip else response.etag
+        status = 304 if _etag_matches(self.headers.get('If-None-Match'), etag) else 200
+        body = b''
+        self.send_response(status)
+        if status == 200:
+            body = response.gzipped if use_gzip else response.body
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'public, max-age=%d' % self.server.max_age)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Last-Modified', self.date_time_string(snapshot.updated))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+        metrics.incr('api_requests', status=status)
+        if send_body:
+            metrics.incr('api_bytes_sent', len(body))
+
+    def log_message(self, format, *args):
+        logger.debug('%s %s' % (self.address_string(), format % args))
+
+
+# binds the API to host:port and serves it from a daemon thread
+def start(host='127.0.0.1', port=8080, max_age=MAX_AGE):
+    global _serving
+    server = http.server.ThreadingHTTPServer((host, port), APIHandler)
+    server.daemon_threads = True
+    server.max_age = max_age
+    _serving = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info('Serving the API on http://%s:%d/api' % server.server_address[:2])
+    return server
+
+
+def parse_address(value):
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    # serves a web/data.json written by one-shot runs, reloading it when it changes
+    parser = argparse.ArgumentParser(description='Serve web/data.json as a JSON API with ETags and gzip')
+    parser.add_argument('address', nargs='?', default='127.0.0.1:8080', help='HOST:PORT to listen on')
+    parser.add_argument('--data', default='web/data.json')
+    parser.add_argument('--max-age', type=int, default=MAX_AGE)
+    parser.add_argument('--poll', type=float, default=10, help='seconds between checks for a new data file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    host, port = parse_address(args.address)
+    start(host, port, args.max_age)
+    mtime = None
+    while True:
+        try:
+            current = os.stat(args.data).st_mtime_ns
+        except FileNotFoundError:
+            current = None
+        if current is not None and current != mtime and load(args.data):
+            mtime = current
+            logger.info('Loaded %s' % args.data)
+        time.sleep(args.poll)
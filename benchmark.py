@@ -0,0 +1,1619 @@
+#!/usr/bin/env python3
+
+import argparse
+import ast
+import contextlib
+import glob
+import gzip
+import hashlib
+import html.parser
+import http.client
+import http.server
+import inspect
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+
+import api
+import main
+import metrics
+import pack
+import publish
+import query
+import records
+import tweets
+
+
+class StubEmbassyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.2
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = ('<html><body><ul><li>Are U.S. citizens permitted to enter? Yes. (%s)</li></ul></body></html>' % self.path).encode()
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_servers(count, delay):
+    handler = type('StubEmbassyHandler', (StubEmbassyHandler,), {'delay': delay})
+    servers = list()
+    for _ in range(count):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+# the stub servers only speak plain http
+def _stub_page_url(domain, path):
+    return 'http://%s/%s' % (domain, path)
+
+
+def bench_fetch(args):
+    servers = start_stub_servers(args.hosts, args.delay)
+    cwd = os.getcwd()
+    results = dict()
+    try:
+        for label, workers in (('serial', 1), ('concurrent', main.FETCH_WORKERS)):
+            with tempfile.TemporaryDirectory() as tmp:
+                # fetch_page() keeps its cache under ./data
+                os.chdir(tmp)
+                os.mkdir('data')
+                main._cache_meta = None
+
+                jobs = list()
+                for i in range(args.countries):
+                    domain = '127.0.0.1:%d' % servers[i % len(servers)].server_address[1]
+                    jobs.append(('Country %d' % i, 'http://%s/covid-19-information/' % domain, domain, 'data/country_%d.html' % i))
+
+                start = time.perf_counter()
+                main.fetch_countries(jobs, workers=workers, page_url=_stub_page_url)
+                results[label] = time.perf_counter() - start
+                assert all(os.path.getsize(job[3]) for job in jobs), 'stub fetch left empty files behind'
+
+                if workers != 1:
+                    # expire everything and refresh again: every page should come back as a 304
+                    config = dict(main.CONFIG)
+                    main.CONFIG['refresh-interval'] = -1
+                    main.reset_cache_stats()
+                    start = time.perf_counter()
+                    try:
+                        main.fetch_countries(jobs, workers=workers, page_url=_stub_page_url)
+                    finally:
+                        main.CONFIG.clear()
+                        main.CONFIG.update(config)
+                    results['revalidate'] = time.perf_counter() - start
+                    assert main.CACHE_STATS['miss'] == 0, main.CACHE_STATS
+
+                os.chdir(cwd)
+    finally:
+        os.chdir(cwd)
+        for server in servers:
+            server.shutdown()
+
+    print('fetch: %d countries over %d hosts, %.2fs per request' % (args.countries, args.hosts, args.delay))
+    for label, elapsed in results.items():
+        print('  %-10s %.2fs' % (label, elapsed))
+    print('  speedup    %.1fx' % (results['serial'] / results['concurrent']))
+
+
+# the classifiers as they were before the compiled phrase rules, kept as the
+# reference the current ones are benchmarked and checked against
+
+def legacy_parse_answer(_answer, url=None):
+    answer = re.sub(r'\s+', ' ', re.sub(r'[^\w \n]', '', main.strip_tags(_answer))).strip().lower()
+
+    if not answer:
+        return main.ANSWER_UNKNOWN
+
+    yes_sometimess = ['not for tourism', 'entry is restricted', 'no tourism', 'subject to strict limitations', 'purpose of travel', 'only under', 'very limited cases', 'special permission', 'but only if they meet other certain criteria', 'limited circumstances', 'restricting non-essential travel', 'only essential travel is permitted']
+    yes_always = ['valid visa', 'approved evisa', 'with additional documentation', 'subject to restrictions']
+
+    no_rarelys = ['limited circumstances', 'few exceptions', 'limited exceptions', 'for exceptions', 'special circumstances', 'but currently most us citizens can', 'other us visitors are not allowed']
+    no_always = ['nonessential travel', 'residency']
+
+    others_override = {'other us visitors are not allowed': main.ANSWER_RARELY}
+    others_no = ['us visitors are not allowed']
+    others_rarely = ['very limited', 'other us visitors are not allowed', 'but currently most us citizens can']
+    others_sometimes = ['it depends']
+    others_always = ['in most cases', 'the countryyes', 'some us citizens are permitted to enter']
+
+    if re.findall(r'\byes\b', answer) or answer.startswith('yes'):
+        for d in yes_sometimess:
+            if d in answer:
+                return main.ANSWER_SOMETIMES
+        for d in yes_always:
+            if d in answer:
+                return main.ANSWER_YES
+
+        return main.ANSWER_YES
+    
+    if re.findall(r'\bno\b', answer) or answer.startswith('no'):
+        for d in no_rarelys:
+            if d in answer:
+                return main.ANSWER_RARELY
+
+        for d in no_always:
+            if d in answer:
+                return main.ANSWER_NO
+
+        return main.ANSWER_NO
+    
+    for d, k in others_override.items():
+        if d in answer:
+            return k
+    for d in others_no:
+        if d in answer:
+            return main.ANSWER_NO
+    for d in others_rarely:
+        if d in answer:
+            return main.ANSWER_RARELY
+    for d in others_sometimes:
+        if d in answer:
+            return main.ANSWER_SOMETIMES
+    for d in others_always:
+        if d in answer:
+            return main.ANSWER_YES
+
+    main.logger.warning('Unknown response: _answer=%r, answer=%r, url=%r' % (_answer, answer, url))
+    return main.ANSWER_UNKNOWN
+
+
+def legacy_parse_covid_test_answer(question, _answer, url=None):
+    answer = re.sub(r'\s+', ' ', re.sub(r'[^\w ]', '', main.strip_tags(_answer))).strip().lower()
+    
+    if not answer:
+        return main.TEST_REQUIRED_UNKNOWN
+
+    # HACK: [Sun, 07 Mar 2021 14:53:03] WARNING [main.py._parse_covid_test_answer:236] Unknown response for test_required: _answer=' to Mexico.</li>', answer='to mexico', url='https://mx.usembassy.gov/u-s-citizen-services/covid-19-information/'
+    answer += re.sub(r'\s+', ' ', re.sub(r'[^\w ]', '', main.strip_tags(question))).strip().lower()
+
+    yess = ['yes', 'must produce a negative', 'provide a negative', 'requires a negative', 'must undergo', 'requirements for a valid test', 'is required', 'will be tested for covid-19 at their own expense']
+    nos = ['no', 'not required']
+    unknowns = ['remain closed']
+
+    for d in yess:
+        if d in answer:
+            return main.TEST_REQUIRED_YES
+
+    for d in nos:
+        if d in answer:
+            return main.TEST_REQUIRED_NO
+
+    for d in unknowns:
+        if d in answer:
+            return main.TEST_REQUIRED_UNKNOWN
+
+    main.logger.warning('Unknown response for test_required: question=%r, _answer=%r, answer=%r, url=%r' % (question, _answer, answer, url))
+    return main.TEST_REQUIRED_UNKNOWN
+
+
+def legacy_parse_quarantine_required_answer(_answer, url=None):
+    answer = re.sub(r'\s+', ' ', re.sub(r'[^\w ]', '', main.strip_tags(_answer))).strip().lower()
+    
+    if not answer:
+        return main.QUARANTINE_REQUIRED_UNKNOWN
+
+    yess = ['yes', 'subject to quarantine', 'the following restrictions apply']
+    nos = ['no', 'not required to quarantine', 'travelers with elevated temperatures']
+    unknowns = ['possibly']
+
+    for d in yess:
+        if d in answer:
+            return main.QUARANTINE_REQUIRED_YES
+
+    for d in nos:
+        if d in answer:
+            return main.QUARANTINE_REQUIRED_NO
+
+    for d in unknowns:
+        if d in answer:
+            return main.QUARANTINE_REQUIRED_UNKNOWN
+
+    main.logger.warning('Unknown response for quarantine_required: _answer=%r, answer=%r, url=%r' % (_answer, answer, url))
+    return main.QUARANTINE_REQUIRED_UNKNOWN
+
+
+def classifier_corpus(size=5000, seed=1337):
+    # every phrase the classifiers know about, behind every kind of prefix they branch on
+    phrases = set()
+    for func in (legacy_parse_answer, legacy_parse_covid_test_answer, legacy_parse_quarantine_required_answer):
+        for literal in re.findall(r"[\[{]('.*?')[\]}]", inspect.getsource(func)):
+            value = ast.literal_eval('[' + literal + ']')
+            phrases.update(value)
+    phrases = sorted(phrases)
+    prefixes = ['', 'Yes. ', 'YES, ', 'No. ', 'NO - ', 'Currently, ', '<strong>Yes</strong>, ', 'nobody knows, ']
+
+    # plus whatever answers are sitting in the local page cache
+    snippets = list()
+    for filename in glob.glob('data/country_*.html'):
+        with open(filename, 'r', errors='replace') as f:
+            snippets += [m[-1] for m in re.findall(r'(permitted to enter\??|required for entry\??|required to quarantine\??)(.*?</li>)', f.read(), re.IGNORECASE | re.DOTALL)]
+
+    r = random.Random(seed)
+    corpus = list(snippets)
+    while len(corpus) < size:
+        picked = r.sample(phrases, r.randint(0, 3))
+        corpus.append(r.choice(prefixes) + ' and '.join(picked) + r.choice(['.', '</li>', ' for now.</li>']))
+    return corpus
+
+
+def bench_classify(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    corpus = classifier_corpus(args.size)
+    pairs = [
+        ('_parse_answer', lambda a: main._parse_answer(a), legacy_parse_answer),
+        ('_parse_covid_test_answer', lambda a: main._parse_covid_test_answer('Is a negative COVID-19 test required for entry?', a), lambda a: legacy_parse_covid_test_answer('Is a negative COVID-19 test required for entry?', a)),
+        ('_parse_quarantine_required_answer', main._parse_quarantine_required_answer, legacy_parse_quarantine_required_answer)
+    ]
+
+    print('classify: %d answer snippets' % len(corpus))
+    for name, current, legacy in pairs:
+        mismatches = [a for a in corpus if current(a) != legacy(a)]
+        assert not mismatches, '%s disagrees with the legacy rules on %r' % (name, mismatches[:5])
+
+        timings = dict()
+        for label, func in (('legacy', legacy), ('current', current)):
+            start = time.perf_counter()
+            for answer in itertools.islice(itertools.cycle(corpus), args.iterations):
+                func(answer)
+            timings[label] = args.iterations / (time.perf_counter() - start)
+
+        print('  %-34s legacy %8.0f/s  current %8.0f/s  (%.2fx)' % (name, timings['legacy'], timings['current'], timings['current'] / timings['legacy']))
+
+
+def synthetic_page(name, seed, padding=0):
+    r = random.Random(seed)
+    answers = (
+        ('Are U.S. citizens permitted to enter?', ['Yes.', 'No, with limited exceptions.', 'Yes, but only for the purpose of travel approved by the ministry.', 'It depends on your visa.', 'Yes, with a valid visa.']),
+        ('Is a negative COVID-19 test (PCR and/or serology) required for entry?', ['Yes, travelers must produce a negative PCR test.', 'No.', 'Not required.']),
+        ('Are U.S. citizens required to quarantine?', ['Yes, for 14 days.', 'No.', '<span data-contrast="none">Travelers are subject to quarantine&nbsp;at a hotel</span>'])
+    )
+    items = ''.join('<li><strong>%s</strong> %s</li>\n' % (question, r.choice(choices)) for question, choices in answers)
+    filler = '<p>Lorem ipsum dolor sit amet, consectetur&nbsp;adipiscing elit &amp; more.</p>\n' * padding
+    return (
+        '<html><head><meta property="article:modified_time" content="2021-03-%02dT10:00:00+00:00" />\n</head><body>%s'
+        '<div class="panel panel-default"><h4 class="panel-title">%s</h4><ul>%s</ul></div>'
+        '<div class="panel panel-default">%s</div></body></html>'
+    ) % (r.randint(1, 28), filler, name, items, filler)
+
+
+# (name, how the page titles its accordion panel): headings that take unicode
+# case folding or whitespace to find, which bytes patterns don't do
+EDGE_CASE_TITLES = (
+    ("C\u00f4te d'Ivoire", "C\u00d4TE D'IVOIRE"),
+    ('Em Space', '\u2003Em Space\u2003'),
+    ('Trinidad and Tobago', 'Trinidad &amp; Tobago')
+)
+
+
+def edge_case_page(title):
+    # another country's panel first, so missing the heading changes the answers
+    panel = '<div class="panel panel-default"><h4 class="panel-title">%s</h4><ul><li><strong>Are U.S. citizens permitted to enter?</strong> %s</li></ul></div>'
+    return '<html><body>%s%s<div class="panel panel-default"></div></body></html>' % (panel % ('Elsewhere', 'No.'), panel % (title, 'Yes.'))
+
+
+def extraction_corpus():
+    # (country, contents) for every cached country page, or synthetic ones if
+    # there is no cache, plus the edge case pages
+    corpus = list()
+    if os.path.exists('data/directory.html'):
+        for country in main.parse_directory(fetch=False).values():
+            if os.path.exists(country.filename):
+                with open(country.filename, 'r') as f:
+                    corpus.append((country, f.read()))
+    if not corpus:
+        for i in range(200):
+            country = records.CountryStatus('Country %d' % i, url='https://c%d.usembassy.gov/' % i, domain='c%d.usembassy.gov' % i)
+            corpus.append((country, synthetic_page(country.name, i, padding=i * 5)))
+    for i, (name, title) in enumerate(EDGE_CASE_TITLES):
+        country = records.CountryStatus(name, url='https://e%d.usembassy.gov/' % i, domain='e%d.usembassy.gov' % i)
+        corpus.append((country, edge_case_page(title)))
+    return corpus
+
+
+def _normalize_extracted(extracted):
+    out = dict(extracted)
+    for key in ('us_citizens', 'covid_test', 'quarantine_required'):
+        out[key] = [(main._normalize_answer(q), main._normalize_answer(a)) for q, a in extracted[key]]
+    return out
+
+
+def _measure(func):
+    # timed without tracemalloc, which slows pure python code down a lot more than C
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+# the extractors that came before the mmap one, kept as the references it is
+# checked against (see "benchmark.py extract")
+
+RE_US_CITIZENS = r'((Are )?U\.S\. citizens permitted to enter\??)(.*?<\/li>)'
+RE_COVID_TEST = r'(Is a negative COVID-19 test.*?required for entry\??)(.*?<\/li>)'
+RE_QUARANTINE_REQUIRED = r'(citizens +required +to +quarantine\??)(.*?<\/li>)'
+EXTRACT_CHUNK_SIZE = 64 * 1024
+
+
+def _get_section_regex(country):
+    return re.compile(r'<h4 class="panel-title">\s*(?:' + '|'.join([re.escape(country.name), re.escape(country.name.replace('and', '&'))]) + r')\s*<\/h4>', re.IGNORECASE | re.MULTILINE | re.DOTALL)
+
+
+# the panel titles ContentExtractor takes for the country's section
+def _get_section_names(country):
+    return frozenset({country.name.lower(), country.name.replace('and', '&').lower()})
+
+
+def _get_latest_regex(country):
+    return re.compile(r'(latest|updated).*info.*"(http.*?' + re.escape(country.domain) + '.*?)"', re.IGNORECASE | re.MULTILINE)
+
+
+# the original extractor: the page as one str, cleaned up with .replace() and
+# searched with str regexes. same output as main.extract_country_contents()
+def extract_regex(country, contents):
+    contents = contents.replace('&nbsp;', ' ').replace('&amp;', '&').replace('\xa0', ' ').strip()
+    
+    # deal with accordions
+
+    matches = _get_section_regex(country).split(contents, 1)
+    if len(matches) != 1:
+        contents = matches[1].split(' class="panel panel-default">', 1)[0]
+
+    return {
+        'us_citizens': [(question, answer) for question, _, answer in re.findall(RE_US_CITIZENS, contents, re.IGNORECASE | re.MULTILINE | re.DOTALL)],
+        'covid_test': re.findall(RE_COVID_TEST, contents, re.IGNORECASE | re.MULTILINE | re.DOTALL),
+        'quarantine_required': re.findall(RE_QUARANTINE_REQUIRED, contents.replace('<span data-contrast="none">', '').replace('</span>', '').replace('&nbsp;', ' '), re.IGNORECASE | re.MULTILINE | re.DOTALL),
+        'modified_times': re.findall(main.RE_MODIFIED_TIME, contents, re.IGNORECASE),
+        'latest_urls': [url for _, url in _get_latest_regex(country).findall(contents)]
+    }
+
+
+class _QuestionScanner:
+    # longest question we wait for once its start has been seen
+    MAX_QUESTION_SIZE = 2048
+
+    def __init__(self, key, start_regex, regex, spans_tags=()):
+        self.key = key
+        self.start_regex = start_regex # finds where a question may begin
+        self.regex = regex # matches the whole question from there
+        self.spans_tags = spans_tags # tags a question may contain, or True for any
+        self.tail = ''
+        self.started = False
+        self.question = None
+        self.answer = None
+
+    def feed(self, text):
+        if self.answer is not None:
+            self.answer.write(text)
+            return
+
+        self.tail += text
+        while True:
+            if not self.started:
+                match = self.start_regex.search(self.tail)
+                if not match:
+                    # keep just enough to catch a question start split over two chunks
+                    self.tail = self.tail[-64:]
+                    return
+                self.tail = self.tail[match.start():]
+                self.started = True
+
+            match = self.regex.match(self.tail)
+            if match:
+                self.question = match.group(0)
+                self.answer = io.StringIO()
+                self.answer.write(self.tail[match.end():])
+                self.tail = ''
+                self.started = False
+                return
+
+            if len(self.tail) <= self.MAX_QUESTION_SIZE:
+                return
+
+            # give up on this start and look for the next one
+            self.tail = self.tail[1:]
+            self.started = False
+
+    def tag(self, tag):
+        if self.answer is None and self.spans_tags is not True and tag not in self.spans_tags:
+            self.tail = ''
+            self.started = False
+
+    def end_li(self, results):
+        if self.answer is not None:
+            results[self.key].append((self.question, self.answer.getvalue()))
+            self.question = None
+            self.answer = None
+
+
+class _ExtractScope:
+    # the text scanned within a page, or within the country's accordion section
+    def __init__(self, latest_regex):
+        self.results = {'us_citizens': [], 'covid_test': [], 'quarantine_required': [], 'modified_times': [], 'latest_urls': []}
+        self.scanners = [
+            _QuestionScanner('us_citizens', _STREAM_RE_US_CITIZENS, _STREAM_RE_US_CITIZENS),
+            _QuestionScanner('covid_test', _STREAM_RE_COVID_TEST_START, _STREAM_RE_COVID_TEST, spans_tags=True),
+            _QuestionScanner('quarantine_required', _STREAM_RE_QUARANTINE_REQUIRED, _STREAM_RE_QUARANTINE_REQUIRED, spans_tags=('span',))
+        ]
+        self.latest_regex = latest_regex
+
+    def feed(self, text):
+        for scanner in self.scanners:
+            scanner.feed(text)
+
+    def tag(self, tag):
+        for scanner in self.scanners:
+            scanner.tag(tag)
+
+    def end_li(self):
+        for scanner in self.scanners:
+            scanner.end_li(self.results)
+
+    def feed_line(self, line):
+        self.results['latest_urls'] += [url for _, url in self.latest_regex.findall(line)]
+
+
+_STREAM_RE_US_CITIZENS = re.compile(r'(?:Are )?U\.S\. citizens permitted to enter\??', re.IGNORECASE)
+_STREAM_RE_COVID_TEST_START = re.compile(r'Is a negative COVID-19 test', re.IGNORECASE)
+_STREAM_RE_COVID_TEST = re.compile(r'Is a negative COVID-19 test.*?required for entry\??', re.IGNORECASE | re.DOTALL)
+_STREAM_RE_QUARANTINE_REQUIRED = re.compile(r'citizens +required +to +quarantine\??', re.IGNORECASE)
+
+
+# a single pass over the page with html.parser, in the spirit of MLStripper:
+# questions are matched against the text between tags and their answers run
+# until the next </li>, so nothing but the answers and one source line (for the
+# "latest info" links) is ever held in memory
+class ContentExtractor(html.parser.HTMLParser):
+    # longest source line kept around for the "latest info" link search
+    MAX_LINE_SIZE = 64 * 1024
+
+    def __init__(self, country):
+        super().__init__(convert_charrefs=True)
+        self.section_names = _get_section_names(country)
+        self.latest_regex = _get_latest_regex(country)
+        self.page = _ExtractScope(self.latest_regex)
+        self.section = None
+        self.section_done = False
+        self.panel_title = None
+        self.line = io.StringIO()
+
+    def _scopes(self):
+        if self.section and not self.section_done:
+            return (self.page, self.section)
+        return (self.page,)
+
+    def _feed_line(self, text):
+        lines = text.split('\n')
+        for i, part in enumerate(lines):
+            if i:
+                line = self.line.getvalue()
+                for scope in self._scopes():
+                    scope.feed_line(line)
+                self.line = io.StringIO()
+            if self.line.tell() < self.MAX_LINE_SIZE:
+                self.line.write(part)
+
+    def handle_starttag(self, tag, attrs):
+        raw = self.get_starttag_text() or ''
+        if self.section and raw.endswith(' class="panel panel-default">'):
+            # the next accordion panel starts here
+            self.section_done = True
+
+        self._feed_line(raw)
+        for scope in self._scopes():
+            scope.tag(tag)
+
+        attrs = dict(attrs)
+        if tag == 'h4' and attrs.get('class') == 'panel-title' and not self.section:
+            self.panel_title = io.StringIO()
+        elif self.panel_title is not None:
+            # only a bare title counts as the country's heading
+            self.panel_title = None
+
+        if tag == 'meta' and attrs.get('property') == 'article:modified_time' and attrs.get('content'):
+            for scope in self._scopes():
+                scope.results['modified_times'].append(attrs['content'])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        self._feed_line('</%s>' % tag)
+        for scope in self._scopes():
+            scope.tag(tag)
+
+        if tag == 'h4' and self.panel_title is not None:
+            if self.panel_title.getvalue().strip().lower() in self.section_names:
+                self.section = _ExtractScope(self.latest_regex)
+            self.panel_title = None
+        elif tag == 'li':
+            for scope in self._scopes():
+                scope.end_li()
+
+    def handle_data(self, data):
+        data = data.replace('\xa0', ' ')
+        self._feed_line(data)
+
+        if self.panel_title is not None:
+            self.panel_title.write(data)
+
+        for scope in self._scopes():
+            scope.feed(data)
+
+    def get_results(self):
+        self._feed_line('\n')
+        return (self.section or self.page).results
+
+
+def extract_streaming(country, chunks):
+    extractor = ContentExtractor(country)
+    for chunk in chunks:
+        extractor.feed(chunk)
+    extractor.close()
+    return extractor.get_results()
+
+
+def _iter_file_chunks(filename):
+    with open(filename, 'r') as f:
+        while True:
+            chunk = f.read(EXTRACT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+EXTRACTORS = ('regex', 'streaming', 'mmap')
+
+
+def extract(country, contents=None, filename=None, extractor='mmap'):
+    if extractor == 'mmap':
+        return main.extract_country_contents(country, contents, filename)
+    if extractor == 'regex':
+        if contents is None:
+            with open(filename, 'r') as f:
+                contents = f.read()
+        return extract_regex(country, contents)
+    return extract_streaming(country, [contents] if contents is not None else _iter_file_chunks(filename))
+
+
+def bench_extract(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    corpus = extraction_corpus()
+
+    for extractor in EXTRACTORS[1:]:
+        mismatches = [country.name for country, contents in corpus
+            if _normalize_extracted(extract(country, contents, extractor='regex')) != _normalize_extracted(extract(country, contents, extractor=extractor))]
+        print('extract: %d pages, %d differ between the regex and %s extractors' % (len(corpus), len(mismatches), extractor))
+        for name in mismatches:
+            print('  differs: %r' % name)
+
+    for extractor in EXTRACTORS:
+        elapsed, peak = _measure(lambda: [extract(country, contents, extractor=extractor) for country, contents in corpus])
+        print('  %-10s %.3fs total, %.1f KiB peak' % (extractor, elapsed, peak / 1024))
+
+    # how they scale with page size, reading straight from disk the way
+    # get_statuses() does. (mapped pages are page cache, not heap, so they don't
+    # count towards the peak)
+    with tempfile.TemporaryDirectory() as tmp:
+        country = records.CountryStatus('Scaling', url='https://sc.usembassy.gov/', domain='sc.usembassy.gov')
+        for padding in (10, 1000, 10000, 50000):
+            filename = os.path.join(tmp, 'page.html')
+            with open(filename, 'w') as f:
+                f.write(synthetic_page(country.name, padding, padding=padding))
+            size = os.path.getsize(filename)
+            row = list()
+            for extractor in EXTRACTORS:
+                elapsed, peak = _measure(lambda: extract(country, filename=filename, extractor=extractor))
+                row.append('%-9s %7.3fs %9.1f KiB peak' % (extractor, elapsed, peak / 1024))
+            print('  %8.1f KiB page: %s' % (size / 1024, ' | '.join(row)))
+
+
+def bench_resolver(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    corpus = extraction_corpus()
+
+    # what every parse used to pay before extracting: building and compiling its
+    # country's patterns. re.purge() stands in for re's cache, which a run over
+    # every country overflows
+    print('resolver: %d pages, %d rounds' % (len(corpus), args.rounds))
+    resolver = main.CountryResolver()
+    timings = dict()
+    for label, funcs in (('per parse', (main._get_section_title_regex, main._get_b_latest_regex)), ('resolver', (resolver.section_title_regex, resolver.b_latest_regex))):
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for country, _ in corpus:
+                if label == 'per parse':
+                    re.purge()
+                for func in funcs:
+                    func(country)
+        timings[label] = time.perf_counter() - start
+    print('  setup per page: %8.2fus per parse, %6.2fus from the resolver' % (
+        timings['per parse'] / (args.rounds * len(corpus)) * 1e6, timings['resolver'] / (args.rounds * len(corpus)) * 1e6))
+
+    # names as the directory and other lists spell them
+    resolver = main.CountryResolver()
+    variants = set()
+    for name in itertools.chain(main.COUNTRIES, main.COUNTRY_ALIASES):
+        name = name.title()
+        variants.update({name, name.replace(' and ', ' & '), name.replace('Saint ', 'St. '), 'The ' + name, name.upper()})
+    resolved = sum(resolver.abbreviation(name) is not None for name in variants)
+    exact = sum(name.lower() in main.COUNTRIES for name in variants)
+    print('  %d name variants: %d resolved, %d by the exact lookup' % (len(variants), resolved, exact))
+    directory = [country.name for country, _ in corpus if country.abbreviation]
+    if directory:
+        print('  %d directory names: %d resolved, %d by the exact lookup' % (len(directory),
+            sum(resolver.abbreviation(name) is not None for name in directory), sum(name.lower() in main.COUNTRIES for name in directory)))
+
+
+def bench_parse(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    corpus = extraction_corpus()
+    workers = args.workers or os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        countries = list()
+        for i, (country, contents) in enumerate(corpus):
+            filename = os.path.join(tmp, 'country_%d.html' % i)
+            with open(filename, 'w') as f:
+                f.write(contents)
+            country = country.copy()
+            country.filename = filename
+            countries.append(country)
+
+        results = dict()
+        timings = dict()
+        for label, n in (('1 worker', 1), ('%d workers' % workers, workers)):
+            run = [country.copy() for country in countries]
+            start = time.perf_counter()
+            main.parse_countries(run, workers=n, memo=False)
+            timings[label] = time.perf_counter() - start
+            results[label] = [main._get_parse_result(country) for country in run]
+
+    assert len(set(map(repr, results.values()))) == 1, 'parallel parsing changed the results'
+    print('parse: %d pages, %d cores' % (len(countries), os.cpu_count()))
+    for label, elapsed in timings.items():
+        print('  %-12s %.3fs' % (label, elapsed))
+
+
+def bench_records(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    fields = ('classification', 'preformatted', 'test_required', 'quarantine_required', 'last_changed')
+
+    def make_dict(i):
+        country = {'name': 'Country %d' % i, 'abbreviation': 'AA', 'url': 'https://aa.usembassy.gov/', 'domain': 'aa.usembassy.gov', 'filename': 'data/country_%d.html' % i}
+        country.update(dict.fromkeys(fields, i))
+        return country
+
+    def make_record(i):
+        country = records.CountryStatus('Country %d' % i, 'AA', 'https://aa.usembassy.gov/', 'aa.usembassy.gov', 'data/country_%d.html' % i)
+        for field in fields:
+            setattr(country, field, i)
+        return country
+
+    print('records: %d country snapshots' % args.snapshots)
+    for label, make, read in (('dict', make_dict, lambda c: c['classification'] + c['test_required'] + c['quarantine_required']),
+            ('CountryStatus', make_record, lambda c: c.classification + c.test_required + c.quarantine_required)):
+        tracemalloc.start()
+        snapshots = [make(i) for i in range(args.snapshots)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for country in snapshots:
+            read(country)
+        elapsed = time.perf_counter() - start
+        print('  %-14s %7.1f MiB, %5.0f bytes each, %.1fns per 3 field read' % (label, size / 1024 / 1024, size / len(snapshots), elapsed / len(snapshots) * 1e9))
+        del snapshots
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = {'Country %d' % i: records.CountryStatus('Country %d' % i, 'AA', 'https://aa.usembassy.gov/') for i in range(args.countries)}
+        rows = build_history(os.path.join(tmp, 'history.db'), directory, args.years, args.runs_per_day, 'dedup')
+        c = main.database()
+        try:
+            start = time.perf_counter()
+            sql = sorted(main._query_daily_status_counts(c))
+            sql_time = time.perf_counter() - start
+
+            tracemalloc.start()
+            c.execute("SELECT `unixts`, `name`, `classification`, `test_required`, `quarantine_required` FROM `countries` ORDER BY `unixts`")
+            tuples = c.fetchall()
+            tuples_size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del tuples
+
+            start = time.perf_counter()
+            history = records.StatusHistory.load(c)
+            load_time = time.perf_counter() - start
+            start = time.perf_counter()
+            counts = sorted(history.daily_status_counts())
+            counts_time = time.perf_counter() - start
+        finally:
+            c.close()
+            main.close_database()
+            main.CURRENT_DB = main._REG_DB
+
+    assert counts == sql, 'StatusHistory.daily_status_counts() disagrees with sqlite'
+    print('history: %d rows of %d countries over %.1f years' % (rows, args.countries, args.years))
+    print('  list of tuples %7.1f MiB' % (tuples_size / 1024 / 1024))
+    print('  StatusHistory  %7.1f MiB (loaded in %.2fs)' % (history.nbytes() / 1024 / 1024, load_time))
+    print('  daily counts   sqlite %.2fs, StatusHistory %.2fs' % (sql_time, counts_time))
+
+
+def bench_query(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    r = random.Random(args.seed)
+    print('query: %d countries over %.1f years, %d random queries each' % (args.countries, args.years, args.queries))
+    for layout in ('full', 'dedup'):
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = {'Country %d' % i: records.CountryStatus('Country %d' % i, 'AA', 'https://aa.usembassy.gov/') for i in range(args.countries)}
+            rows = build_history(os.path.join(tmp, 'history.db'), directory, args.years, args.runs_per_day, layout)
+            c = main.database()
+            try:
+                c.execute('SELECT MIN(`unixts`), MAX(`unixts`) FROM `countries`')
+                first, last = c.fetchone()
+                windows = [(start, start + args.window * 60*60*24) for start in (r.randint(first, last) for _ in range(args.queries))]
+
+                stages = {
+                    'country_history': _time_each(lambda window: list(query.country_history(c, r.choice(list(directory)), *window)), windows),
+                    'transitions': _time_each(lambda window: list(query.transitions(c, *window)), windows),
+                    'snapshot': _time_each(lambda window: list(query.snapshot(c, window[0])), windows)
+                }
+            finally:
+                c.close()
+                main.close_database()
+                main.CURRENT_DB = main._REG_DB
+
+        print('  %s layout, %d rows, %d day windows' % (layout, rows, args.window))
+        for name, samples in stages.items():
+            stats = percentiles(samples)
+            print('    %-16s p50 %8.3fms  p99 %8.3fms' % (name, stats['p50'] * 1000, stats['p99'] * 1000))
+
+
+def bench_changes(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    r = random.Random(args.seed)
+    space = main._status_space()
+    start = time.perf_counter()
+    main._change_text = None
+    main.get_change_text_table()
+    build = time.perf_counter() - start
+    mismatches = main.validate_change_text()
+    print('changes: table of %d transitions built in %.1fms, %d mismatches against the rules' % (len(space)**2, build * 1000, mismatches))
+
+    pairs = [(r.choice(space), r.choice(space)) for _ in range(args.transitions)]
+    country = records.CountryStatus('Country')
+    for label, render in (('rules', lambda old, new: main._compute_change_text(country, (None, None) + old)),
+            ('table', lambda old, new: main.change_text(country.name, old, new))):
+        start = time.perf_counter()
+        for old, new in pairs:
+            country.classification, country.test_required, country.quarantine_required = new
+            render(old, new)
+        elapsed = time.perf_counter() - start
+        print('  %-6s %8.3fs  %6.2fus per change' % (label, elapsed, elapsed / len(pairs) * 1e6))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = {'Country %d' % i: records.CountryStatus('Country %d' % i, 'AA', 'https://aa.usembassy.gov/') for i in range(args.countries)}
+        rows = build_history(os.path.join(tmp, 'history.db'), directory, args.years, args.runs_per_day, 'dedup')
+        try:
+            start = time.perf_counter()
+            digest = list(main.change_digest())
+            elapsed = time.perf_counter() - start
+        finally:
+            main.close_database()
+            main.CURRENT_DB = main._REG_DB
+    print('  digest of %d rows: %d changes in %.3fs' % (rows, len(digest), elapsed))
+
+
+def bench_db(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = {'Country %d' % i: records.CountryStatus('Country %d' % i, 'AA', 'https://aa.usembassy.gov/') for i in range(args.countries)}
+        build_history(os.path.join(tmp, 'history.db'), directory, args.years, args.runs_per_day, 'dedup')
+        c = main.database()
+        c.execute('SELECT MAX(`unixts`) FROM `countries`')
+        last = c.fetchone()[0]
+        c.close()
+
+        def read(samples, errors, stop):
+            # what an api or analytics job does: read-only snapshots and the histogram
+            c = main.database(read_only=True)
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    list(query.snapshot(c, last))
+                    main.get_changes()
+                except main.db.sqlite3.OperationalError as e:
+                    errors.append(e)
+                samples.append(time.perf_counter() - start)
+
+        def write(stop):
+            # refresh-sized transactions, back to back, like a daemon that never rests
+            c = main.database()
+            newest = None
+            unixts = last
+            while not stop.is_set():
+                unixts += 60
+                rows = [(unixts, 'AA', name, 'https://aa.usembassy.gov/', 5, 'Yes', 0, 0, None) for name in directory]
+                newest = main._insert_dedup_rows(c, rows, newest)
+                main._refresh_daily_status_counts(c, unixts)
+                main.commit()
+
+        results = dict()
+        try:
+            for label, writers in (('idle', 0), ('while writing', 1)):
+                stop = threading.Event()
+                samples, errors = list(), list()
+                threads = [threading.Thread(target=read, args=(samples, errors, stop)) for _ in range(args.readers)]
+                threads += [threading.Thread(target=write, args=(stop,)) for _ in range(writers)]
+                for thread in threads:
+                    thread.start()
+                time.sleep(args.seconds)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+                results[label] = (percentiles(samples), len(errors))
+        finally:
+            main.close_database()
+
+    print('db: %d reader threads, %.0fs each, snapshot + get_changes per read' % (args.readers, args.seconds))
+    for label, (stats, errors) in results.items():
+        print('  %-14s %6d reads  p50 %7.2fms  p99 %7.2fms  %d lock errors' % (label, stats['count'], stats['p50'] * 1000, stats['p99'] * 1000, errors))
+
+
+class FakeTwitterHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # class level, shared by every request: posted statuses and a request counter
+    statuses = list()
+    requests = [0]
+    rate_limit_every = 0
+    fail_every = 0
+
+    def _reply(self, status, body, headers=dict()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        self.requests[0] += 1
+        n = self.requests[0]
+        if not self.path.startswith('/1.1/statuses/update.json') or 'OAuth ' not in self.headers.get('Authorization', ''):
+            return self._reply(401, {'errors': [{'code': 32, 'message': 'Could not authenticate you.'}]})
+        if self.rate_limit_every and n % self.rate_limit_every == 0:
+            return self._reply(429, {'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}, {'x-rate-limit-reset': str(int(time.time()) + 1)})
+        if self.fail_every and n % self.fail_every == 0:
+            return self._reply(503, {'errors': [{'code': 130, 'message': 'Over capacity'}]})
+
+        status = body['status'][0]
+        if status in self.statuses:
+            return self._reply(403, {'errors': [{'code': 187, 'message': 'Status is a duplicate.'}]})
+        self.statuses.append(status)
+        self._reply(200, {'id': len(self.statuses), 'text': status})
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_tweets(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    handler = type('FakeTwitterHandler', (FakeTwitterHandler,), {'statuses': list(), 'requests': [0], 'rate_limit_every': args.rate_limit_every, 'fail_every': args.fail_every})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = {key: 'benchmark' for key in tweets.CREDENTIALS}
+    config['twitter-api-url'] = 'http://127.0.0.1:%d' % server.server_address[1]
+    tweets.RETRY_DELAY = 0
+
+    texts = ['Country %d is now open to U.S. citizens.' % i for i in range(args.tweets)]
+    # one text twitter already has, and every text queued twice by the scraper
+    handler.statuses.append(texts[0])
+    with tempfile.TemporaryDirectory() as tmp:
+        main.CURRENT_DB = os.path.join(tmp, 'history.db')
+        try:
+            c = main.database()
+            start = time.perf_counter()
+            queued = tweets.enqueue(c, texts) + tweets.enqueue(c, texts)
+            main.commit()
+            enqueue_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            sent = tweets.dispatch(main.CURRENT_DB, tweets.TwitterClient(config), tweets.TokenBucket(args.burst, args.interval), drain=True)
+            dispatch_time = time.perf_counter() - start
+
+            c.execute('SELECT `state`, COUNT(*), SUM(`attempts`) FROM `tweet_outbox` GROUP BY `state`')
+            states = {state: (count, attempts) for state, count, attempts in c.fetchall()}
+            c.close()
+        finally:
+            main.close_database()
+            main.CURRENT_DB = main._REG_DB
+    server.shutdown()
+
+    assert queued == len(texts), 'dedup let %d repeated tweets through' % (queued - len(texts))
+    assert sorted(handler.statuses) == sorted(texts), 'fake twitter did not end up with every tweet exactly once'
+    assert sent == len(texts) - 1 and set(states) <= {'sent', 'duplicate'}, states
+    expected = (len(texts) - args.burst) * args.interval
+    print('tweets: %d queued (%d repeats dropped), %d requests to the fake endpoint' % (queued, len(texts), handler.requests[0]))
+    print('  enqueue   %8.3fs (all the scraper waits for)' % enqueue_time)
+    print('  dispatch  %8.3fs (bucket of %d, one per %.2fs: at least %.2fs)' % (dispatch_time, args.burst, args.interval, max(expected, 0)))
+    for state, (count, attempts) in sorted(states.items()):
+        print('  %-9s %5d tweets, %d attempts' % (state, count, attempts))
+
+
+def _synthetic_statuses(count, days, seed=1337):
+    rng = random.Random(seed)
+    statuses = list()
+    for i in range(count):
+        country = records.CountryStatus('Country %d' % i, 'A%d' % i, 'https://aa.usembassy.gov/')
+        country.classification = rng.randrange(6)
+        country.preformatted = ['Are U.S. citizens permitted to enter? %d' % i]
+        country.test_required = rng.randrange(3)
+        country.quarantine_required = rng.randrange(3)
+        country.last_changed = 1600000000 + rng.randrange(10**7)
+        statuses.append(country.to_dict())
+    changes = dict()
+    for day in range(days):
+        date = time.strftime('%m/%d/%Y', time.gmtime(1600000000 + day * 60*60*24))
+        changes[date] = {
+            'classification': {value: rng.randrange(count) for value in range(6)},
+            'quarantine_required': {value: rng.randrange(count) for value in range(3)}
+        }
+    return statuses, changes
+
+
+def bench_api(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    statuses, changes = _synthetic_statuses(args.countries, args.days)
+    server = api.start('127.0.0.1', 0)
+    host, port = server.server_address[:2]
+    start = time.perf_counter()
+    api.update(statuses, changes)
+    refresh = time.perf_counter() - start
+    blob = len(json.dumps({'countries': statuses, 'changes': changes}, separators=(',', ':')))
+
+    # (label, path, conditional, gzip)
+    slug = publish.slugify(statuses[0]['name'])
+    cases = (
+        ('countries', '/api/countries', False, False),
+        ('countries gzip', '/api/countries', False, True),
+        ('countries 304', '/api/countries', True, True),
+        ('one country', '/api/countries/' + slug, False, True),
+        ('one country 304', '/api/countries/' + slug, True, True),
+        ('open, no test', '/api/countries?classification=5&test_required=%d' % main.TEST_REQUIRED_NO, False, True),
+        ('changes gzip', '/api/changes', False, True),
+        ('changes 304', '/api/changes', True, True)
+    )
+
+    def get(conn, path, etag=None, use_gzip=False):
+        headers = {'Accept-Encoding': 'gzip'} if use_gzip else {}
+        if etag:
+            headers['If-None-Match'] = etag
+        conn.request('GET', path, headers=headers)
+        r = conn.getresponse()
+        return r.status, r.getheader('ETag'), r.getheader('Content-Encoding'), r.read()
+
+    # sanity: gzip decodes to the plain body, and a matching etag gets a 304
+    conn = http.client.HTTPConnection(host, port)
+    _, etag, _, plain = get(conn, '/api/countries')
+    status, gzip_etag, encoding, body = get(conn, '/api/countries', use_gzip=True)
+    assert encoding == 'gzip' and gzip.decompress(body) == plain and json.loads(plain) == statuses
+    assert get(conn, '/api/countries', etag)[0] == 304 and get(conn, '/api/countries', gzip_etag, True)[0] == 304
+    assert get(conn, '/api/countries', etag, True)[0] == 200 # another representation, another etag
+    conn.close()
+
+    print('api: %d countries, %d days of changes; snapshot refresh %.1fms; full data.json %d bytes' % (args.countries, args.days, refresh * 1000, blob))
+    for label, path, conditional, use_gzip in cases:
+        conn = http.client.HTTPConnection(host, port)
+        etag = get(conn, path, use_gzip=use_gzip)[1] if conditional else None
+        samples = list()
+        sizes = list()
+        lock = threading.Lock()
+
+        def client():
+            conn = http.client.HTTPConnection(host, port)
+            for _ in range(args.requests // args.clients):
+                start = time.perf_counter()
+                status, _, _, body = get(conn, path, etag, use_gzip)
+                elapsed = time.perf_counter() - start
+                assert status == (304 if conditional else 200), status
+                with lock:
+                    samples.append(elapsed)
+                    sizes.append(len(body))
+            conn.close()
+
+        threads = [threading.Thread(target=client) for _ in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        stats = percentiles(samples)
+        print('  %-16s %7.0f req/s  p50 %6.2fms  p99 %6.2fms  %7d bytes/response' % (label, len(samples) / wall, stats['p50'] * 1000, stats['p99'] * 1000, sum(sizes) // len(sizes)))
+        conn.close()
+    server.shutdown()
+
+
+def _disk_usage(paths):
+    # (bytes on disk, inodes) of files and directory trees
+    used, inodes = 0, 0
+    for path in paths:
+        for root, dirs, names in os.walk(path) if os.path.isdir(path) else [(os.path.dirname(path), [], [os.path.basename(path)])]:
+            for name in names + dirs:
+                used += os.lstat(os.path.join(root, name)).st_blocks * 512
+                inodes += 1
+    return used, inodes
+
+
+def bench_pack(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    r = random.Random(args.seed)
+    countries = [records.CountryStatus('Country %d' % i, url='https://c%d.usembassy.gov/' % i, domain='c%d.usembassy.gov' % i) for i in range(args.countries)]
+    urls = [(country, url) for country in countries for url in (country.url + 'covid-19-information/', country.url + 'u-s-citizen-services/covid-19-information/', country.url + 'news/')]
+    revisions = {url: 0 for _, url in urls}
+    step = 60 * 60 * 24 // args.runs_per_day
+    start = int(time.time()) - args.runs * step
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = os.path.join(tmp, 'files')
+        os.mkdir(files)
+        store = pack.PackStore(os.path.join(tmp, 'pack'))
+        fetches = 0
+        elapsed = 0.0
+        for run in range(args.runs):
+            for country, url in urls:
+                if r.random() < args.change_rate:
+                    revisions[url] += 1
+                page = synthetic_page(country.name, revisions[url] * 1000 + hash(url) % 1000, padding=args.padding).encode()
+                # the flat cache keeping every version would need a file per changed fetch
+                filename = os.path.join(files, 'country_%s_%s_%d.html' % (main.normalize_country_filename(country.name), hashlib.sha256(url.encode()).hexdigest(), revisions[url]))
+                if not os.path.exists(filename):
+                    with open(filename, 'wb') as f:
+                        f.write(page)
+                t = time.perf_counter()
+                store.put(url, page, start + run * step)
+                elapsed += time.perf_counter() - t
+                fetches += 1
+
+        stats = store.stats()
+        # what the index settles at once the WAL is folded back in (as on close)
+        store.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        flat_used, flat_inodes = _disk_usage([files])
+        pack_used, pack_inodes = _disk_usage([store.directory])
+        print('pack: %d urls, %d fetches over %d runs, %d distinct pages (%.1f MiB raw)' % (len(urls), fetches, args.runs, stats['blobs'], stats['unique_bytes'] / 1024 / 1024))
+        print('  put        %8.3fms per fetch' % (elapsed / fetches * 1000))
+        print('  files      %8.1f MiB on disk, %6d inodes (one file per version)' % (flat_used / 1024 / 1024, flat_inodes))
+        print('  pack       %8.1f MiB on disk, %6d inodes (%d segments + index)' % (pack_used / 1024 / 1024, pack_inodes, stats['segments']))
+
+        # random access to historical snapshots
+        picks = [(r.choice(urls)[1], start + r.randrange(args.runs) * step) for _ in range(args.reads)]
+        samples = _time_each(lambda pick: store.get(store.latest(*pick)[1]), picks)
+        p = percentiles(samples)
+        print('  read       p50 %6.3fms  p99 %6.3fms (page as of a random time)' % (p['p50'] * 1000, p['p99'] * 1000))
+
+        t = time.perf_counter()
+        before, after = store.compact()
+        print('  compact    %8.3fs, %d -> %d bytes, %d bad blobs after' % (time.perf_counter() - t, before, after, len(store.verify())))
+        store.close()
+
+
+# modules importing main must not pull in, see the top of main.py
+LAZY_MODULES = ('requests', 'tweepy', 'yaml', 'colorlog', 'sitemap', 'render', 'api', 'http.server')
+
+_STARTUP_PROBE = """
+import json, logging, os, sys
+before = set(os.listdir('.'))
+import main
+print(json.dumps({
+    'loaded': [name for name in %r if name in sys.modules],
+    'handlers': len(logging.getLogger('').handlers),
+    'files': sorted(set(os.listdir('.')) - before)
+}))
+"""
+
+
+def _import_times(stderr):
+    # "import time: self [us] | cumulative | imported package" lines
+    times = list()
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)', line)
+        if match:
+            times.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3))))
+    return times
+
+
+def bench_render(args):
+    import render
+
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    statuses, changes = _synthetic_statuses(args.countries, args.days)
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'index.template.html')
+        index = os.path.join(tmp, 'index.html')
+        shutil.copyfile(render.INDEX_TEMPLATE, template)
+        with open(template, 'rb') as f:
+            template_size = len(gzip.compress(f.read(), 9, mtime=0))
+        pages = os.path.join(tmp, 'countries')
+        state = os.path.join(tmp, 'render-state.json')
+
+        def run(statuses):
+            start = time.perf_counter()
+            written = render.render_pages(statuses, pages, state)
+            written += render.render_index(statuses, template, index)
+            return written, time.perf_counter() - start
+
+        print('render: %d countries' % len(statuses))
+        written, elapsed = run(statuses)
+        print('  first render       %8.2fms, %d files written' % (elapsed * 1000, written))
+        written, elapsed = run(statuses)
+        print('  unchanged data     %8.2fms, %d files written' % (elapsed * 1000, written))
+        statuses[0] = dict(statuses[0], classification=(statuses[0]['classification'] + 1) % 6)
+        written, elapsed = run(statuses)
+        print('  one country moved  %8.2fms, %d files written' % (elapsed * 1000, written))
+
+        # what a browser downloads before the table shows: the page and all of
+        # data.json before, the page alone now (gzipped, as compress.py serves them)
+        with open(index, 'rb') as f:
+            index_size = len(gzip.compress(f.read(), 9, mtime=0))
+        data_size = len(gzip.compress(json.dumps({'time': 0, 'countries': statuses, 'changes': changes}, separators=(',', ':')).encode(), 9, mtime=0))
+        print('  bytes before the table shows: %.1f KiB (template and data.json) -> %.1f KiB (rendered index.html)' % (
+            (template_size + data_size) / 1024, index_size / 1024))
+
+
+def bench_startup(args):
+    root = os.path.dirname(os.path.abspath(main.__file__))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    cumulative = list()
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(args.repeat):
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _STARTUP_PROBE % (LAZY_MODULES,)], cwd=tmp, env=env, capture_output=True, text=True, check=True)
+            times = _import_times(proc.stderr)
+            cumulative.append(next(total for name, _, total, depth in times if name == 'main' and depth == 0))
+            probe = json.loads(proc.stdout)
+
+    # the slowest modules main itself brought in, from the last run
+    # (children are reported before the module that imported them)
+    own = list()
+    end = next(i for i, (name, _, _, depth) in enumerate(times) if name == 'main' and depth == 0)
+    for name, _, total, depth in reversed(times[:end]):
+        if depth == 0:
+            break
+        if depth == 2:
+            own.append((total, name))
+
+    best = min(cumulative) / 1000
+    print('startup: import main takes %.1fms (best of %d, budget %.1fms)' % (best, args.repeat, args.budget))
+    for total, name in sorted(own, reverse=True)[:args.top]:
+        print('  %-30s %7.1fms' % (name, total / 1000))
+
+    failures = list()
+    if best > args.budget:
+        failures.append('import main took %.1fms, over the %.1fms budget' % (best, args.budget))
+    if probe['loaded']:
+        failures.append('import main loaded %s' % ', '.join(probe['loaded']))
+    if probe['handlers']:
+        failures.append('import main installed %d logging handlers' % probe['handlers'])
+    if probe['files']:
+        failures.append('import main created %s' % ', '.join(probe['files']))
+    for failure in failures:
+        print('  FAIL: %s' % failure)
+    sys.exit(1 if failures else 0)
+
+
+# offline suite: the whole pipeline against a frozen snapshot of data/ (see
+# "record") and a synthetic history.db years deep, with latency percentiles per
+# stage. every run is stored in the results file under the current commit, so
+# "--compare <commit>" can flag what got slower
+
+def _git_revision():
+    root = os.path.dirname(os.path.abspath(main.__file__))
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return revision + ('-dirty' if dirty else '')
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    total = sum(samples)
+
+    def rank(p):
+        return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+    return {
+        'count': len(samples),
+        'total': total,
+        'throughput': len(samples) / total if total else 0.0,
+        'p50': rank(50),
+        'p90': rank(90),
+        'p99': rank(99),
+        'max': samples[-1]
+    }
+
+
+def _time_each(func, items):
+    samples = list()
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _offline_http_get(url, headers=None):
+    raise OSError('benchmarks run offline, %r is missing from the corpus' % url)
+
+
+def record_corpus(args):
+    # copies the page cache (directory, country pages, followed pages and their
+    # cache metadata) into a corpus directory that "suite --corpus" replays
+    filenames = sorted(glob.glob('data/*.html')) + [main.CACHE_META_FILENAME]
+    filenames = [filename for filename in filenames if os.path.exists(filename)]
+    try:
+        main.read_cached_page(main.DIRECTORY_URL, main.DIRECTORY_FILENAME)
+    except FileNotFoundError:
+        raise SystemExit('No cached directory page to record, run main.py once first')
+
+    os.makedirs(args.corpus, exist_ok=True)
+    if os.path.isdir(pack.PACK_DIR):
+        # the pack store, with the followed pages and every older version
+        shutil.copytree(pack.PACK_DIR, os.path.join(args.corpus, 'pack'), dirs_exist_ok=True, ignore=shutil.ignore_patterns('.lock'))
+        filenames += [os.path.join(root, name) for root, _, names in os.walk(pack.PACK_DIR) for name in names if name != '.lock']
+    digests = dict()
+    for filename in filenames:
+        name = os.path.relpath(filename, 'data')
+        if not name.startswith('pack'):
+            shutil.copyfile(filename, os.path.join(args.corpus, name))
+        with open(filename, 'rb') as f:
+            digests[name] = hashlib.sha256(f.read()).hexdigest()
+    with open(os.path.join(args.corpus, 'corpus.json'), 'w') as f:
+        f.write(json.dumps({'time': int(time.time()), 'files': digests}, indent=1, sort_keys=True))
+    print('record: %d files into %r' % (len(filenames), args.corpus))
+
+
+def _corpus_digest(directory):
+    h = hashlib.sha256()
+    filenames = [os.path.relpath(os.path.join(root, name), directory) for root, _, names in os.walk(directory) for name in names]
+    for filename in sorted(filenames):
+        with open(os.path.join(directory, filename), 'rb') as f:
+            h.update(filename.encode() + b'\0' + hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:16]
+
+
+def synthetic_directory(count):
+    rows = list()
+    for i in range(count):
+        code = chr(ord('a') + i // 26 % 26) + chr(ord('a') + i % 26)
+        rows.append('</tr><tr><td><a href="https://%s.usembassy.gov/covid-19-information/">Country %d</a></td>' % (code, i))
+    return '<html><body><table><tr><th>Country</th>%s</tr></table></body></html>' % ''.join(rows)
+
+
+# fills ./data with the recorded corpus, or a synthetic directory and pages
+def _prepare_corpus(corpus, countries):
+    os.mkdir('data')
+    if corpus:
+        for filename in os.listdir(corpus):
+            if filename == 'pack':
+                shutil.copytree(os.path.join(corpus, filename), os.path.join('data', filename))
+            elif filename != 'corpus.json':
+                shutil.copyfile(os.path.join(corpus, filename), os.path.join('data', filename))
+        return _corpus_digest('data')
+
+    with open('data/directory.html', 'w') as f:
+        f.write(synthetic_directory(countries))
+    for i, country in enumerate(main.parse_directory(fetch=False).values()):
+        with open(country.filename, 'w') as f:
+            f.write(synthetic_page(country.name, i, padding=i % 50 * 10))
+    return 'synthetic-%d' % countries
+
+
+# a history.db with a run every 24/runs_per_day hours for years, ending before
+# now, in which every country changes status a few times a year
+def build_history(filename, directory, years, runs_per_day, layout, seed=1337):
+    r = random.Random(seed)
+    main.CONFIG['storage'] = layout
+    main.CURRENT_DB = filename
+    c = main.database()
+
+    step = 60 * 60 * 24 // runs_per_day
+    runs = int(years * 365 * runs_per_day)
+    end = int(time.time()) - step
+    start = end - runs * step
+    states = {name: (r.choice([0, 2, 5]), r.choice([0, 1, 2]), r.choice([0, 1, 2])) for name in directory}
+
+    newest = dict()
+    for run in range(runs):
+        unixts = start + run * step
+        rows = list()
+        for name, country in directory.items():
+            if r.random() < 0.002:
+                states[name] = (r.choice([0, 1, 2, 3, 4, 5]), r.choice([0, 1, 2]), r.choice([0, 1, 2]))
+            classification, test_required, quarantine_required = states[name]
+            preformatted = '%s\n%s' % (main.ANSWERS[classification], 'Entry rules for %s, revision %d.' % (name, classification * 9 + test_required * 3 + quarantine_required))
+            rows.append((unixts, country.abbreviation, name, country.url, classification, preformatted, test_required, quarantine_required, None))
+
+        if layout == 'full':
+            c.executemany("INSERT INTO `countries` (`unixts`, `abbreviation`, `name`, `url`, `classification`, `preformatted`, `test_required`, `quarantine_required`, `last_changed`) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        else:
+            newest = main._insert_dedup_rows(c, rows, newest)
+
+    main._rebuild_latest_status(c)
+    main.rebuild_daily_status_counts(c)
+    main.commit()
+    c.close()
+    return runs * len(directory)
+
+
+def _stage_timer(name):
+    return [timer['seconds'] for timer in metrics.to_json()['timers'] if timer['name'] == 'stage' and timer.get('stage') == name]
+
+
+def bench_suite(args):
+    logging.getLogger('').setLevel(logging.CRITICAL)
+    corpus = os.path.abspath(args.corpus) if args.corpus else None
+    results_filename = os.path.abspath(args.results)
+    cwd = os.getcwd()
+
+    # nothing may reach the network, and every recorded page counts as fresh
+    main._http_get = _offline_http_get
+    main.CONFIG['refresh-interval'] = 10**10
+    main.CONFIG['refresh-intervals'] = dict()
+    main._cache_meta = None
+
+    stages = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            corpus_id = _prepare_corpus(corpus, args.countries)
+            directory = main.parse_directory(fetch=False)
+
+            stages['parse_directory'] = _time_each(lambda _: main.parse_directory(fetch=False), range(args.repeat))
+
+            countries = [country for country in directory.values() if os.path.exists(country.filename)]
+            stages['parse_country_contents'] = _time_each(lambda country: main.parse_country_contents(country.copy(), filename=country.filename), countries * args.repeat)
+
+            answers = classifier_corpus(args.answers)
+            stages['_parse_answer'] = _time_each(main._parse_answer, answers)
+            stages['_parse_covid_test_answer'] = _time_each(lambda answer: main._parse_covid_test_answer('Is a negative COVID-19 test required for entry?', answer), answers)
+            stages['_parse_quarantine_required_answer'] = _time_each(main._parse_quarantine_required_answer, answers)
+
+            start = time.perf_counter()
+            rows = build_history('history.db', directory, args.years, args.runs_per_day, args.layout)
+            print('suite: %d pages, %d answers, %s history of %d rows built in %.1fs (%.1f MiB)' % (
+                len(countries), len(answers), args.layout, rows, time.perf_counter() - start, os.path.getsize('history.db') / 1024 / 1024))
+
+            # whole runs against the deep history: parsing (memoized after the
+            # first run), change detection and the db writes
+            parse_directory = main.parse_directory
+            main.parse_directory = lambda fetch=True: parse_directory(fetch=False)
+            try:
+                get_statuses, db_write = list(), list()
+                for _ in range(args.repeat):
+                    metrics.reset()
+                    # get_statuses() prints every changed country
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        get_statuses += _time_each(lambda _: main.get_statuses(parse_workers=1), [None])
+                    db_write += _stage_timer('db_write')
+                    main.TWEET_MSGS.clear()
+                stages['get_statuses'] = get_statuses
+                stages['get_statuses.db_write'] = db_write
+            finally:
+                main.parse_directory = parse_directory
+
+            stages['get_changes'] = _time_each(lambda _: main.get_changes(), range(args.repeat))
+            # what a rollup rebuild (or any query over all of history) costs as it grows
+            c = main.database()
+            stages['history_scan'] = _time_each(lambda _: main._query_daily_status_counts(c), range(max(1, args.repeat // 5)))
+            c.close()
+        finally:
+            os.chdir(cwd)
+            main.close_database()
+            main.CURRENT_DB = main._REG_DB
+
+    report = {name: percentiles(samples) for name, samples in stages.items()}
+    print('  %-36s %7s %10s %9s %9s %9s %9s' % ('stage', 'n', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for name, stats in report.items():
+        print('  %-36s %7d %10.1f %9.3f %9.3f %9.3f %9.3f' % (name, stats['count'], stats['throughput'], stats['p50'] * 1000, stats['p90'] * 1000, stats['p99'] * 1000, stats['max'] * 1000))
+
+    try:
+        with open(results_filename, 'r') as f:
+            results = json.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        results = dict()
+
+    inputs = {
+        'corpus': corpus_id,
+        'years': args.years,
+        'runs_per_day': args.runs_per_day,
+        'layout': args.layout,
+        'python': platform.python_version()
+    }
+    revision = _git_revision()
+    results[revision] = {'time': int(time.time()), 'inputs': inputs, 'stages': report}
+    publish.write_atomic(results_filename, json.dumps(results, indent=1, sort_keys=True).encode())
+    print('  saved as %r in %r' % (revision, args.results))
+
+    if args.compare:
+        sys.exit(compare_results(results, args.compare, revision, args.threshold))
+
+
+# prints the p50 change of every stage against another stored run, returning 1
+# if anything is more than threshold percent slower
+def compare_results(results, baseline, revision, threshold):
+    matches = [key for key in results if key.startswith(baseline) and key != revision]
+    if len(matches) != 1:
+        print('compare: %d stored runs match %r (have %s)' % (len(matches), baseline, ', '.join(sorted(results))))
+        return 1
+
+    old, new = results[matches[0]], results[revision]
+    if old['inputs'] != new['inputs']:
+        print('compare: warning, inputs differ: %r -> %r' % (old['inputs'], new['inputs']))
+
+    regressed = False
+    print('compare: %s -> %s (p50, slower than +%d%% is flagged)' % (matches[0], revision, threshold))
+    for name, stats in new['stages'].items():
+        if name not in old['stages']:
+            print('  %-36s new' % name)
+            continue
+        before, after = old['stages'][name]['p50'], stats['p50']
+        change = (after - before) / before * 100 if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  <-- slower'
+            regressed = True
+        print('  %-36s %9.3f -> %9.3f ms %+7.1f%%%s' % (name, before * 1000, after * 1000, change, flag))
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the scraper pipeline')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    p = subparsers.add_parser('fetch', help='fetch stage against local stub embassy servers')
+    p.add_argument('--countries', type=int, default=40)
+    p.add_argument('--hosts', type=int, default=20)
+    p.add_argument('--delay', type=float, default=0.05)
+    p.set_defaults(func=bench_fetch)
+
+    p = subparsers.add_parser('classify', help='answer classifiers against the legacy ones')
+    p.add_argument('--size', type=int, default=5000)
+    p.add_argument('--iterations', type=int, default=50000)
+    p.set_defaults(func=bench_classify)
+
+    p = subparsers.add_parser('extract', help='the page extractor against the regex and streaming reference extractors')
+    p.set_defaults(func=bench_extract)
+
+    p = subparsers.add_parser('resolver', help='per-country patterns and name lookups from CountryResolver against building them per parse')
+    p.add_argument('--rounds', type=int, default=20)
+    p.set_defaults(func=bench_resolver)
+
+    p = subparsers.add_parser('parse', help='country page parsing in one process against a process pool')
+    p.add_argument('--workers', type=int, default=0, help='pool size (default: every core)')
+    p.set_defaults(func=bench_parse)
+
+    p = subparsers.add_parser('records', help='CountryStatus and StatusHistory against dicts and tuples')
+    p.add_argument('--snapshots', type=int, default=100000)
+    p.add_argument('--countries', type=int, default=200)
+    p.add_argument('--years', type=float, default=1)
+    p.add_argument('--runs-per-day', type=int, default=4)
+    p.set_defaults(func=bench_records)
+
+    p = subparsers.add_parser('query', help='history range queries as history grows')
+    p.add_argument('--countries', type=int, default=200)
+    p.add_argument('--years', type=float, default=2)
+    p.add_argument('--runs-per-day', type=int, default=4)
+    p.add_argument('--window', type=int, default=7, help='days per query')
+    p.add_argument('--queries', type=int, default=50)
+    p.add_argument('--seed', type=int, default=1337)
+    p.set_defaults(func=bench_query)
+
+    p = subparsers.add_parser('changes', help='change texts from the precomputed table against the rules, and a digest over a history')
+    p.add_argument('--transitions', type=int, default=200000)
+    p.add_argument('--countries', type=int, default=200)
+    p.add_argument('--years', type=float, default=2)
+    p.add_argument('--runs-per-day', type=int, default=4)
+    p.add_argument('--seed', type=int, default=1337)
+    p.set_defaults(func=bench_changes)
+
+    p = subparsers.add_parser('db', help='read-only readers while a writer commits, over WAL')
+    p.add_argument('--countries', type=int, default=200)
+    p.add_argument('--years', type=float, default=1)
+    p.add_argument('--runs-per-day', type=int, default=4)
+    p.add_argument('--readers', type=int, default=4)
+    p.add_argument('--seconds', type=float, default=3)
+    p.set_defaults(func=bench_db)
+
+    p = subparsers.add_parser('tweets', help='tweet outbox dispatcher against a local fake twitter endpoint')
+    p.add_argument('--tweets', type=int, default=50)
+    p.add_argument('--burst', type=int, default=5)
+    p.add_argument('--interval', type=float, default=0.02, help='seconds per tweet once the burst is used up')
+    p.add_argument('--rate-limit-every', type=int, default=20, help='answer every Nth request with a 429')
+    p.add_argument('--fail-every', type=int, default=7, help='answer every Nth request with a 503')
+    p.set_defaults(func=bench_tweets)
+
+    p = subparsers.add_parser('pack', help='the pack page store against a file per page version')
+    p.add_argument('--countries', type=int, default=200)
+    p.add_argument('--runs', type=int, default=120)
+    p.add_argument('--runs-per-day', type=int, default=4)
+    p.add_argument('--change-rate', type=float, default=0.05, help='chance a page changed since the last run')
+    p.add_argument('--padding', type=int, default=200, help='filler paragraphs per page')
+    p.add_argument('--reads', type=int, default=500)
+    p.add_argument('--seed', type=int, default=1337)
+    p.set_defaults(func=bench_pack)
+
+    p = subparsers.add_parser('api', help='polling the local JSON API: full, gzipped, conditional and filtered requests')
+    p.add_argument('--countries', type=int, default=200)
+    p.add_argument('--days', type=int, default=365)
+    p.add_argument('--clients', type=int, default=4)
+    p.add_argument('--requests', type=int, default=2000, help='per case, split across the clients')
+    p.set_defaults(func=bench_api)
+
+    p = subparsers.add_parser('render', help='static index table and country pages: first render, unchanged and one-country re-renders')
+    p.add_argument('--countries', type=int, default=200)
+    p.add_argument('--days', type=int, default=365)
+    p.set_defaults(func=bench_render)
+
+    p = subparsers.add_parser('startup', help='time "import main" with -X importtime and check it has no side effects')
+    p.add_argument('--budget', type=float, default=50, help='milliseconds "import main" may take')
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--top', type=int, default=10, help='how many of the slowest imports to list')
+    p.set_defaults(func=bench_startup)
+
+    p = subparsers.add_parser('record', help='snapshot the data/ page cache as a corpus for the suite')
+    p.add_argument('corpus', help='directory to write the corpus to')
+    p.set_defaults(func=record_corpus)
+
+    p = subparsers.add_parser('suite', help='every stage offline against a corpus and a synthetic history, with percentiles')
+    p.add_argument('--corpus', help='directory written by "record" (default: synthetic pages)')
+    p.add_argument('--countries', type=int, default=200, help='synthetic countries without --corpus')
+    p.add_argument('--years', type=float, default=2)
+    p.add_argument('--runs-per-day', type=int, default=4)
+    p.add_argument('--layout', choices=('full', 'dedup'), default='dedup')
+    p.add_argument('--answers', type=int, default=5000)
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--results', default='data/benchmark-results.json', help='runs are stored here by commit')
+    p.add_argument('--compare', metavar='COMMIT', help='compare against the stored run of this commit, exiting 1 on a regression')
+    p.add_argument('--threshold', type=float, default=10, help='percent slower that counts as a regression')
+    p.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    args.func(args)
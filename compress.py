@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+import publish
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_ROOT = 'web'
+COMPRESS_EXTENSIONS = ('.html', '.css', '.js', '.json', '.xml', '.txt', '.svg')
+STATE_FILENAME = 'data/compress-state.json' # source path -> sha256 it was last compressed at
+REPORT_FILENAME = 'data/compression-report.json'
+
+
+def _siblings():
+    return ('.gz', '.br') if brotli else ('.gz',)
+
+
+def _compress(suffix, data):
+    if suffix == '.gz':
+        # mtime=0 keeps the output identical for identical input
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+# writes .gz (and, with the brotli module installed, .br) siblings next to
+# every compressible file under root, at maximum compression, so the web server
+# can serve them as-is. only files whose sha256 moved since the last run are
+# recompressed. returns the size report that is also written to REPORT_FILENAME
+def compress_tree(root=COMPRESS_ROOT):
+    if not brotli:
+        logger.warning('brotli module is not installed, only writing .gz files')
+
+    try:
+        with open(STATE_FILENAME, 'r') as f:
+            state = json.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        state = dict()
+
+    report = dict()
+    new_state = dict()
+    compressed = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if name.endswith(('.gz', '.br')):
+                # drop siblings whose source is gone
+                if not os.path.exists(path[:-3]):
+                    os.unlink(path)
+                continue
+            if not name.endswith(COMPRESS_EXTENSIONS) or name.startswith('.'):
+                continue
+
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            new_state[path] = digest
+
+            sizes = {'size': len(data)}
+            for suffix in _siblings():
+                sibling = path + suffix
+                if state.get(path) != digest or not os.path.exists(sibling):
+                    publish.write_atomic(sibling, _compress(suffix, data))
+                    compressed += 1
+                sizes[suffix.lstrip('.')] = os.path.getsize(sibling)
+            report[path] = sizes
+
+    totals = {key: sum(sizes.get(key, 0) for sizes in report.values()) for key in ('size', 'gz', 'br')}
+    publish.write_atomic(STATE_FILENAME, json.dumps(new_state, separators=(',', ':'), sort_keys=True).encode())
+    publish.write_atomic(REPORT_FILENAME, json.dumps({'totals': totals, 'files': report}, indent=1, sort_keys=True).encode())
+    logger.info('Compressed %d files; %d files, %d bytes -> %d gzip / %d brotli' % (compressed, len(report), totals['size'], totals['gz'], totals['br']))
+    return report
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    compress_tree()
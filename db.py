@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import threading
+import urllib.parse
+
+
+# applied to every connection. WAL lets readers keep reading while a refresh
+# writes; synchronous=NORMAL is still crash safe in WAL mode, it only skips
+# the fsync on every commit
+PRAGMAS = (
+    ('busy_timeout', 30000),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000), # KiB
+    ('temp_store', 'MEMORY'),
+    ('mmap_size', 256 * 1024 * 1024)
+)
+# compiled statements kept per connection, keyed by their sql. everything in
+# main.py uses a fixed set of queries with ? parameters, so they are all reused
+CACHED_STATEMENTS = 256
+
+
+def connect(filename, read_only=False):
+    if read_only:
+        # a uri with mode=ro really opens the file read-only (and fails if it is missing).
+        # (urllib.request.pathname2url would do the same quoting, but is slow to import)
+        conn = sqlite3.connect('file:%s?mode=ro' % urllib.parse.quote(os.path.abspath(filename)),
+            uri=True, detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+        conn.execute('PRAGMA query_only=ON')
+    else:
+        conn = sqlite3.connect(filename, detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+    for key, value in PRAGMAS:
+        conn.execute('PRAGMA %s=%s' % (key, value))
+    return conn
+
+
+# one database file. every thread gets its own read-write and read-only
+# connection, opened on first use and reused after that, so threads never share
+# a connection and readers never wait on the writer. (that is also why
+# check_same_thread can be off: it only lets close() run from any thread.)
+# init(conn) runs once, on the first read-write connection
+class Database:
+    def __init__(self, filename, init=None):
+        self.filename = filename
+        self.init = init
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._connections = list()
+
+    def connection(self, read_only=False):
+        key = 'read_only' if read_only else 'read_write'
+        conn = getattr(self._local, key, None)
+        if conn is None:
+            conn = connect(self.filename, read_only)
+            with self._lock:
+                self._connections.append(conn)
+                if not read_only and not self._initialized:
+                    if self.init:
+                        self.init(conn)
+                    self._initialized = True
+            setattr(self._local, key, conn)
+        return conn
+
+    def cursor(self, read_only=False):
+        return self.connection(read_only).cursor()
+
+    def commit(self) -> None:
+        self.connection().commit()
+
+    # closes every connection of every thread; only call this once nothing uses them
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
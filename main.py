@@ -1,108 +1,391 @@
 #!/usr/bin/env python3
 
-import requests
+# importing this module has no side effects and stays cheap: logging, config.yml
+# and the heavier third party modules (requests, tweepy, yaml, colorlog) are only
+# set up or imported when something needs them. see "benchmark.py startup"
+
 import time
 import os
-import pathlib
 import re
 import sys
 import logging
-import colorlog
 import html.parser
 import io
+import itertools
 import json
+import mmap
 import hashlib
 import datetime
-import sqlite3
+import threading
+import signal
+import socket
+import random
+import urllib.parse
+import unicodedata
+import concurrent.futures
+
+import compress
+import db
+import metrics
+import publish
+import records
+import tweets
+
+logger = logging.getLogger('')
 
-import yaml
-import tweepy
+_logging_set_up = False
 
-import sitemap
 
-logger = logging.getLogger('')
-logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler('countryscrape.log')
-sh = logging.StreamHandler(sys.stdout)
-formatter = logging.Formatter('[%(asctime)s] %(levelname)s[%(filename)s.%(funcName)s:%(lineno)d] %(message)s', datefmt='%a, %d %b %Y %H:%M:%S')
-fh.setFormatter(formatter)
-sh.setFormatter(colorlog.ColoredFormatter('%(log_color)s[%(asctime)s] %(levelname)s [%(filename)s.%(funcName)s:%(lineno)d] %(message)s', datefmt='%a, %d %b %Y %H:%M:%S'))
-logger.addHandler(fh)
-logger.addHandler(sh)
+# the log file and colored stdout handlers, installed once by whatever runs the scraper
+def setup_logging(filename='countryscrape.log') -> None:
+    global _logging_set_up
+    if _logging_set_up:
+        return
+    import colorlog
+
+    logger.setLevel(logging.DEBUG)
+    fh = logging.FileHandler(filename)
+    sh = logging.StreamHandler(sys.stdout)
+    formatter = logging.Formatter('[%(asctime)s] %(levelname)s[%(filename)s.%(funcName)s:%(lineno)d] %(message)s', datefmt='%a, %d %b %Y %H:%M:%S')
+    fh.setFormatter(formatter)
+    sh.setFormatter(colorlog.ColoredFormatter('%(log_color)s[%(asctime)s] %(levelname)s [%(filename)s.%(funcName)s:%(lineno)d] %(message)s', datefmt='%a, %d %b %Y %H:%M:%S'))
+    logger.addHandler(fh)
+    logger.addHandler(sh)
+    _logging_set_up = True
 
 ######
 
 TWEET_MSGS = list()
 CONFIG = dict()
 
-try:
-    with open('config.yml', 'r') as f:
-        CONFIG = yaml.safe_load(f.read())
-except FileNotFoundError:
-    pass
+
+# reads config.yml into CONFIG (in place, so references to it stay valid)
+def load_config(filename='config.yml') -> dict:
+    import yaml
+
+    try:
+        with open(filename, 'r') as f:
+            CONFIG.update(yaml.safe_load(f.read()) or dict())
+    except FileNotFoundError:
+        pass
+    return CONFIG
 
 ######
 
 
 COUNTRIES = {k.lower(): v.upper() for k, v in {'Afghanistan': 'AF', 'Albania': 'AL', 'Algeria': 'DZ', 'American Samoa': 'AS', 'Andorra': 'AD', 'Angola': 'AO', 'Anguilla': 'AI', 'Antarctica': 'AQ', 'Antigua and Barbuda': 'AG', 'Argentina': 'AR', 'Armenia': 'AM', 'Aruba': 'AW', 'Australia': 'AU', 'Austria': 'AT', 'Azerbaijan': 'AZ', 'Bahamas': 'BS', 'Bahrain': 'BH', 'Bangladesh': 'BD', 'Barbados': 'BB', 'Belarus': 'BY', 'Belgium': 'BE', 'Belize': 'BZ', 'Benin': 'BJ', 'Bermuda': 'BM', 'Bhutan': 'BT', 'Bolivia, Plurinational State of': 'BO', 'Bolivia': 'BO', 'Bosnia and Herzegovina': 'BA', 'Botswana': 'BW', 'Bouvet Island': 'BV', 'Brazil': 'BR', 'British Indian Ocean Territory': 'IO', 'Brunei Darussalam': 'BN', 'Brunei': 'BN', 'Bulgaria': 'BG', 'Burkina Faso': 'BF', 'Burundi': 'BI', 'Cambodia': 'KH', 'Cameroon': 'CM', 'Canada': 'CA', 'Cape Verde': 'CV', 'Cayman Islands': 'KY', 'Central African Republic': 'CF', 'Chad': 'TD', 'Chile': 'CL', 'China': 'CN', 'Christmas Island': 'CX', 'Cocos (Keeling) Islands': 'CC', 'Colombia': 'CO', 'Comoros': 'KM', 'Congo': 'CG', 'Congo, the Democratic Republic of the': 'CD', 'Cook Islands': 'CK', 'Costa Rica': 'CR', "Côte d'Ivoire": 'CI', 'Ivory Coast': 'CI', 'Croatia': 'HR', 'Cuba': 'CU', 'Cyprus': 'CY', 'Czech Republic': 'CZ', 'Denmark': 'DK', 'Djibouti': 'DJ', 'Dominica': 'DM', 'Dominican Republic': 'DO', 'Ecuador': 'EC', 'Egypt': 'EG', 'El Salvador': 'SV', 'Equatorial Guinea': 'GQ', 'Eritrea': 'ER', 'Estonia': 'EE', 'Ethiopia': 'ET', 'Falkland Islands (Malvinas)': 'FK', 'Faroe Islands': 'FO', 'Fiji': 'FJ', 'Finland': 'FI', 'France': 'FR', 'French Guiana': 'GF', 'French Polynesia': 'PF', 'French Southern Territories': 'TF', 'Gabon': 'GA', 'Gambia': 'GM', 'Georgia': 'GE', 'Germany': 'DE', 'Ghana': 'GH', 'Gibraltar': 'GI', 'Greece': 'GR', 'Greenland': 'GL', 'Grenada': 'GD', 'Guadeloupe': 'GP', 'Guam': 'GU', 'Guatemala': 'GT', 'Guernsey': 'GG', 'Guinea': 'GN', 'Guinea-Bissau': 'GW', 'Guyana': 'GY', 'Haiti': 'HT', 'Heard Island and McDonald Islands': 'HM', 'Holy See (Vatican City State)': 'VA', 'Honduras': 'HN', 'Hong Kong': 'HK', 'Hungary': 'HU', 'Iceland': 'IS', 'India': 'IN', 'Indonesia': 'ID', 'Iran, Islamic Republic of': 'IR', 'Iraq': 'IQ', 'Ireland': 'IE', 'Isle of Man': 'IM', 'Israel': 'IL', 'Italy': 'IT', 'Jamaica': 'JM', 'Japan': 'JP', 'Jersey': 'JE', 'Jordan': 'JO', 'Kazakhstan': 'KZ', 'Kenya': 'KE', 'Kiribati': 'KI', "Korea, Democratic People's Republic of": 'KP', 'Korea, Republic of': 'KR', 'South Korea': 'KR', 'Kuwait': 'KW', 'Kyrgyzstan': 'KG', "Lao People's Democratic Republic": 'LA', 'Latvia': 'LV', 'Lebanon': 'LB', 'Lesotho': 'LS', 'Liberia': 'LR', 'Libyan Arab Jamahiriya': 'LY', 'Libya': 'LY', 'Liechtenstein': 'LI', 'Lithuania': 'LT', 'Luxembourg': 'LU', 'Macao': 'MO', 'Macedonia, the former Yugoslav Republic of': 'MK', 'Madagascar': 'MG', 'Malawi': 'MW', 'Malaysia': 'MY', 'Maldives': 'MV', 'Mali': 'ML', 'Malta': 'MT', 'Marshall Islands': 'MH', 'Martinique': 'MQ', 'Mauritania': 'MR', 'Mauritius': 'MU', 'Mayotte': 'YT', 'Mexico': 'MX', 'Micronesia, Federated States of': 'FM', 'Moldova, Republic of': 'MD', 'Monaco': 'MC', 'Mongolia': 'MN', 'Montenegro': 'ME', 'Montserrat': 'MS', 'Morocco': 'MA', 'Mozambique': 'MZ', 'Myanmar': 'MM', 'Burma': 'MM', 'Namibia': 'NA', 'Nauru': 'NR', 'Nepal': 'NP', 'Netherlands': 'NL', 'Netherlands Antilles': 'AN', 'New Caledonia': 'NC', 'New Zealand': 'NZ', 'Nicaragua': 'NI', 'Niger': 'NE', 'Nigeria': 'NG', 'Niue': 'NU', 'Norfolk Island': 'NF', 'Northern Mariana Islands': 'MP', 'Norway': 'NO', 'Oman': 'OM', 'Pakistan': 'PK', 'Palau': 'PW', 'Palestinian Territory, Occupied': 'PS', 'Panama': 'PA', 'Papua New Guinea': 'PG', 'Paraguay': 'PY', 'Peru': 'PE', 'Philippines': 'PH', 'Pitcairn': 'PN', 'Poland': 'PL', 'Portugal': 'PT', 'Puerto Rico': 'PR', 'Qatar': 'QA', 'Réunion': 'RE', 'Romania': 'RO', 'Russian Federation': 'RU', 'Russia': 'RU', 'Rwanda': 'RW', 'Saint Helena, Ascension and Tristan da Cunha': 'SH', 'Saint Kitts and Nevis': 'KN', 'Saint Lucia': 'LC', 'Saint Pierre and Miquelon': 'PM', 'Saint Vincent and the Grenadines': 'VC', 'Saint Vincent & the Grenadines': 'VC', 'St. Vincent and the Grenadines': 'VC', 'Samoa': 'WS', 'San Marino': 'SM', 'Sao Tome and Principe': 'ST', 'Saudi Arabia': 'SA', 'Senegal': 'SN', 'Serbia': 'RS', 'Seychelles': 'SC', 'Sierra Leone': 'SL', 'Singapore': 'SG', 'Slovakia': 'SK', 'Slovenia': 'SI', 'Solomon Islands': 'SB', 'Somalia': 'SO', 'South Africa': 'ZA', 'South Georgia and the South Sandwich Islands': 'GS', 'South Sudan': 'SS', 'Spain': 'ES', 'Sri Lanka': 'LK', 'Sudan': 'SD', 'Suriname': 'SR', 'Svalbard and Jan Mayen': 'SJ', 'Swaziland': 'SZ', 'Sweden': 'SE', 'Switzerland': 'CH', 'Syrian Arab Republic': 'SY', 'Taiwan, Province of China': 'TW', 'Taiwan': 'TW', 'Tajikistan': 'TJ', 'Tanzania, United Republic of': 'TZ', 'Thailand': 'TH', 'Timor-Leste': 'TL', 'Togo': 'TG', 'Tokelau': 'TK', 'Tonga': 'TO', 'Trinidad and Tobago': 'TT', 'Tunisia': 'TN', 'Turkey': 'TR', 'Turkmenistan': 'TM', 'Turks and Caicos Islands': 'TC', 'Tuvalu': 'TV', 'Uganda': 'UG', 'Ukraine': 'UA', 'United Arab Emirates': 'AE', 'United Kingdom': 'GB', 'United States': 'US', 'United States Minor Outlying Islands': 'UM', 'Uruguay': 'UY', 'Uzbekistan': 'UZ', 'Vanuatu': 'VU', 'Venezuela, Bolivarian Republic of': 'VE', 'Venezuela': 'VE', 'Viet Nam': 'VN', 'Vietnam': 'VN', 'Virgin Islands, British': 'VG', 'Virgin Islands, U.S.': 'VI', 'Wallis and Futuna': 'WF', 'Western Sahara': 'EH', 'Yemen': 'YE', 'Zambia': 'ZM', 'Zimbabwe': 'ZW'}.items()}
-
-conns = dict()
+# names the embassy directory uses that COUNTRIES has in no spelling. see CountryResolver
+COUNTRY_ALIASES = {'Cabo Verde': 'CV', 'Czechia': 'CZ', 'Democratic Republic of the Congo': 'CD', 'Republic of the Congo': 'CG', 'Curacao': 'CW', 'East Timor': 'TL', 'Eswatini': 'SZ', 'Holy See': 'VA', 'Vatican': 'VA', 'Iran': 'IR', 'Kosovo': 'XK', 'Laos': 'LA', 'Macau': 'MO', 'Micronesia': 'FM', 'Moldova': 'MD', 'North Korea': 'KP', 'North Macedonia': 'MK', 'Macedonia': 'MK', 'Palestinian Territories': 'PS', 'Sint Maarten': 'SX', 'Syria': 'SY', 'Tanzania': 'TZ', 'Turkiye': 'TR'}
 
 _REG_DB = 'history.db'
 CURRENT_DB = _REG_DB
 
-# get a cursor
-def database(use_file: str=None, read_only: bool=False):
-    global conns, CURRENT_DB
-    _old_current_db = CURRENT_DB
-    if use_file == None:
-        use_file = CURRENT_DB
-    else:
-        CURRENT_DB = use_file
+_databases = dict() # filename -> db.Database
+_databases_lock = threading.Lock()
+
 
-    args = {}
-    if read_only:
-        args['uri'] = True
+def _get_database(use_file=None):
+    use_file = use_file or CURRENT_DB
+    with _databases_lock:
+        if use_file not in _databases:
+            _databases[use_file] = db.Database(use_file, init=_init_database)
+        return _databases[use_file]
 
-    # create the database if not exist
-    if not conns.get(use_file):
-        conns[use_file] = sqlite3.connect(use_file, detect_types=sqlite3.PARSE_DECLTYPES, **args)
-        if not read_only:
-            # none of this would be able to run if it was readonly anyway
-            _init_database(conns[use_file])
 
-    CURRENT_DB = _old_current_db
-    return conns[use_file].cursor()
+# get a cursor on this thread's connection to use_file (CURRENT_DB by default).
+# read_only cursors come from a connection that opened the file read-only
+def database(use_file: str=None, read_only: bool=False):
+    return _get_database(use_file).cursor(read_only)
+
+
+def connection(use_file: str=None):
+    return _get_database(use_file).connection()
 
 
 def commit() -> None:
-    global conns
-    return conns[CURRENT_DB].commit()
+    return _get_database().commit()
+
+
+# closes every connection to use_file (CURRENT_DB by default)
+def close_database(use_file: str=None) -> None:
+    use_file = use_file or CURRENT_DB
+    with _databases_lock:
+        database = _databases.pop(use_file, None)
+    if database:
+        database.close()
 
 
 def _init_database(conn) -> None:
     c = conn.cursor()
+    layout = _get_storage_layout(c) or CONFIG.get('storage', 'dedup')
+    if layout == 'full':
+        c.execute(
+            'CREATE TABLE IF NOT EXISTS `countries` ('
+                '`id` INT AUTO_INCREMENT,'
+                '`unixts` INT NOT NULL,'
+                '`abbreviation` VARCHAR(10) NOT NULL,'
+                '`name` VARCHAR(400) NOT NULL,'
+                '`url` VARCHAR(1000) NOT NULL,'
+                '`classification` INT NOT NULL,'
+                '`preformatted` VARCHAR(20000),'
+                '`test_required` INT NOT NULL,'
+                '`quarantine_required` INT NOT NULL,'
+                '`last_changed` INT,'
+                #'KEY `id` (`id`) USING BTREE,'
+                'PRIMARY KEY (`id`)'
+            ');'
+        )
+
+        c.execute('CREATE INDEX IF NOT EXISTS `countries_name_unixts` ON `countries` (`name`, `unixts`);')
+        c.execute('CREATE INDEX IF NOT EXISTS `countries_unixts` ON `countries` (`unixts`);')
+    else:
+        _init_dedup_tables(c)
+        _create_countries_view(c)
+
+    # the newest row of each country, and the newest row whose status differs
+    # from it, kept up to date by get_statuses() so it never scans history
     c.execute(
-        'CREATE TABLE IF NOT EXISTS `countries` ('
-            '`id` INT AUTO_INCREMENT,'
+        'CREATE TABLE IF NOT EXISTS `latest_status` ('
+            '`name` VARCHAR(400) NOT NULL,'
             '`unixts` INT NOT NULL,'
+            '`classification` INT NOT NULL,'
+            '`test_required` INT NOT NULL,'
+            '`quarantine_required` INT NOT NULL,'
+            '`changed_unixts` INT,'
+            '`changed_classification` INT,'
+            '`changed_test_required` INT,'
+            '`changed_quarantine_required` INT,'
+            'PRIMARY KEY (`name`)'
+        ');'
+    )
+    c.execute('SELECT EXISTS (SELECT 1 FROM `latest_status`), EXISTS (SELECT 1 FROM `countries`)')
+    if c.fetchone() == (0, 1):
+        logger.info('Building latest_status from the countries history...')
+        _rebuild_latest_status(c)
+
+    # get_changes() histogram, one row per (day, kind, value). get_statuses() only
+    # recomputes the current day, see rebuild_daily_status_counts()
+    c.execute(
+        'CREATE TABLE IF NOT EXISTS `daily_status_counts` ('
+            '`day` VARCHAR(10) NOT NULL,'
+            '`kind` VARCHAR(40) NOT NULL,'
+            '`value` INT NOT NULL,'
+            '`count` INT NOT NULL,'
+            'PRIMARY KEY (`day`, `kind`, `value`)'
+        ');'
+    )
+    c.execute('SELECT EXISTS (SELECT 1 FROM `daily_status_counts`), EXISTS (SELECT 1 FROM `countries`)')
+    if c.fetchone() == (0, 1):
+        logger.info('Building daily_status_counts from the countries history...')
+        c.executemany("INSERT INTO `daily_status_counts` (`day`, `kind`, `value`, `count`) VALUES (?, ?, ?, ?)", _query_daily_status_counts(c))
+
+    # tweets waiting to go out, drained by tweets.dispatch()
+    c.execute(
+        'CREATE TABLE IF NOT EXISTS `tweet_outbox` ('
+            '`id` INTEGER PRIMARY KEY,'
+            '`text` VARCHAR(280) NOT NULL,'
+            '`digest` VARCHAR(64) NOT NULL,'
+            '`queued_unixts` INT NOT NULL,'
+            '`attempts` INT NOT NULL,'
+            '`next_attempt_unixts` INT NOT NULL,'
+            '`sent_unixts` INT,'
+            '`state` VARCHAR(10) NOT NULL,'
+            '`error` VARCHAR(1000)'
+        ');'
+    )
+    c.execute('CREATE INDEX IF NOT EXISTS `tweet_outbox_state` ON `tweet_outbox` (`state`, `next_attempt_unixts`);')
+    c.execute('CREATE INDEX IF NOT EXISTS `tweet_outbox_digest` ON `tweet_outbox` (`digest`, `queued_unixts`);')
+
+    # memoized parse_country_contents() results, see parse_countries()
+    c.execute(
+        'CREATE TABLE IF NOT EXISTS `parse_cache` ('
+            '`key` VARCHAR(64) NOT NULL,'
+            '`parser_version` VARCHAR(40) NOT NULL,'
+            '`classification` INT NOT NULL,'
+            '`preformatted` VARCHAR(20000),'
+            '`test_required` INT NOT NULL,'
+            '`quarantine_required` INT NOT NULL,'
+            '`last_changed` INT,'
+            'PRIMARY KEY (`key`)'
+        ');'
+    )
+    c.execute('DELETE FROM `parse_cache` WHERE `parser_version`!=?', (PARSER_VERSION,))
+    
+    conn.commit()
+    c.close()
+
+
+# storage layouts:
+#  * full: one `countries` row per country per run (the original layout)
+#  * dedup: a `country_states` row only when anything about a country changes,
+#    a tiny (unixts, state_id) `observations` heartbeat per country per run, and
+#    preformatted text interned by hash. a `countries` view puts the rows back
+#    together, so every query written against the full layout still works
+def _get_storage_layout(c):
+    c.execute("SELECT `type` FROM `sqlite_master` WHERE `name`='countries'")
+    row = c.fetchone()
+    if not row:
+        return None
+    return 'full' if row[0] == 'table' else 'dedup'
+
+
+def _init_dedup_tables(c) -> None:
+    c.execute(
+        'CREATE TABLE IF NOT EXISTS `preformatted` ('
+            '`hash` VARCHAR(64) NOT NULL,'
+            '`text` VARCHAR(20000),'
+            'PRIMARY KEY (`hash`)'
+        ');'
+    )
+    c.execute(
+        'CREATE TABLE IF NOT EXISTS `country_states` ('
+            '`id` INTEGER PRIMARY KEY,'
             '`abbreviation` VARCHAR(10) NOT NULL,'
             '`name` VARCHAR(400) NOT NULL,'
             '`url` VARCHAR(1000) NOT NULL,'
             '`classification` INT NOT NULL,'
-            '`preformatted` VARCHAR(20000),'
+            '`preformatted_hash` VARCHAR(64),'
             '`test_required` INT NOT NULL,'
             '`quarantine_required` INT NOT NULL,'
             '`last_changed` INT,'
-            #'KEY `id` (`id`) USING BTREE,'
-            'PRIMARY KEY (`id`)'
+            '`first_unixts` INT NOT NULL,'
+            '`last_unixts` INT NOT NULL'
         ');'
     )
-    
+    c.execute('CREATE INDEX IF NOT EXISTS `country_states_name_id` ON `country_states` (`name`, `id`);')
+    c.execute('CREATE INDEX IF NOT EXISTS `country_states_first_unixts` ON `country_states` (`first_unixts`);')
+    c.execute(
+        'CREATE TABLE IF NOT EXISTS `observations` ('
+            '`unixts` INT NOT NULL,'
+            '`state_id` INT NOT NULL,'
+            'PRIMARY KEY (`unixts`, `state_id`)'
+        ') WITHOUT ROWID;'
+    )
+    c.execute('CREATE INDEX IF NOT EXISTS `observations_state_id` ON `observations` (`state_id`);')
+
+
+def _create_countries_view(c) -> None:
+    c.execute(
+        'CREATE VIEW IF NOT EXISTS `countries` AS'
+        ' SELECT `country_states`.`id` AS `id`, `observations`.`unixts` AS `unixts`, `abbreviation`, `name`, `url`, `classification`,'
+            ' `preformatted`.`text` AS `preformatted`, `test_required`, `quarantine_required`, `last_changed`'
+        ' FROM `observations`'
+        ' JOIN `country_states` ON `country_states`.`id`=`observations`.`state_id`'
+        ' LEFT JOIN `preformatted` ON `preformatted`.`hash`=`country_states`.`preformatted_hash`'
+    )
+
+
+# preformatted answers are a set: the same answers in any order are the same
+# text, so they are sorted before hashing. returns (hash, canonical text), or
+# (None, None) for no text
+def _preformatted_hash(text):
+    if text is None:
+        return None, None
+    text = '\n'.join(sorted(text.split('\n')))
+    return hashlib.sha256(text.encode()).hexdigest(), text
+
+
+# rows are (unixts, abbreviation, name, url, classification, preformatted,
+# test_required, quarantine_required, last_changed) like the full layout's
+# INSERTs. newest maps each name to its newest (state_id, values) and is
+# returned so batches can be chained
+def _insert_dedup_rows(c, rows, newest=None):
+    if newest is None:
+        # compared by the hash of their canonical text, so states written
+        # before answers were sorted still match
+        c.execute(
+            r"SELECT `id`, `name`, `abbreviation`, `url`, `classification`, `text`, `test_required`, `quarantine_required`, `last_changed`"
+            r" FROM `country_states` LEFT JOIN `preformatted` ON `preformatted`.`hash`=`country_states`.`preformatted_hash`"
+            r" WHERE `id` IN (SELECT MAX(`id`) FROM `country_states` GROUP BY `name`)"
+        )
+        newest = dict()
+        for state_id, name, abbreviation, url, classification, text, *rest in c.fetchall():
+            newest[name] = (state_id, (abbreviation, url, classification, _preformatted_hash(text)[0]) + tuple(rest))
+
+    interned = dict()
+    seen = list()
+    observations = list()
+    for unixts, abbreviation, name, url, classification, preformatted, test_required, quarantine_required, last_changed in rows:
+        preformatted_hash, preformatted = _preformatted_hash(preformatted)
+        if preformatted_hash is not None:
+            interned[preformatted_hash] = preformatted
+
+        values = (abbreviation, url, classification, preformatted_hash, test_required, quarantine_required, last_changed)
+        if name in newest and newest[name][1] == values:
+            state_id = newest[name][0]
+            seen.append((unixts, state_id))
+        else:
+            c.execute("INSERT INTO `country_states` (`abbreviation`, `name`, `url`, `classification`, `preformatted_hash`, `test_required`, `quarantine_required`, `last_changed`, `first_unixts`, `last_unixts`) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                abbreviation, name, url, classification, preformatted_hash, test_required, quarantine_required, last_changed, unixts, unixts))
+            state_id = c.lastrowid
+            newest[name] = (state_id, values)
+        observations.append((unixts, state_id))
+
+    c.executemany("INSERT OR IGNORE INTO `preformatted` (`hash`, `text`) VALUES (?, ?)", interned.items())
+    c.executemany("UPDATE `country_states` SET `last_unixts`=MAX(`last_unixts`, ?) WHERE `id`=?", seen)
+    c.executemany("INSERT OR IGNORE INTO `observations` (`unixts`, `state_id`) VALUES (?, ?)", observations)
+    return newest
+
+
+# converts a full layout history.db into the dedup layout in place. the
+# conversion is checked against the raw get_changes() histogram and rolled back
+# on a mismatch
+def migrate_to_dedup() -> None:
+    c = database()
+    conn = connection()
+    if _get_storage_layout(c) != 'full':
+        logger.info('%r is already using the dedup storage layout' % CURRENT_DB)
+        return
+
+    before = sorted(_query_daily_status_counts(c))
+    _init_dedup_tables(c)
+
+    rows = conn.cursor()
+    rows.execute("SELECT `unixts`, `abbreviation`, `name`, `url`, `classification`, `preformatted`, `test_required`, `quarantine_required`, `last_changed` FROM `countries` ORDER BY `name`, `unixts`, `rowid`")
+    newest = dict()
+    count = 0
+    while True:
+        batch = rows.fetchmany(10000)
+        if not batch:
+            break
+        newest = _insert_dedup_rows(c, batch, newest)
+        count += len(batch)
+    rows.close()
+
+    c.execute('DROP TABLE `countries`')
+    _create_countries_view(c)
+
+    after = sorted(_query_daily_status_counts(c))
+    if after != before:
+        conn.rollback()
+        raise RuntimeError('get_changes() differs after migrating to the dedup layout, rolled back')
+
+    c.execute('SELECT COUNT(*) FROM `country_states`')
+    logger.info('Migrated %d rows into %d country states' % (count, c.fetchone()[0]))
     commit()
+    c.execute('VACUUM')
     c.close()
 
 
+def _rebuild_latest_status(c) -> None:
+    c.execute('DELETE FROM `latest_status`')
+    c.execute(
+        r"INSERT INTO `latest_status` (`name`, `unixts`, `classification`, `test_required`, `quarantine_required`)"
+        r" SELECT `name`, MAX(`unixts`), `classification`, `test_required`, `quarantine_required`"
+        r" FROM `countries`"
+        r" GROUP BY `name`"
+    )
+    c.execute(
+        r"UPDATE `latest_status` SET (`changed_unixts`, `changed_classification`, `changed_test_required`, `changed_quarantine_required`) = ("
+            r"SELECT `unixts`, `classification`, `test_required`, `quarantine_required`"
+            r" FROM `countries`"
+            r" WHERE `countries`.`name`=`latest_status`.`name` AND (`countries`.`classification`!=`latest_status`.`classification` OR `countries`.`test_required`!=`latest_status`.`test_required` OR `countries`.`quarantine_required`!=`latest_status`.`quarantine_required`)"
+            r" ORDER BY `unixts` DESC"
+            r" LIMIT 1"
+        r")"
+    )
+
+
 class MLStripper(html.parser.HTMLParser):
     def __init__(self):
         super().__init__()
@@ -118,6 +401,10 @@ class MLStripper(html.parser.HTMLParser):
         return self.text.getvalue()
 
 def strip_tags(html):
+    if '<' not in html and '&' not in html:
+        # nothing for the parser to do
+        return html
+
     s = MLStripper()
     s.feed(html)
     return s.get_data()
@@ -147,11 +434,13 @@ TEST_REQUIRED_TEXT = {
 }
 
 
-def generate_change_text(country, recent_row):
+# the original rules for turning a status change into a sentence. only used to
+# build CHANGE_TEXT and to check it against (see validate_change_text())
+def _compute_change_text(country, recent_row):
     to_classification, to_test_required, to_quarantine_required = (
-        country['classification'],
-        country['test_required'],
-        country['quarantine_required']
+        country.classification,
+        country.test_required,
+        country.quarantine_required
     )
     from_classification, from_test_required, from_quarantine_required = recent_row[2:5]
     msgs = list()
@@ -181,7 +470,7 @@ def generate_change_text(country, recent_row):
             if msg:
                 msgs.append(msg)
 
-    outmsg = country['name'] + ' '
+    outmsg = country.name + ' '
     _msgs = list()
     for msg in msgs:
         if to_classification in CLASSIFICATION_SAME[2] and from_classification in CLASSIFICATION_SAME[1] and msg.startswith('now '):
@@ -216,83 +505,416 @@ def generate_change_text(country, recent_row):
     return outmsg or False
 
 
-def has_file_expired(filename, expire_after=60*60*5):
-    try:
-        p = pathlib.Path(filename)
-        if not p:
-            return True
-        elif (time.time() - p.stat().st_mtime) > expire_after:
-            return True
-        else:
-            return False
-    except:
-        return True
+# every (classification, test_required, quarantine_required) a country can have
+def _status_space():
+    return tuple(itertools.product(
+        range(ANSWER_YES + 1),
+        (TEST_REQUIRED_UNKNOWN, TEST_REQUIRED_YES, TEST_REQUIRED_NO),
+        (QUARANTINE_REQUIRED_UNKNOWN, QUARANTINE_REQUIRED_YES, QUARANTINE_REQUIRED_NO)
+    ))
+
+
+_CHANGE_TEXT_NAME = '\0' # stands in for the country name while building the table
+
+_change_text = None
+
+
+# (from status, to status) -> the text after "<name> ", or False when there is
+# nothing to say, for every pair of statuses in _status_space(). statuses are
+# (classification, test_required, quarantine_required) tuples. the text never
+# depends on the name, which validate_change_text() checks
+def get_change_text_table():
+    global _change_text
+    if _change_text is None:
+        country = records.CountryStatus(_CHANGE_TEXT_NAME)
+        table = dict()
+        space = _status_space()
+        for old in space:
+            row = (None, None) + old
+            for new in space:
+                country.classification, country.test_required, country.quarantine_required = new
+                text = _compute_change_text(country, row)
+                table[old, new] = text and text[len(_CHANGE_TEXT_NAME) + 1:]
+        _change_text = table
+    return _change_text
+
+
+def change_text(name, old, new):
+    text = get_change_text_table().get((tuple(old), tuple(new)))
+    if text is None:
+        # a status outside _status_space() (e.g. None from an old row)
+        country = records.CountryStatus(name)
+        country.classification, country.test_required, country.quarantine_required = new
+        return _compute_change_text(country, (None, None) + tuple(old))
+    return text and name + ' ' + text
+
+
+def generate_change_text(country, recent_row):
+    return change_text(country.name, recent_row[2:5], (country.classification, country.test_required, country.quarantine_required))
+
+
+# checks change_text() against _compute_change_text() for every pair of
+# statuses and every country name we know. returns the number of mismatches
+def validate_change_text(names=None) -> int:
+    names = names or sorted({name.title() for name in COUNTRIES} | {'Ukraine', 'Poland', 'Trinidad and Tobago'})
+    mismatches = 0
+    space = _status_space()
+    country = records.CountryStatus(None)
+    for name in names:
+        country.name = name
+        for old in space:
+            row = (None, None) + old
+            for new in space:
+                country.classification, country.test_required, country.quarantine_required = new
+                expected = _compute_change_text(country, row)
+                actual = change_text(name, old, new)
+                if actual != expected:
+                    mismatches += 1
+                    logger.warning('Change text mismatch for %r %r -> %r: %r != %r' % (name, old, new, actual, expected))
+    logger.info('Checked %d transitions for %d names, %d mismatches' % (len(space)**2 * len(names), len(names), mismatches))
+    return mismatches
+
+
+# every status change with start <= unixts < end as (unixts, text), oldest first.
+# a country's first observation is not a change
+def change_digest(c=None, start=0, end=2**62):
+    import query
+
+    cursor = c or database(read_only=True)
+    for transition in query.transitions(cursor, start, end):
+        if transition.old is None:
+            continue
+        text = change_text(transition.name, transition.old, transition.new)
+        if text:
+            yield transition.unixts, text
+    if not c:
+        cursor.close()
 
 
 def normalize_country_filename(country_name):
     return country_name.lower().replace('.', '').replace('/', '').replace(' ', '_')
 
 
-def fetch_url(country_name, url):
-    filename = 'data/country_' + normalize_country_filename(country_name) + '_' + hashlib.sha256(url.encode()).hexdigest() + '.html'
+FETCH_WORKERS = 16 # total concurrent requests
+FETCH_PER_HOST = 2 # concurrent requests against any single embassy host
+FETCH_TIMEOUT = 30 # seconds
+
+_session = None
+_fetch_lock = threading.Lock()
+_host_semaphores = dict()
+
+
+def _get_session():
+    global _session
+    with _fetch_lock:
+        if not _session:
+            import requests
+            import requests.adapters
+
+            # urllib3 keeps a pool per host, so keep-alive connections are reused between pages
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_PER_HOST)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def _get_host_semaphore(url):
+    host = urllib.parse.urlsplit(url).netloc
+    with _fetch_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(FETCH_PER_HOST)
+        return _host_semaphores[host]
+
 
-    if has_file_expired(filename):
-        logger.debug('URL %r for country %r has expired, fetching new data...' % (url, country_name))
+def _http_get(url, headers=None):
+    with _get_host_semaphore(url):
+        return _get_session().get(url, headers=headers, allow_redirects=True, timeout=FETCH_TIMEOUT)
+
+
+def http_get(url):
+    return _http_get(url).text
+
+
+CACHE_META_FILENAME = 'data/cache.json'
+CACHE_STATS = dict()
+
+_cache_meta = None
+_cache_meta_stamp = None # (inode, mtime, size) of CACHE_META_FILENAME when _cache_meta was read
+_cache_meta_updated = set() # urls whose metadata changed, so parse workers can hand them back
+
+
+def _get_cache_meta():
+    global _cache_meta, _cache_meta_stamp
+    if _cache_meta is None:
+        try:
+            with open(CACHE_META_FILENAME, 'r') as f:
+                stat = os.fstat(f.fileno())
+                _cache_meta_stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                _cache_meta = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            _cache_meta = dict()
+    return _cache_meta
+
+
+# parse workers live across runs, and the parent saves its cache meta before
+# every batch of jobs, so a worker rereads it whenever the file changed
+def _reload_cache_meta() -> None:
+    global _cache_meta
+    try:
+        stat = os.stat(CACHE_META_FILENAME)
+    except FileNotFoundError:
+        return
+    if (stat.st_ino, stat.st_mtime_ns, stat.st_size) != _cache_meta_stamp:
+        _cache_meta = None
+
+
+def save_cache_meta():
+    with _fetch_lock:
+        data = json.dumps(_get_cache_meta(), separators=(',', ':'), sort_keys=True)
+    with open(CACHE_META_FILENAME + '.tmp', 'w') as f:
+        f.write(data)
+    os.replace(CACHE_META_FILENAME + '.tmp', CACHE_META_FILENAME)
+
+
+def reset_cache_stats():
+    with _fetch_lock:
+        CACHE_STATS.update({'hit': 0, 'revalidated': 0, 'miss': 0})
+
+
+def _count_cache(key, country=None):
+    with _fetch_lock:
+        CACHE_STATS[key] = CACHE_STATS.get(key, 0) + 1
+    metrics.incr('page_cache', result=key, country=country)
+
+
+# fetch_page() returns (contents, changed). pages younger than expire_after are
+# served from the page cache; older ones are revalidated with the
+# ETag/Last-Modified we stored last time, and a 304 or a byte-identical body
+# only records that the cached copy is still current
+DEFAULT_REFRESH_INTERVAL = 60*60*5
+
+
+# how long pages stay fresh: refresh-interval in config.yml, overridden per
+# country name by refresh-intervals
+def get_refresh_interval(country_name=None):
+    intervals = CONFIG.get('refresh-intervals') or dict()
+    return intervals.get(country_name, CONFIG.get('refresh-interval', DEFAULT_REFRESH_INTERVAL))
+
+
+# where fetched pages are kept, by page-cache in config.yml: 'pack' keeps every
+# version of every page in the content-addressed pack store (see pack.py),
+# 'files' one file per url with only the newest version. pages cached as files
+# are moved into the pack the next time they are fetched
+def _get_page_store():
+    global _page_store
+    if CONFIG.get('page-cache', 'pack') != 'pack':
+        return None
+    with _page_store_lock:
+        key, store = _page_store
+        # parse workers are forked with the parent's store, but need their own
+        # connection. (the store lives under the working directory, see pack.PACK_DIR)
+        if key != (os.getpid(), os.getcwd()):
+            import pack
+            store = pack.PackStore()
+            _page_store = ((os.getpid(), os.getcwd()), store)
+    return store
+
+
+_page_store = (None, None)
+_page_store_lock = threading.Lock()
+
+
+# (fetched unixts, sha256) of the cached copy of url, with sha256 None when it
+# is a file, or None when there is no cached copy
+def _cached_page(url, filename):
+    store = _get_page_store()
+    cached = store and store.latest(url)
+    if cached:
+        return cached
+    try:
+        return os.stat(filename).st_mtime, None
+    except FileNotFoundError:
+        return None
+
+
+def _read_cached_page(filename, cached):
+    if cached[1] is None:
+        with open(filename, 'r') as f:
+            return f.read()
+    return _get_page_store().get(cached[1]).decode()
+
+
+# the cached copy of url was fetched again and is still current
+def _touch_cached_page(url, filename, cached):
+    store = _get_page_store()
+    if not store:
+        os.utime(filename)
+    elif cached[1] is None:
+        with open(filename, 'rb') as f:
+            store.put(url, f.read())
+        os.unlink(filename)
+    else:
+        store.touch(url, cached[1])
+
+
+def _write_cached_page(url, filename, contents):
+    store = _get_page_store()
+    if not store:
         with open(filename, 'w') as f:
-            f.write(requests.get(url, allow_redirects=True).text)
+            f.write(contents)
+        return
+    store.put(url, contents.encode())
+    if os.path.exists(filename):
+        os.unlink(filename)
+
+
+# the cached copy of url, however old, without fetching anything. raises
+# FileNotFoundError if there is none
+def read_cached_page(url, filename):
+    cached = _cached_page(url, filename)
+    if not cached:
+        raise FileNotFoundError('%r is not cached' % url)
+    return _read_cached_page(filename, cached)
+
+
+def fetch_page(url, filename, expire_after=DEFAULT_REFRESH_INTERVAL, country=None):
+    cached = _cached_page(url, filename)
+    if cached and time.time() - cached[0] <= expire_after:
+        _count_cache('hit', country)
+        return _read_cached_page(filename, cached), False
+
+    meta = _get_cache_meta().get(url) if cached else None
+    headers = dict()
+    if meta and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    with metrics.timer('http_request', country=country):
+        r = _http_get(url, headers=headers)
+    metrics.incr('bytes_fetched', len(r.content), country=country)
+    if r.status_code == 304 and meta:
+        logger.debug('URL %r has not changed (304)' % url)
+        contents = _read_cached_page(filename, cached)
+        _touch_cached_page(url, filename, cached)
+        _count_cache('revalidated', country)
+        return contents, False
+
+    contents = r.text
+    digest = hashlib.sha256(contents.encode()).hexdigest()
+    with _fetch_lock:
+        _get_cache_meta()[url] = {
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'sha256': digest
+        }
+        _cache_meta_updated.add(url)
 
-    with open(filename, 'r') as f:
-        return f.read()
+    if meta and meta.get('sha256') == digest:
+        logger.debug('URL %r has not changed (same hash)' % url)
+        _touch_cached_page(url, filename, cached)
+        _count_cache('revalidated', country)
+        return contents, False
 
+    logger.debug('URL %r has changed, caching it' % url)
+    _write_cached_page(url, filename, contents)
+    _count_cache('miss', country)
+    return contents, True
+
+
+def get_page_filename(country_name, url):
+    return 'data/country_' + normalize_country_filename(country_name) + '_' + hashlib.sha256(url.encode()).hexdigest() + '.html'
+
+
+def fetch_url(country_name, url):
+    return fetch_page(url, get_page_filename(country_name, url), expire_after=get_refresh_interval(country_name), country=country_name)[0]
+
+
+# where the extra pages of a country live, whatever scheme its directory link has
+def extra_page_url(domain, path):
+    return ('https://%s/' % domain) + path
+
+
+def _fetch_country(country_name, url, domain, filename, page_url=extra_page_url):
+    try:
+        extra_urls = ['covid-19-information/', 'u-s-citizen-services/covid-19-information/']
+        urls = [url]
+        for _u in extra_urls:
+            u = page_url(domain, _u)
+            if u.rstrip('/') != url.rstrip('/'):
+                urls.append(u)
+
+        data = ''
+        for u in urls:
+            contents, _ = fetch_page(u, get_page_filename(country_name, u), expire_after=get_refresh_interval(country_name), country=country_name)
+            data += contents
+
+        # compare against what is on disk rather than trusting the per-page
+        # changed flags: a page can change on a run that then fails on a later
+        # page, and would report itself unchanged from then on
+        try:
+            with open(filename, 'r') as f:
+                changed = f.read() != data
+        except FileNotFoundError:
+            changed = True
+
+        if changed:
+            logger.debug(f'Country {country_name!r} changed, writing {filename!r}...')
+            with open(filename, 'w') as f:
+                f.write(data)
+    except:
+        logger.exception(f'Failed to pull info for country {country_name!r} to file {filename!r}. URL: {url!r}')
+        if not os.path.exists(filename):
+            # leave an empty page behind so the country still gets parsed (as unknown)
+            open(filename, 'w').close()
+
+
+# fetch every (country_name, url, domain, filename) job. the pages of a single
+# country are fetched in order, but countries are spread over the worker pool,
+# so a full refresh takes about as long as the slowest host instead of the sum
+# of all of them. page_url builds the urls of the extra pages (see extra_page_url)
+def fetch_countries(jobs, workers=FETCH_WORKERS, page_url=extra_page_url):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(_fetch_country, *job, page_url=page_url) for job in jobs]:
+            future.result()
+
+
+DIRECTORY_URL = 'https://travel.state.gov/content/travel/en/traveladvisories/COVID-19-Country-Specific-Information.html'
+DIRECTORY_FILENAME = 'data/directory.html'
 
-def parse_directory():
-    DIR_URL = 'https://travel.state.gov/content/travel/en/traveladvisories/COVID-19-Country-Specific-Information.html'
-    FILENAME = 'data/directory.html'
-    
-    if has_file_expired(FILENAME):
-        logger.debug('Directory file has expired; fetching new data...')
-        with open(FILENAME, 'w') as f:
-            f.write(requests.get(DIR_URL, allow_redirects=True).text)
 
-    with open(FILENAME, 'r') as f:
-        contents = f.read()
+def parse_directory(fetch=True):
+    if fetch:
+        contents, _ = fetch_page(DIRECTORY_URL, DIRECTORY_FILENAME, expire_after=get_refresh_interval())
+    else:
+        contents = read_cached_page(DIRECTORY_URL, DIRECTORY_FILENAME)
 
     countries = dict()
+    jobs = list()
 
     rstring = r'<\/tr><tr><td><a href="(https?:\/\/(((..|china))\.(usembassy-china\.org\.cn|usembassy\.gov|usconsulate\.gov|usmission\.gov)).*?)">([\w \'\.,]*)<\/a>'
     for match in re.findall(rstring, contents):
         # ('https://mx.usembassy.gov/covid-19-information/', 'mx', 'mx', 'usembassy.gov', 'Mexico')
         url, domain, country_abbreviation, _, _, country_name = match
-        country_abbreviation = COUNTRIES.get(country_name.lower(), country_abbreviation)
+        country_abbreviation = get_country_resolver().abbreviation(country_name, country_abbreviation)
         filename = 'data/country_' + normalize_country_filename(country_name) + '.html'
 
-        try:
-            if has_file_expired(filename):
-                logger.debug(f'Country {country_name!r} file {filename!r} has expired, pulling new data...')
-                with open(filename, 'w') as f:
-                    extra_urls = ['covid-19-information/', 'u-s-citizen-services/covid-19-information/']
-                    data = requests.get(url, allow_redirects=True).text
-                    for _u in extra_urls:
-                        u = ('https://%s/' % domain) + _u
-                        if u.rstrip('/') != url.rstrip('/'):
-                            data += requests.get(u, allow_redirects=True).text
-                    f.write(data)
-
-        except:
-            logger.exception(f'Failed to pull info for country {country_name!r} to file {filename!r}. Match: {match!r}')
+        jobs.append((country_name, url, domain, filename))
         
         assert country_name not in countries, f'Country {country_name!r} is already in countries! countries[{country_name!r}] == {countries.get(country_name)!r}'
-        countries[country_name] = {
-            'name': country_name,
-            'abbreviation': country_abbreviation.upper().replace('CHINA', 'CN'),
-            'url': url,
-            'domain': domain,
-            'filename': filename
-        }
+        countries[country_name] = records.CountryStatus(country_name, country_abbreviation.upper().replace('CHINA', 'CN'), url, domain, filename)
+
+    if fetch:
+        fetch_countries(jobs)
 
     return countries
 
 
+# bump this whenever the parsing rules change, so memoized results get thrown away
+PARSER_VERSION = '4'
+
+
 ANSWER_UNKNOWN, ANSWER_READ_MORE, ANSWER_NO, ANSWER_RARELY, ANSWER_SOMETIMES, ANSWER_YES = range(6)
 ANSWERS = {
     ANSWER_UNKNOWN: 'Unknown',
@@ -331,7 +953,7 @@ def _preformat_answer(country, answer):
         preformatted_answer = preformatted_answer[0].upper() + preformatted_answer[1:]
 
     preformatted_answer = re.sub(r'(https[^\s]*?)(\.\W|"| |\.\s|\.$)', r'the website\2', preformatted_answer, flags=re.IGNORECASE) 
-    preformatted_answer = re.sub(r'^' + re.escape(country['name']) + r' (Yes|No)', r'\1', preformatted_answer, flags=re.IGNORECASE)
+    preformatted_answer = re.sub(r'^' + re.escape(country.name) + r' (Yes|No)', r'\1', preformatted_answer, flags=re.IGNORECASE)
     preformatted_answer = re.sub(r'(Yes|No) ([\(A-Z])', r'\1. \2', preformatted_answer, flags=re.IGNORECASE)
 
     preformatted_answer = re.sub(r'Covid19', 'COVID-19', preformatted_answer, flags=re.IGNORECASE)
@@ -339,60 +961,69 @@ def _preformat_answer(country, answer):
     return preformatted_answer
 
 
-def _parse_answer(_answer, url=None):
-    answer = re.sub(r'\s+', ' ', re.sub(r'[^\w \n]', '', strip_tags(_answer))).strip().lower()
+# phrase rules are (result, [phrase, ...]) lists in priority order, frozen into
+# tuples once at import. the first rule with a phrase found in the answer wins.
+# (a combined lookahead regex was tried here, but CPython's substring search
+# beats it by ~3x on our answers, see ./benchmark.py classify)
+def _compile_phrase_rules(rules):
+    return tuple((result, tuple(phrases)) for result, phrases in rules)
 
-    if not answer:
-        return ANSWER_UNKNOWN
 
-    yes_sometimess = ['not for tourism', 'entry is restricted', 'no tourism', 'subject to strict limitations', 'purpose of travel', 'only under', 'very limited cases', 'special permission', 'but only if they meet other certain criteria', 'limited circumstances', 'restricting non-essential travel', 'only essential travel is permitted']
-    yes_always = ['valid visa', 'approved evisa', 'with additional documentation', 'subject to restrictions']
+def _match_phrase_rules(compiled_rules, answer, default=None):
+    for result, phrases in compiled_rules:
+        for phrase in phrases:
+            if phrase in answer:
+                return result
 
-    no_rarelys = ['limited circumstances', 'few exceptions', 'limited exceptions', 'for exceptions', 'special circumstances', 'but currently most us citizens can', 'other us visitors are not allowed']
-    no_always = ['nonessential travel', 'residency']
+    return default
 
-    others_override = {'other us visitors are not allowed': ANSWER_RARELY}
-    others_no = ['us visitors are not allowed']
-    others_rarely = ['very limited', 'other us visitors are not allowed', 'but currently most us citizens can']
-    others_sometimes = ['it depends']
-    others_always = ['in most cases', 'the countryyes', 'some us citizens are permitted to enter']
 
-    if re.findall(r'\byes\b', answer) or answer.startswith('yes'):
-        for d in yes_sometimess:
-            if d in answer:
-                return ANSWER_SOMETIMES
-        for d in yes_always:
-            if d in answer:
-                return ANSWER_YES
+_RE_WHITESPACE = re.compile(r'\s+')
+_RE_NOT_WORD = re.compile(r'[^\w ]')
+_RE_NOT_WORD_OR_NEWLINE = re.compile(r'[^\w \n]')
+_RE_YES = re.compile(r'\byes\b')
+_RE_NO = re.compile(r'\bno\b')
 
-        return ANSWER_YES
-    
-    if re.findall(r'\bno\b', answer) or answer.startswith('no'):
-        for d in no_rarelys:
-            if d in answer:
-                return ANSWER_RARELY
 
-        for d in no_always:
-            if d in answer:
-                return ANSWER_NO
+def _normalize_answer(_answer, keep_newlines=False):
+    junk = _RE_NOT_WORD_OR_NEWLINE if keep_newlines else _RE_NOT_WORD
+    return _RE_WHITESPACE.sub(' ', junk.sub('', strip_tags(_answer))).strip().lower()
+
+
+_ANSWER_YES_RULES = _compile_phrase_rules([
+    (ANSWER_SOMETIMES, ['not for tourism', 'entry is restricted', 'no tourism', 'subject to strict limitations', 'purpose of travel', 'only under', 'very limited cases', 'special permission', 'but only if they meet other certain criteria', 'limited circumstances', 'restricting non-essential travel', 'only essential travel is permitted']),
+    (ANSWER_YES, ['valid visa', 'approved evisa', 'with additional documentation', 'subject to restrictions'])
+])
+
+_ANSWER_NO_RULES = _compile_phrase_rules([
+    (ANSWER_RARELY, ['limited circumstances', 'few exceptions', 'limited exceptions', 'for exceptions', 'special circumstances', 'but currently most us citizens can', 'other us visitors are not allowed']),
+    (ANSWER_NO, ['nonessential travel', 'residency'])
+])
+
+_ANSWER_OTHER_RULES = _compile_phrase_rules([
+    (ANSWER_RARELY, ['other us visitors are not allowed']), # override
+    (ANSWER_NO, ['us visitors are not allowed']),
+    (ANSWER_RARELY, ['very limited', 'other us visitors are not allowed', 'but currently most us citizens can']),
+    (ANSWER_SOMETIMES, ['it depends']),
+    (ANSWER_YES, ['in most cases', 'the countryyes', 'some us citizens are permitted to enter'])
+])
 
-        return ANSWER_NO
+
+def _parse_answer(_answer, url=None):
+    answer = _normalize_answer(_answer, keep_newlines=True)
+
+    if not answer:
+        return ANSWER_UNKNOWN
+
+    if answer.startswith('yes') or _RE_YES.search(answer):
+        return _match_phrase_rules(_ANSWER_YES_RULES, answer, ANSWER_YES)
+    
+    if answer.startswith('no') or _RE_NO.search(answer):
+        return _match_phrase_rules(_ANSWER_NO_RULES, answer, ANSWER_NO)
     
-    for d, k in others_override.items():
-        if d in answer:
-            return k
-    for d in others_no:
-        if d in answer:
-            return ANSWER_NO
-    for d in others_rarely:
-        if d in answer:
-            return ANSWER_RARELY
-    for d in others_sometimes:
-        if d in answer:
-            return ANSWER_SOMETIMES
-    for d in others_always:
-        if d in answer:
-            return ANSWER_YES
+    result = _match_phrase_rules(_ANSWER_OTHER_RULES, answer)
+    if result is not None:
+        return result
 
     logger.warning('Unknown response: _answer=%r, answer=%r, url=%r' % (_answer, answer, url))
     return ANSWER_UNKNOWN
@@ -400,30 +1031,25 @@ def _parse_answer(_answer, url=None):
 
 TEST_REQUIRED_UNKNOWN, TEST_REQUIRED_YES, TEST_REQUIRED_NO = range(3)
 
+_TEST_REQUIRED_RULES = _compile_phrase_rules([
+    (TEST_REQUIRED_YES, ['yes', 'must produce a negative', 'provide a negative', 'requires a negative', 'must undergo', 'requirements for a valid test', 'is required', 'will be tested for covid-19 at their own expense']),
+    (TEST_REQUIRED_NO, ['no', 'not required']),
+    (TEST_REQUIRED_UNKNOWN, ['remain closed'])
+])
+
+
 def _parse_covid_test_answer(question, _answer, url=None):
-    answer = re.sub(r'\s+', ' ', re.sub(r'[^\w ]', '', strip_tags(_answer))).strip().lower()
+    answer = _normalize_answer(_answer)
     
     if not answer:
         return TEST_REQUIRED_UNKNOWN
 
     # HACK: [Sun, 07 Mar 2021 14:53:03] WARNING [main.py._parse_covid_test_answer:236] Unknown response for test_required: _answer=' to Mexico.</li>', answer='to mexico', url='https://mx.usembassy.gov/u-s-citizen-services/covid-19-information/'
-    answer += re.sub(r'\s+', ' ', re.sub(r'[^\w ]', '', strip_tags(question))).strip().lower()
-
-    yess = ['yes', 'must produce a negative', 'provide a negative', 'requires a negative', 'must undergo', 'requirements for a valid test', 'is required', 'will be tested for covid-19 at their own expense']
-    nos = ['no', 'not required']
-    unknowns = ['remain closed']
-
-    for d in yess:
-        if d in answer:
-            return TEST_REQUIRED_YES
+    answer += _normalize_answer(question)
 
-    for d in nos:
-        if d in answer:
-            return TEST_REQUIRED_NO
-
-    for d in unknowns:
-        if d in answer:
-            return TEST_REQUIRED_UNKNOWN
+    result = _match_phrase_rules(_TEST_REQUIRED_RULES, answer)
+    if result is not None:
+        return result
 
     logger.warning('Unknown response for test_required: question=%r, _answer=%r, answer=%r, url=%r' % (question, _answer, answer, url))
     return TEST_REQUIRED_UNKNOWN
@@ -431,73 +1057,195 @@ def _parse_covid_test_answer(question, _answer, url=None):
 
 QUARANTINE_REQUIRED_UNKNOWN, QUARANTINE_REQUIRED_YES, QUARANTINE_REQUIRED_NO = range(3)
 
+_QUARANTINE_REQUIRED_RULES = _compile_phrase_rules([
+    (QUARANTINE_REQUIRED_YES, ['yes', 'subject to quarantine', 'the following restrictions apply']),
+    (QUARANTINE_REQUIRED_NO, ['no', 'not required to quarantine', 'travelers with elevated temperatures']),
+    (QUARANTINE_REQUIRED_UNKNOWN, ['possibly'])
+])
+
+
 def _parse_quarantine_required_answer(_answer, url=None):
-    answer = re.sub(r'\s+', ' ', re.sub(r'[^\w ]', '', strip_tags(_answer))).strip().lower()
+    answer = _normalize_answer(_answer)
     
     if not answer:
         return QUARANTINE_REQUIRED_UNKNOWN
 
-    yess = ['yes', 'subject to quarantine', 'the following restrictions apply']
-    nos = ['no', 'not required to quarantine', 'travelers with elevated temperatures']
-    unknowns = ['possibly']
+    result = _match_phrase_rules(_QUARANTINE_REQUIRED_RULES, answer)
+    if result is not None:
+        return result
+
+    logger.warning('Unknown response for quarantine_required: _answer=%r, answer=%r, url=%r' % (_answer, answer, url))
+    return QUARANTINE_REQUIRED_UNKNOWN
 
-    for d in yess:
-        if d in answer:
-            return QUARANTINE_REQUIRED_YES
 
-    for d in nos:
-        if d in answer:
-            return QUARANTINE_REQUIRED_NO
+RE_MODIFIED_TIME = r'<meta property="article:modified_time" content="(.*?)" \/>'
+HASH_CHUNK_SIZE = 64 * 1024 # pages are hashed for the memo table in pieces this big
+
+
+# the extractor runs bytes regexes straight over the memory-mapped page
+# instead of reading it into a str and copying it for every .replace() like the
+# original str extractor did (it lives on in benchmark.py as extract_regex(),
+# the reference this one is checked against). the entities that one replaces
+# before matching are matched in place instead (_B_SPACE), and only the
+# fragments that matched are decoded and get the same replacements. the page
+# itself is never copied, so peak memory doesn't grow with the page
+_B_SPACE = rb'(?: |&nbsp;|\xc2\xa0)' # a space after the reference extractor's replacements
+_B_SPAN = rb'(?:<span data-contrast="none">|</span>)' # dropped before matching the quarantine question
+_B_FLAGS = re.IGNORECASE | re.DOTALL
+
+_B_RE_US_CITIZENS = re.compile(rb'((?:Are' + _B_SPACE + rb')?U\.S\.' + _B_SPACE + rb'citizens' + _B_SPACE + rb'permitted' + _B_SPACE + rb'to' + _B_SPACE + rb'enter\??)(.*?</li>)', _B_FLAGS)
+_B_RE_COVID_TEST = re.compile(rb'(Is' + _B_SPACE + rb'a' + _B_SPACE + rb'negative' + _B_SPACE + rb'COVID-19' + _B_SPACE + rb'test.*?required' + _B_SPACE + rb'for' + _B_SPACE + rb'entry\??)(.*?</li>)', _B_FLAGS)
+_B_RE_QUARANTINE_REQUIRED = re.compile(rb'(citizens(?:' + _B_SPACE + rb'|' + _B_SPAN + rb')+required(?:' + _B_SPACE + rb'|' + _B_SPAN + rb')+to(?:' + _B_SPACE + rb'|' + _B_SPAN + rb')+quarantine\??)(.*?</li>)', _B_FLAGS)
+_B_RE_MODIFIED_TIME = re.compile(RE_MODIFIED_TIME.encode().replace(b' ', _B_SPACE), re.IGNORECASE)
+_B_RE_SECTION_END = re.compile(_B_SPACE + rb'class="panel' + _B_SPACE + rb'panel-default">')
+_B_RE_PANEL_TITLE = re.compile(rb'<h4' + _B_SPACE + rb'class="panel-title">([^<]*)</h4>')
+
+
+# the country's accordion heading, matched against each decoded panel title.
+# a str pattern, not a bytes one: bytes patterns only case-fold ascii letters
+# ("CÔTE D'IVOIRE") and their \s only matches ascii whitespace
+def _get_section_title_regex(country):
+    return re.compile(r'\s*(?:' + '|'.join([re.escape(country.name), re.escape(country.name.replace('and', '&'))]) + r')\s*', re.IGNORECASE | re.DOTALL)
+
+
+def _get_b_latest_regex(country):
+    return re.compile(rb'(latest|updated).*info.*"(http.*?' + re.escape(country.domain.encode()) + rb'.*?)"', re.IGNORECASE | re.MULTILINE)
+
+
+# "Côte d'Ivoire" -> "cote divoire", "The St. Vincent & the Grenadines" -> "saint vincent and the grenadines"
+def normalize_country_name(name):
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().lower()
+    words = re.sub(r'[^a-z0-9]+', ' ', name.replace("'", '').replace('&', ' and ')).split()
+    words = ['saint' if word == 'st' else word for word in words]
+    return ' '.join(words[1:] if words[:1] == ['the'] else words)
+
+
+# everything per country that doesn't depend on the page: its abbreviation,
+# looked up by normalized name in COUNTRIES and COUNTRY_ALIASES, and the compiled
+# section and "latest info" patterns the extractor searches pages with. both are
+# built on first use and kept for the life of the process, so follow-up pages
+# and later runs of a daemon reuse them. (re's own cache holds 512 patterns
+# and is shared with every other one a run compiles.) no lock: two threads
+# compiling the same pattern at once both get a working one
+class CountryResolver:
+    def __init__(self, countries=COUNTRIES, aliases=COUNTRY_ALIASES):
+        self.abbreviations = dict()
+        for name, abbreviation in itertools.chain(countries.items(), aliases.items()):
+            self.abbreviations.setdefault(normalize_country_name(name), abbreviation.upper())
+        self._patterns = dict() # (builder, name or domain) -> what it built
+        self._unresolved = set()
+
+    # the abbreviation for a country name, or default (logged once per name) if we don't know it
+    def abbreviation(self, name, default=None):
+        abbreviation = self.abbreviations.get(normalize_country_name(name))
+        if abbreviation is None:
+            if name not in self._unresolved:
+                self._unresolved.add(name)
+                logger.warning('Unknown country %r, using %r as its abbreviation' % (name, default))
+            return default
+        return abbreviation
+
+    def _pattern(self, build, key, country):
+        pattern = self._patterns.get((build, key))
+        if pattern is None:
+            pattern = self._patterns[(build, key)] = build(country)
+        return pattern
+
+    def section_title_regex(self, country):
+        return self._pattern(_get_section_title_regex, country.name, country)
+
+    def b_latest_regex(self, country):
+        return self._pattern(_get_b_latest_regex, country.domain, country)
+
+
+_country_resolver = None
+
+
+def get_country_resolver() -> CountryResolver:
+    global _country_resolver
+    if _country_resolver is None:
+        _country_resolver = CountryResolver()
+    return _country_resolver
+
+
+def _decode_fragment(fragment):
+    return fragment.decode().replace('&nbsp;', ' ').replace('&amp;', '&').replace('\xa0', ' ')
+
+
+def _extract_mmap(country, buffer):
+    resolver = get_country_resolver()
+    start, end = 0, len(buffer)
+    title_regex = resolver.section_title_regex(country)
+    for match in _B_RE_PANEL_TITLE.finditer(buffer):
+        if title_regex.fullmatch(_decode_fragment(match.group(1))):
+            start = match.end()
+            match = _B_RE_SECTION_END.search(buffer, start)
+            if match:
+                end = match.start()
+            break
 
-    for d in unknowns:
-        if d in answer:
-            return QUARANTINE_REQUIRED_UNKNOWN
+    def find(regex):
+        return [tuple(_decode_fragment(group) for group in match.groups()) for match in regex.finditer(buffer, start, end)]
 
-    logger.warning('Unknown response for quarantine_required: _answer=%r, answer=%r, url=%r' % (_answer, answer, url))
-    return QUARANTINE_REQUIRED_UNKNOWN
+    return {
+        'us_citizens': find(_B_RE_US_CITIZENS),
+        'covid_test': find(_B_RE_COVID_TEST),
+        'quarantine_required': [tuple(group.replace('<span data-contrast="none">', '').replace('</span>', '').replace('&nbsp;', ' ') for group in match) for match in find(_B_RE_QUARANTINE_REQUIRED)],
+        'modified_times': [modified for modified, in find(_B_RE_MODIFIED_TIME)],
+        'latest_urls': [url for _, url in find(resolver.b_latest_regex(country))]
+    }
 
 
-def parse_country_contents(country, contents, ignore_urls=None, temp_url=None):
-    cur_url = temp_url or country['url']
+# pulls the raw question/answer material out of a page, as a dict of:
+#  * us_citizens: [(question, answer), ...]
+#  * covid_test: [(question, answer), ...]
+#  * quarantine_required: [(question, answer), ...]
+#  * modified_times: [iso timestamp, ...]
+#  * latest_urls: [url, ...] (links to follow when there are no us_citizens answers)
+def extract_country_contents(country, contents=None, filename=None):
+    if contents is not None:
+        return _extract_mmap(country, contents.encode())
+    with open(filename, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            # empty files can't be mapped
+            return _extract_mmap(country, b'')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return _extract_mmap(country, buffer)
+
+
+def parse_country_contents(country, contents=None, ignore_urls=None, temp_url=None, filename=None):
+    cur_url = temp_url or country.url
     if not ignore_urls:
-        ignore_urls = [country['url']]
-
-    contents = contents.replace('&nbsp;', ' ').replace('&amp;', '&').replace('\xa0', ' ').strip()
-    
-    # deal with accordions
+        ignore_urls = [country.url]
 
-    _sep = r'<h4 class="panel-title">\s*(?:' + '|'.join([re.escape(country['name']), re.escape(country['name'].replace('and', '&'))]) + r')\s*<\/h4>'
-    matches = re.compile(_sep, re.IGNORECASE | re.MULTILINE | re.DOTALL).split(contents, 1)
-    if len(matches) != 1:
-        contents = matches[1].split(' class="panel panel-default">', 1)[0]
+    extracted = extract_country_contents(country, contents=contents, filename=filename)
 
     # parse the "open" question
 
     retval = True
-    rstring_us_citizens = r'((Are )?U\.S\. citizens permitted to enter\??)(.*?<\/li>)'
-    matches = re.findall(rstring_us_citizens, contents, re.IGNORECASE | re.MULTILINE | re.DOTALL)
+    matches = extracted['us_citizens']
     if not matches:
-        rstring_latest = r'(latest|updated).*info.*"(http.*?' + re.escape(country['domain']) + '.*?)"'
-        matches = re.findall(rstring_latest, contents, re.IGNORECASE | re.MULTILINE)
-        all_urls = [x[1] for x in matches]
+        all_urls = extracted['latest_urls']
         _found = False
-        for _, url2 in matches:
+        for url2 in all_urls:
             if url2 not in ignore_urls:
-                contents = fetch_url(country['name'], url2)
+                # the result now depends on another page, so it can't be memoized by this page's hash
+                country.followed_urls = True
+                contents = fetch_url(country.name, url2)
                 if parse_country_contents(country, contents, ignore_urls=ignore_urls+all_urls, temp_url=url2):
                     _found = True
                     break
         
         if not _found:
             # didn't find additional URLs or anything interesting :(
-            country['classification'] = ANSWER_UNKNOWN
-            country['preformatted'] = []
+            country.classification = ANSWER_UNKNOWN
+            country.preformatted = []
             retval = False
     else:
         statuses = set()
         preformatted = set()
 
-        for _, question, answer in matches:
+        for question, answer in matches:
             answer = answer.split('Is a negative COVID-19 test (PCR and/or serology)', 1)[0]
             statuses.add(_parse_answer(answer, url=cur_url))
             preformatted.add(_preformat_answer(country, answer))
@@ -521,13 +1269,13 @@ def parse_country_contents(country, contents, ignore_urls=None, temp_url=None):
         else:
             statuses = list(statuses)[0] # prefer lower #'s because set() is unordered
         
-        country['classification'] = statuses
-        country['preformatted'] = list(preformatted)
+        country.classification = statuses
+        country.preformatted = sorted(preformatted) # sets come out in a different order in every process
 
     # parse the updated date
 
     update_date = None
-    matches = set(re.findall(r'<meta property="article:modified_time" content="(.*?)" \/>', contents, re.IGNORECASE))
+    matches = set(extracted['modified_times'])
     for match in matches:
         try:
             # fetch most recent date
@@ -535,194 +1283,373 @@ def parse_country_contents(country, contents, ignore_urls=None, temp_url=None):
             if (not update_date) or ts > update_date:
                 update_date = ts
         except:
-            logger.exception('Failed to parse match %r for country %r at URL %r' % (match, country['name'], country['url']))
+            logger.exception('Failed to parse match %r for country %r at URL %r' % (match, country.name, country.url))
 
-    country['last_changed'] = update_date
+    country.last_changed = update_date
 
     # parse the "test required" question
 
-    rstring_covid_test = r'(Is a negative COVID-19 test.*?required for entry\??)(.*?<\/li>)'
-    matches = re.findall(rstring_covid_test, contents, re.IGNORECASE | re.MULTILINE | re.DOTALL)
     answers = set()
     
-    for question, answer in matches:
+    for question, answer in extracted['covid_test']:
         a = _parse_covid_test_answer(question, answer, url=cur_url)
         answers.add(a)
 
     if TEST_REQUIRED_YES in answers:
-        country['test_required'] = TEST_REQUIRED_YES
+        country.test_required = TEST_REQUIRED_YES
     elif TEST_REQUIRED_NO in answers:
-        country['test_required'] = TEST_REQUIRED_NO
+        country.test_required = TEST_REQUIRED_NO
     else:
-        country['test_required'] = TEST_REQUIRED_UNKNOWN
+        country.test_required = TEST_REQUIRED_UNKNOWN
 
     # parse the "quarantine required" column
 
-    rstring_quarantine_required = r'(citizens +required +to +quarantine\??)(.*?<\/li>)'
-    matches = re.findall(rstring_quarantine_required, contents.replace('<span data-contrast="none">', '').replace('</span>', '').replace('&nbsp;', ' '), re.IGNORECASE | re.MULTILINE | re.DOTALL)
     answers = set()
 
-    for question, answer in matches:
+    for question, answer in extracted['quarantine_required']:
         answers.add(_parse_quarantine_required_answer(answer, url=cur_url))
 
     if QUARANTINE_REQUIRED_YES in answers:
-        country['quarantine_required'] = QUARANTINE_REQUIRED_YES
+        country.quarantine_required = QUARANTINE_REQUIRED_YES
     elif QUARANTINE_REQUIRED_NO in answers:
-        country['quarantine_required'] = QUARANTINE_REQUIRED_NO
+        country.quarantine_required = QUARANTINE_REQUIRED_NO
     else:
-        country['quarantine_required'] = QUARANTINE_REQUIRED_UNKNOWN
+        country.quarantine_required = QUARANTINE_REQUIRED_UNKNOWN
 
 
     return retval
 
 
+# parse results travel between processes and the memo table as
+# (classification, test_required, quarantine_required, preformatted, last_changed)
+def _get_parse_result(country):
+    return (country.classification, country.test_required, country.quarantine_required, tuple(country.preformatted), country.last_changed)
+
+
+def _apply_parse_result(country, result):
+    country.classification, country.test_required, country.quarantine_required, preformatted, country.last_changed = result
+    country.preformatted = list(preformatted)
+
+
+def _get_memo_key(country, filename):
+    h = hashlib.sha256('\0'.join([PARSER_VERSION, country.name, country.url, country.domain, '']).encode())
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _get_memoized(key):
+    c = database()
+    c.execute('SELECT `classification`, `test_required`, `quarantine_required`, `preformatted`, `last_changed` FROM `parse_cache` WHERE `key`=?', (key,))
+    row = c.fetchone()
+    c.close()
+    if row:
+        classification, test_required, quarantine_required, preformatted, last_changed = row
+        return (classification, test_required, quarantine_required, tuple(json.loads(preformatted)), last_changed)
+    return None
+
+
+def _memoize(key, result):
+    classification, test_required, quarantine_required, preformatted, last_changed = result
+    c = database()
+    c.execute('INSERT OR REPLACE INTO `parse_cache` (`key`, `parser_version`, `classification`, `preformatted`, `test_required`, `quarantine_required`, `last_changed`) VALUES (?, ?, ?, ?, ?, ?, ?)', (
+        key,
+        PARSER_VERSION,
+        classification,
+        json.dumps(preformatted),
+        test_required,
+        quarantine_required,
+        last_changed))
+    c.close()
+
+
+# runs in a parse worker process: (name, url, domain, filename) in, a compact
+# picklable (result, followed_urls, cache meta updates, cache stats, seconds) out
+def _parse_country_job(job):
+    name, url, domain, filename = job
+    country = records.CountryStatus(name, url=url, domain=domain)
+    _reload_cache_meta()
+    _cache_meta_updated.clear()
+    reset_cache_stats()
+
+    start = time.perf_counter()
+    parse_country_contents(country, filename=filename)
+    elapsed = time.perf_counter() - start
+    meta = _get_cache_meta()
+    return _get_parse_result(country), country.followed_urls, {u: meta[u] for u in _cache_meta_updated}, dict(CACHE_STATS), elapsed
+
+
+# workers start from a fresh interpreter, so they get this process's working
+# directory, config and logging here
+def _init_parse_worker(cwd, config, log) -> None:
+    os.chdir(cwd)
+    CONFIG.update(config)
+    if log:
+        setup_logging()
+
+
+_parse_pool = (None, None)
+
+
+# the pool outlives a run, so a resident daemon keeps its workers warm. workers
+# are never forked from this process: by the time a daemon parses, the API,
+# control socket and tweet threads are running, and a fork taken while one of
+# them holds a lock (metrics._lock, say) leaves that lock held forever in the child
+def _get_parse_pool(workers):
+    global _parse_pool
+    import multiprocessing
+
+    key = (workers, os.getcwd(), repr(CONFIG))
+    if _parse_pool[0] != key:
+        if _parse_pool[1]:
+            _parse_pool[1].shutdown()
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _parse_pool = (key, concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method),
+            initializer=_init_parse_worker, initargs=(os.getcwd(), dict(CONFIG), _logging_set_up)))
+    return _parse_pool[1]
+
+
+# parses the country files of a directory, serving unchanged pages from the memo
+# table. with workers > 1 the misses are parsed in a process pool; the results
+# are applied (and memoized) on this process, in directory order, either way.
+# returns the number of memo hits.
+def parse_countries(countries, workers=1, memo=True):
+    memo_hits = 0
+    jobs = list()
+    for country in countries:
+        key = _get_memo_key(country, country.filename) if memo else None
+        result = _get_memoized(key) if memo else None
+        if result:
+            _apply_parse_result(country, result)
+            memo_hits += 1
+        else:
+            jobs.append((country, key))
+        metrics.incr('parse_memo', result='hit' if result else 'miss', country=country.name)
+
+    if workers > 1 and len(jobs) > 1:
+        # workers read what this run fetched from disk, see _reload_cache_meta()
+        save_cache_meta()
+        outputs = list(_get_parse_pool(workers).map(_parse_country_job, [(country.name, country.url, country.domain, country.filename) for country, _ in jobs], chunksize=4))
+
+        for (country, key), (result, followed_urls, meta, stats, elapsed) in zip(jobs, outputs):
+            _apply_parse_result(country, result)
+            metrics.observe('parse', elapsed, country=country.name)
+            with _fetch_lock:
+                _get_cache_meta().update(meta)
+                for k, v in stats.items():
+                    CACHE_STATS[k] = CACHE_STATS.get(k, 0) + v
+            for k, v in stats.items():
+                if v:
+                    metrics.incr('page_cache', v, result=k, country=country.name)
+            if key and not followed_urls:
+                _memoize(key, result)
+    else:
+        for country, key in jobs:
+            with metrics.timer('parse', country=country.name):
+                parse_country_contents(country, filename=country.filename)
+            if key and not country.followed_urls:
+                _memoize(key, _get_parse_result(country))
+
+    for country in countries:
+        country.followed_urls = False
+
+    return memo_hits
+
+
 def handle_change(country, recent_row):
     outmsg = generate_change_text(country, recent_row)
     logger.debug('handle_change: country=%r, recent_row=%r, outmsg=%r' % (country, recent_row, outmsg))
     if outmsg:
         # generate tweet
         _tweet_outmsg = outmsg.strip().rstrip('.') + '.'
-        tweet_text = f'{_tweet_outmsg} For more info, see https://opencountrieslist.com/\n#{country["name"].replace(" ", "")} #traveling #travel #travelban'
+        tweet_text = f'{_tweet_outmsg} For more info, see https://opencountrieslist.com/\n#{country.name.replace(" ", "")} #traveling #travel #travelban'
         if len(tweet_text) > 280:
             logger.warning('Tweet %r is too long for the 280 length limit, skipping...' % tweet_text)
         else:
             TWEET_MSGS.append(tweet_text)
 
 
-def get_statuses():
-    directory = parse_directory()
-    for _, country in directory.items():
-        with open(country['filename'], 'r') as f:
-            contents = f.read()
-    
-        parse_country_contents(country, contents)
-        del country['filename']
-        del country['domain']
+# with record_slack (seconds), a country whose status didn't change only gets a
+# history row once its refresh interval, less record_slack, has passed since
+# its last one. the daemon wakes for the shortest interval in refresh-intervals,
+# and its pages aren't refetched before they expire anyway, so rows for every
+# other country on those wakes would only repeat the last one
+def get_statuses(parse_workers=None, record_slack=None):
+    if parse_workers is None:
+        # "parse-workers: 0" in config.yml uses every core
+        parse_workers = CONFIG.get('parse-workers', 1) or os.cpu_count()
+    reset_cache_stats()
+    with metrics.timer('stage', stage='parse_directory'):
+        directory = parse_directory()
+    with metrics.timer('stage', stage='parse_countries'):
+        memo_hits = parse_countries(list(directory.values()), workers=parse_workers)
+
+    save_cache_meta()
+    logger.info('Page cache: %(hit)d hits, %(revalidated)d revalidated, %(miss)d misses' % CACHE_STATS)
+    logger.info('Parse cache: %d/%d countries unchanged' % (memo_hits, len(directory)))
 
     # add stuff to db
-    for _, country in directory.items():
-        c = database()
+    now = int(time.time())
+    c = database()
 
+    # the latest known status of every country, plus the most recent status that
+    # differs from it, in one query (see _init_database)
+    with metrics.timer('query', query='latest_status'):
         c.execute(
-            r"SELECT * FROM ("
-                r"SELECT 'change', `unixts`, `classification`, `test_required`, `quarantine_required`"
-                r" FROM `countries`"
-                r" WHERE `name`=? AND (`classification`!=? OR `test_required`!=? OR `quarantine_required`!=?)"
-                r" ORDER BY `unixts` DESC"
-                r" LIMIT 1"
-            r") UNION ALL SELECT * FROM ("
-                r"SELECT 'recent', `unixts`, `classification`, `test_required`, `quarantine_required`"
-                r" FROM `countries`"
-                r" WHERE `name`=?"
-                r" ORDER BY `unixts` DESC"
-                r" LIMIT 1"
-            r")", (country['name'], country['classification'], country['test_required'], country['quarantine_required'], country['name']))
+            r"SELECT `name`, `unixts`, `classification`, `test_required`, `quarantine_required`,"
+                r" `changed_unixts`, `changed_classification`, `changed_test_required`, `changed_quarantine_required`"
+            r" FROM `latest_status`"
+        )
+        latest = {row[0]: row[1:] for row in c.fetchall()}
+
+    rows = list()
+    latest_rows = list()
+    for _, country in directory.items():
+        status = (country.classification, country.test_required, country.quarantine_required)
 
         change_row = None
         recent_row = None
-        for i in range(2):
-            row = c.fetchone()
-            if row:
-                # we found the most recent change in status.
-                row_type, unixts, old_classification, old_test_required, old_quarantine_required = row
-                if row_type == 'change':
-                    change_row = row
-                elif row_type == 'recent':
-                    recent_row = row
+        changed = None
+        record = True
+        if country.name in latest:
+            unixts, classification, test_required, quarantine_required, changed_unixts, *changed_status = latest[country.name]
+            recent_row = ('recent', unixts, classification, test_required, quarantine_required)
+            if (classification, test_required, quarantine_required) != status:
+                # the last row we stored is itself the most recent change
+                change_row = ('change',) + recent_row[1:]
+            elif changed_unixts is not None:
+                change_row = ('change', changed_unixts, *changed_status)
+            if record_slack is not None and (classification, test_required, quarantine_required) == status:
+                record = now - unixts >= get_refresh_interval(country.name) - record_slack
 
         if (change_row and recent_row) and (change_row[2] == recent_row[2] and change_row[3] == recent_row[3] and change_row[4] == recent_row[4]):
-            print(country)
+            print(country.to_dict())
             print(change_row)
             print(recent_row)
             # a country just changed status!
             row_type, unixts, old_classification, old_test_required, old_quarantine_required = change_row
-            logger.info('Change in status for country %r:\n* classification: %r -> %r\n* test_required: %r -> %r\n* quarantine_required: %r -> %r\n* unixts: %r -> %r' % (country['name'], old_classification, country['classification'], old_test_required, country['test_required'], old_quarantine_required, country['quarantine_required'], unixts, int(time.time())))
+            logger.info('Change in status for country %r:\n* classification: %r -> %r\n* test_required: %r -> %r\n* quarantine_required: %r -> %r\n* unixts: %r -> %r' % (country.name, old_classification, country.classification, old_test_required, country.test_required, old_quarantine_required, country.quarantine_required, unixts, now))
 
             handle_change(country, recent_row)
 
         if change_row:
             row_type, unixts, old_classification, old_test_required, old_quarantine_required = change_row
-            country['last_updated'] = unixts
-            country['old_data'] = {
+            country.last_updated = unixts
+            country.old_data = {
                 'classification': old_classification,
                 'test_required': old_test_required,
                 'quarantine_required': old_quarantine_required
             }
-        
-        c.execute("INSERT INTO `countries` (`unixts`, `abbreviation`, `name`, `url`, `classification`, `preformatted`, `test_required`, `quarantine_required`, `last_changed`) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
-            int(time.time()),
-            country['abbreviation'],
-            country['name'],
-            country['url'],
-            country['classification'],
-            '\n'.join(country['preformatted']),
-            country['test_required'],
-            country['quarantine_required'], # don't trust this btw
-            country['last_changed']))
-    
-    commit()
-
-    return list(directory.values())
 
+        if not record:
+            continue
+        rows.append((
+            now,
+            country.abbreviation,
+            country.name,
+            country.url,
+            country.classification,
+            '\n'.join(country.preformatted),
+            country.test_required,
+            country.quarantine_required, # don't trust this btw
+            country.last_changed))
+        latest_rows.append((country.name, now) + status + (change_row[1:] if change_row else (None, None, None, None)))
+
+    with metrics.timer('stage', stage='db_write'):
+        if _get_storage_layout(c) == 'full':
+            c.executemany("INSERT INTO `countries` (`unixts`, `abbreviation`, `name`, `url`, `classification`, `preformatted`, `test_required`, `quarantine_required`, `last_changed`) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        else:
+            _insert_dedup_rows(c, rows)
+        _refresh_daily_status_counts(c, now)
+        c.executemany("INSERT OR REPLACE INTO `latest_status` (`name`, `unixts`, `classification`, `test_required`, `quarantine_required`, `changed_unixts`, `changed_classification`, `changed_test_required`, `changed_quarantine_required`) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", latest_rows)
+        c.close()
+        commit()
+    metrics.incr('rows_written', len(rows), table='countries')
+    metrics.incr('rows_written', len(latest_rows), table='latest_status')
+
+    return [country.to_dict() for country in directory.values()]
+
+
+# the per-day histogram behind get_changes(), computed straight from history.
+# each country counts once per day, with the last status it had that day.
+# rows are (day, kind, value, count); pass start/end to only look at part of
+# history
+def _query_daily_status_counts(c, start=None, end=None):
+    where = ''
+    args = tuple()
+    if start is not None:
+        where = ' WHERE unixts >= ? AND unixts < ?'
+        args = (start, end)
 
-def get_changes():
-    changes = dict()
-
-    # classification
-    c = database()
     c.execute(
-        r"SELECT day, classification, COUNT(*) FROM ("
+        r"SELECT day, 'classification', classification, COUNT(*) FROM ("
             r" SELECT strftime('%m/%d/%Y', datetime(unixts, 'unixepoch')) as day, classification, MAX(unixts) AS NUM_OPEN"
-            r" FROM countries"
+            r" FROM countries" + where +
             r" GROUP BY name, day"
-        r") GROUP BY day, classification;"
+        r") GROUP BY day, classification;", args
     )
-    agg_change = dict()
-    while True:
-        row = c.fetchone()
-        if not row:
-            break
-        day, classification, num_countries = row
-        if day not in agg_change:
-            agg_change[day] = {
-                'classification': dict(zip(range(5+1), [None]*6)),
-                'quarantine_required': dict(zip(range(2+1), [None]*3))
-            }
-        agg_change[day]['classification'][int(classification)] = int(num_countries)
-    c.close()
+    rows = c.fetchall()
 
-    # quarantine_required
-    c = database()
     c.execute(
-        r"SELECT day, quarantine_required, COUNT(*) FROM ("
+        r"SELECT day, 'quarantine_required', quarantine_required, COUNT(*) FROM ("
             r" SELECT strftime('%m/%d/%Y', datetime(unixts, 'unixepoch')) as day, quarantine_required, MAX(unixts) AS NUM_OPEN"
-            r" FROM countries"
-            r" WHERE classification=5"
+            r" FROM countries" + (where + ' AND' if where else ' WHERE') + r" classification=5"
             r" GROUP BY name, day"
-        r") GROUP BY day, quarantine_required;"
+        r") GROUP BY day, quarantine_required;", args
     )
-    while True:
-        row = c.fetchone()
-        if not row:
-            break
-        day, quarantine_required, num_countries = row
-        if day not in agg_change:
-            agg_change[day] = {
-                'classification': dict(zip(range(5+1), [None]*6)),
-                'quarantine_required': dict(zip(range(2+1), [None]*3))
-            }
-        agg_change[day]['quarantine_required'][int(quarantine_required)] = int(num_countries)
+    return rows + c.fetchall()
+
+
+# recomputes the rollup rows of the (UTC) day unixts falls on
+def _refresh_daily_status_counts(c, unixts) -> None:
+    start = unixts - unixts % (60*60*24)
+    c.execute("DELETE FROM `daily_status_counts` WHERE `day`=?", (datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime('%m/%d/%Y'),))
+    c.executemany("INSERT INTO `daily_status_counts` (`day`, `kind`, `value`, `count`) VALUES (?, ?, ?, ?)", _query_daily_status_counts(c, start, start + 60*60*24))
+
+
+# regenerates daily_status_counts from the raw history, returning whether the
+# old rollup matched it
+def rebuild_daily_status_counts(c=None) -> bool:
+    cursor = c or database()
+    cursor.execute("SELECT `day`, `kind`, `value`, `count` FROM `daily_status_counts`")
+    old = set(cursor.fetchall())
+    new = _query_daily_status_counts(cursor)
+
+    cursor.execute("DELETE FROM `daily_status_counts`")
+    cursor.executemany("INSERT INTO `daily_status_counts` (`day`, `kind`, `value`, `count`) VALUES (?, ?, ?, ?)", new)
+    if not c:
+        commit()
+        cursor.close()
+
+    matched = old == set(new)
+    if not matched:
+        logger.warning('daily_status_counts did not match history: %d stale rows, %d missing rows' % (len(old - set(new)), len(set(new) - old)))
+    return matched
+
+
+def get_changes():
+    c = database()
+    with metrics.timer('query', query='daily_status_counts'):
+        c.execute("SELECT `day`, `kind`, `value`, `count` FROM `daily_status_counts` ORDER BY `kind`!='classification', `day`, `value`")
+        rows = c.fetchall()
     c.close()
-            
-    return agg_change
 
+    return records.changes_from_counts(rows)
 
-if __name__ == '__main__':
+
+# scrape, publish and tweet once. record_slack goes to get_statuses()
+def run(record_slack=None):
     OUTPUT_FILENAME = 'web/data.json'
-    statuses = get_statuses()
-    changes = get_changes()
-    with open(OUTPUT_FILENAME, 'w') as f:
-        f.write(json.dumps({
+    with metrics.timer('stage', stage='get_statuses'):
+        statuses = get_statuses(record_slack=record_slack)
+    with metrics.timer('stage', stage='get_changes'):
+        changes = get_changes()
+    if _api_server:
+        import api
+        api.update(statuses, changes)
+    with metrics.timer('stage', stage='serialize'):
+        output = {
             'time': int(time.time()),
             '_note': [
                 'Hey developer / hacker! You\'re more than welcome to use the data I collected and publish here. I just have a couple requests.',
@@ -733,20 +1660,211 @@ if __name__ == '__main__':
             ],
             'countries': statuses,
             'changes': changes
-        }, separators=(',', ':')))
-
-    sitemap.generate_sitemap()
-
+        }
+        data = publish.dump_json(output)
+    with metrics.timer('stage', stage='publish'):
+        # time is when the data last changed, so runs that change nothing leave the file be
+        publish.write_json_if_changed(OUTPUT_FILENAME, output, data)
+        publish.publish(statuses, changes)
+    metrics.incr('bytes_published', len(data))
+
+    with metrics.timer('stage', stage='render'):
+        import render
+        metrics.incr('pages_rendered', render.render(statuses))
+    with metrics.timer('stage', stage='sitemap'):
+        import sitemap
+        sitemap.generate_sitemap()
+    with metrics.timer('stage', stage='compress'):
+        compress.compress_tree()
+
+    # tweets only go into the outbox here; a dispatcher (see dispatch_tweets())
+    # sends them, so a burst of changes never holds up the refresh
     logger.debug('TWEET_MSGS: %r' % TWEET_MSGS)
     if TWEET_MSGS:
-        if not all([key in CONFIG for key in [
-            'api-key', 'api-secret', 'access-token', 'access-secret']]):
+        if not tweets.has_credentials(CONFIG):
             logger.warning('Skipping %d tweets as mandatory keys are missing from the config file.' % len(TWEET_MSGS))
         else:
-            auth = tweepy.OAuthHandler(CONFIG['api-key'], CONFIG['api-secret'])
-            auth.set_access_token(CONFIG['access-token'], CONFIG['access-secret'])
-            api = tweepy.API(auth, wait_on_rate_limit=True, wait_on_rate_limit_notify=True)
-            logger.info('Creating %d tweets...' % len(TWEET_MSGS))
-            for msg in TWEET_MSGS:
-                api.update_status(msg)
-    
+            c = database()
+            queued = tweets.enqueue(c, TWEET_MSGS, dedup_window=CONFIG.get('tweet-dedup-window', tweets.DEDUP_WINDOW))
+            c.close()
+            commit()
+            logger.info('Queued %d tweets' % queued)
+            metrics.incr('tweets_queued', queued)
+            _tweets_queued.set()
+
+    TWEET_MSGS.clear()
+
+
+_tweets_queued = threading.Event()
+_api_server = None # set by run_daemon(), see api.py
+
+
+# sends whatever is in the outbox. with drain it returns once the outbox is
+# empty, otherwise it keeps waiting for run() to queue more
+def dispatch_tweets(drain=True):
+    if not tweets.has_credentials(CONFIG):
+        logger.warning('Not dispatching tweets as mandatory keys are missing from the config file.')
+        return
+    tweets.dispatch_exclusive(CURRENT_DB, CONFIG, drain=drain, wake=_tweets_queued, max_attempts=CONFIG.get('tweet-max-attempts', tweets.MAX_ATTEMPTS))
+
+
+# one-shot runs hand the outbox to a detached "main.py --dispatch-tweets", so
+# the scraper itself can exit as soon as the data is published
+def spawn_tweet_dispatcher() -> None:
+    if not tweets.has_credentials(CONFIG):
+        return
+    c = database()
+    pending = tweets.count_pending(c)
+    c.close()
+    if pending:
+        import subprocess
+        logger.info('Starting a tweet dispatcher for %d queued tweets' % pending)
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--dispatch-tweets'], start_new_session=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+# run() with fresh metrics, written to metrics_filename afterwards (see metrics.dump)
+def run_instrumented(metrics_filename=None, profile_filename=None, record_slack=None):
+    metrics.reset()
+    profiler = None
+    if profile_filename:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with metrics.timer('stage', stage='run'):
+            run(record_slack)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_filename)
+            logger.info('Wrote profile to %s (inspect with "python -m pstats %s")' % (profile_filename, profile_filename))
+        if metrics_filename:
+            metrics.dump(metrics_filename)
+
+
+_run_now = threading.Event()
+CONTROL_SOCKET_TIMEOUT = 5 # seconds a control socket client gets to send its command
+
+
+# sets _run_now for every byte the SIGUSR1 handler writes to the pipe. the
+# handler can't set it itself: it runs on the main thread, which may be inside
+# _run_now.wait() holding the lock that set() needs
+def _watch_trigger_pipe(fd):
+    while os.read(fd, 64):
+        _run_now.set()
+
+
+def _serve_control_socket(path):
+    # "echo run | nc -U <path>" (or main.py --trigger <path>) refreshes right away
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(4)
+    while True:
+        conn, _ = server.accept()
+        # so a client that never sends anything can't hold up everyone after it
+        conn.settimeout(CONTROL_SOCKET_TIMEOUT)
+        with conn:
+            try:
+                if conn.recv(64).strip() == b'run':
+                    _run_now.set()
+                    conn.sendall(b'ok\n')
+                else:
+                    conn.sendall(b'unknown command\n')
+            except OSError as e:
+                logger.warning('Dropping control socket client: %r' % e)
+
+
+# stays resident and refreshes every refresh-interval seconds (give or take
+# refresh-jitter), or sooner when a country in refresh-intervals is due. the
+# interpreter, imports, HTTP session, parsers and database connection all stay
+# warm between runs, and queued tweets are sent from a background thread. a
+# country only gets a history row when its own interval is up or its status
+# changed (see get_statuses). SIGUSR1 or the control socket trigger a run immediately. with api_address
+# (HOST:PORT) it also serves the results of the latest run, see api.py
+def run_daemon(control_socket=None, metrics_filename=None, api_address=None):
+    read_fd, write_fd = os.pipe()
+    threading.Thread(target=_watch_trigger_pipe, args=(read_fd,), daemon=True).start()
+    signal.signal(signal.SIGUSR1, lambda *_: os.write(write_fd, b'\0'))
+    if control_socket:
+        threading.Thread(target=_serve_control_socket, args=(control_socket,), daemon=True).start()
+    if api_address:
+        global _api_server
+        import api # http.server is slow to import, so only when serving
+        # serve the last published data until the first run replaces it
+        if os.path.exists('web/data.json'):
+            api.load('web/data.json')
+        _api_server = api.start(*api.parse_address(api_address), max_age=CONFIG.get('api-max-age', api.MAX_AGE))
+    database().close() # the dispatcher has its own connection, but needs the outbox to exist
+    threading.Thread(target=dispatch_tweets, kwargs={'drain': False}, daemon=True).start()
+
+    while True:
+        started = time.time()
+        interval = min([get_refresh_interval()] + list((CONFIG.get('refresh-intervals') or dict()).values()))
+        try:
+            # countries not due on this wake (give or take half of one) get no history rows
+            run_instrumented(metrics_filename, record_slack=interval / 2)
+        except:
+            logger.exception('Refresh failed')
+
+        jitter = CONFIG.get('refresh-jitter', 0.1)
+        delay = interval * random.uniform(1 - jitter, 1 + jitter) - (time.time() - started)
+        logger.info('Next refresh in %d seconds' % max(delay, 0))
+        _run_now.wait(max(delay, 0))
+        _run_now.clear()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    setup_logging()
+    load_config()
+
+    parser = argparse.ArgumentParser(description='Scrapes U.S. embassy pages into web/data.json')
+    parser.add_argument('--migrate-storage', action='store_true', help='convert history.db to the dedup storage layout and exit')
+    parser.add_argument('--rebuild-rollup', action='store_true', help='regenerate daily_status_counts from history, verify it and exit')
+    parser.add_argument('--validate-change-text', action='store_true', help='check the precomputed change texts against the rules they were built from and exit')
+    parser.add_argument('--digest', metavar='DATE', help='print every status change since DATE (YYYY-MM-DD, UTC) and exit')
+    parser.add_argument('--daemon', action='store_true', help='stay resident and refresh on a schedule')
+    parser.add_argument('--control-socket', metavar='PATH', help='with --daemon, listen on this unix socket for "run" commands')
+    parser.add_argument('--api', metavar='HOST:PORT', help='with --daemon, serve the latest statuses and changes as a JSON API here')
+    parser.add_argument('--trigger', metavar='PATH', help='ask the daemon listening on this control socket to refresh now, and exit')
+    parser.add_argument('--metrics', metavar='FILE', help='write per-stage timings and counters here after every run (.json for JSON, else prometheus text)')
+    parser.add_argument('--profile', metavar='FILE', help='run once under cProfile and write the stats here')
+    parser.add_argument('--dispatch-tweets', action='store_true', help='send the queued tweets, rate limited, and exit once the outbox is empty')
+    args = parser.parse_args()
+
+    if args.migrate_storage:
+        migrate_to_dedup()
+        sys.exit(0)
+
+    if args.rebuild_rollup:
+        sys.exit(0 if rebuild_daily_status_counts() else 1)
+
+    if args.validate_change_text:
+        sys.exit(1 if validate_change_text() else 0)
+
+    if args.digest:
+        since = datetime.datetime.fromisoformat(args.digest).replace(tzinfo=datetime.timezone.utc)
+        for unixts, text in change_digest(start=int(since.timestamp())):
+            print('%s %s' % (datetime.datetime.fromtimestamp(unixts, datetime.timezone.utc).strftime('%Y-%m-%d %H:%M'), text))
+        sys.exit(0)
+
+    if args.dispatch_tweets:
+        database().close()
+        dispatch_tweets()
+        sys.exit(0)
+
+    if args.trigger:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(args.trigger)
+            sock.sendall(b'run\n')
+            print(sock.recv(64).decode().strip())
+        sys.exit(0)
+
+    if args.daemon:
+        run_daemon(control_socket=args.control_socket, metrics_filename=args.metrics, api_address=args.api)
+    else:
+        run_instrumented(args.metrics, args.profile)
+        spawn_tweet_dispatcher()
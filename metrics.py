@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import contextlib
+import json
+import threading
+import time
+
+import publish
+
+
+PREFIX = 'countryscrape_'
+
+_lock = threading.Lock()
+_counters = dict() # (name, labels) -> value
+_timers = dict() # (name, labels) -> [count, total seconds, max seconds]
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def incr(name, value=1, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        timer = _timers.setdefault(key, [0, 0.0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def to_json():
+    with _lock:
+        return {
+            'time': int(time.time()),
+            'counters': [dict(labels, name=name, value=value) for (name, labels), value in sorted(_counters.items())],
+            'timers': [dict(labels, name=name, count=count, seconds=total, max_seconds=longest) for (name, labels), (count, total, longest) in sorted(_timers.items())]
+        }
+
+
+def _labels(labels, **extra):
+    labels = list(labels) + sorted(extra.items())
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+
+
+def to_prometheus():
+    lines = list()
+    with _lock:
+        for name in sorted({name for name, _ in _counters}):
+            lines.append('# TYPE %s%s_total counter' % (PREFIX, name))
+            for (_name, labels), value in sorted(_counters.items()):
+                if _name == name:
+                    lines.append('%s%s_total%s %s' % (PREFIX, name, _labels(labels), value))
+
+        for name in sorted({name for name, _ in _timers}):
+            lines.append('# TYPE %s%s_seconds summary' % (PREFIX, name))
+            for (_name, labels), (count, total, _) in sorted(_timers.items()):
+                if _name == name:
+                    lines.append('%s%s_seconds_sum%s %f' % (PREFIX, name, _labels(labels), total))
+                    lines.append('%s%s_seconds_count%s %d' % (PREFIX, name, _labels(labels), count))
+    return '\n'.join(lines) + '\n'
+
+
+# filenames ending in .json get JSON, anything else the prometheus text format
+def dump(filename) -> None:
+    if filename.endswith('.json'):
+        data = json.dumps(to_json(), indent=1)
+    else:
+        data = to_prometheus()
+    publish.write_atomic(filename, data.encode())
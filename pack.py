@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+import db
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+# every page ever fetched, content addressed: each distinct page is stored once,
+# compressed, in append-only segment files (pages-000001.pack, ...). index.db
+# has a row per version of every url, from the first to the last fetch that
+# returned it (like country_states in history.db), pointing at the sha256 of
+# the page, and where each sha256's blob sits. nothing is ever overwritten, so
+# every snapshot of every page stays readable; "pack.py compact" repacks the
+# segments.
+#
+# a blob is HEADER (magic, codec, sha256, length) followed by the compressed
+# page, so segments can be checked (and walked) without the index
+
+PACK_DIR = 'data/pack'
+SEGMENT_SIZE = 64 * 1024 * 1024 # a new segment is started once the current one is this big
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 19
+MAGIC = b'PK'
+HEADER = struct.Struct('>2sB32sI')
+CODECS = {0: 'zlib', 1: 'zstd'}
+CODEC_IDS = {codec: codec_id for codec_id, codec in CODECS.items()}
+
+_SEGMENT_RE = re.compile(r'^pages-(\d{6})\.pack$')
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        if not zstandard:
+            raise RuntimeError('page is zstd compressed, but the zstandard module is not installed')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class PackStore:
+    def __init__(self, directory=PACK_DIR, codec=None):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.codec = codec or ('zstd' if zstandard else 'zlib')
+        self.conn = db.connect(os.path.join(self.directory, 'index.db'))
+        self._lock = threading.Lock()
+        c = self.conn.cursor()
+        c.execute(
+            'CREATE TABLE IF NOT EXISTS `blobs` ('
+                '`digest` VARCHAR(64) NOT NULL,'
+                '`segment` INT NOT NULL,'
+                '`offset` INT NOT NULL,'
+                '`length` INT NOT NULL,' # compressed, without the header
+                '`size` INT NOT NULL,' # uncompressed
+                '`codec` VARCHAR(8) NOT NULL,'
+                'PRIMARY KEY (`digest`)'
+            ');'
+        )
+        c.execute(
+            'CREATE TABLE IF NOT EXISTS `urls` ('
+                '`id` INTEGER PRIMARY KEY,'
+                '`url` VARCHAR(1000) NOT NULL UNIQUE'
+            ');'
+        )
+        c.execute(
+            'CREATE TABLE IF NOT EXISTS `pages` ('
+                '`url_id` INT NOT NULL,'
+                '`first_unixts` INT NOT NULL,'
+                '`last_unixts` INT NOT NULL,'
+                '`digest` VARCHAR(64) NOT NULL'
+            ');'
+        )
+        c.execute('CREATE INDEX IF NOT EXISTS `pages_url` ON `pages` (`url_id`, `first_unixts`)')
+        c.execute('CREATE INDEX IF NOT EXISTS `pages_digest` ON `pages` (`digest`)')
+        self.conn.commit()
+        c.close()
+
+    def _segment_filename(self, segment):
+        return os.path.join(self.directory, 'pages-%06d.pack' % segment)
+
+    def segments(self):
+        return sorted(int(match.group(1)) for match in map(_SEGMENT_RE.match, os.listdir(self.directory)) if match)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # held while segments are written, so processes can share a store
+    @contextlib.contextmanager
+    def _exclusive(self):
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    # appends blobs to the newest segment, or a new one once it is full. only
+    # call this inside _exclusive(). blobs is [(digest, compressed, size, codec)];
+    # returns their blobs rows
+    def _write(self, blobs, segment_size=SEGMENT_SIZE):
+        segments = self.segments()
+        segment = segments[-1] if segments else 1
+        rows = list()
+        f = open(self._segment_filename(segment), 'ab')
+        try:
+            for digest, compressed, size, codec in blobs:
+                if f.tell() and f.tell() + HEADER.size + len(compressed) > segment_size:
+                    f.close()
+                    segment += 1
+                    f = open(self._segment_filename(segment), 'ab')
+                offset = f.tell() + HEADER.size
+                f.write(HEADER.pack(MAGIC, CODEC_IDS[codec], bytes.fromhex(digest), len(compressed)))
+                f.write(compressed)
+                rows.append((digest, segment, offset, len(compressed), size, codec))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        return rows
+
+    def _read(self, segment, offset, length, codec):
+        with open(self._segment_filename(segment), 'rb') as f:
+            f.seek(offset)
+            return _decompress(f.read(length), codec)
+
+    def _url_id(self, c, url, create=True):
+        c.execute('SELECT `id` FROM `urls` WHERE `url`=?', (url,))
+        row = c.fetchone()
+        if row:
+            return row[0]
+        if create:
+            c.execute('INSERT INTO `urls` (`url`) VALUES (?)', (url,))
+            return c.lastrowid
+        return None
+
+    # extends the newest version of url to fetched if it is digest, otherwise
+    # starts a new version. call with self._lock held
+    def _record(self, c, url, digest, fetched):
+        url_id = self._url_id(c, url)
+        c.execute('SELECT rowid, `digest` FROM `pages` WHERE `url_id`=? ORDER BY `first_unixts` DESC LIMIT 1', (url_id,))
+        row = c.fetchone()
+        if row and row[1] == digest:
+            c.execute('UPDATE `pages` SET `last_unixts`=MAX(`last_unixts`, ?), `first_unixts`=MIN(`first_unixts`, ?) WHERE rowid=?', (fetched, fetched, row[0]))
+        else:
+            c.execute('INSERT INTO `pages` (`url_id`, `first_unixts`, `last_unixts`, `digest`) VALUES (?, ?, ?, ?)', (url_id, fetched, fetched, digest))
+
+    # stores one fetch of url. returns the sha256 of data
+    def put(self, url, data: bytes, fetched=None) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        fetched = int(time.time()) if fetched is None else int(fetched)
+        with self._lock, self._exclusive():
+            c = self.conn.cursor()
+            c.execute('SELECT 1 FROM `blobs` WHERE `digest`=?', (digest,))
+            if not c.fetchone():
+                c.executemany('INSERT INTO `blobs` (`digest`, `segment`, `offset`, `length`, `size`, `codec`) VALUES (?, ?, ?, ?, ?, ?)',
+                    self._write([(digest, _compress(data, self.codec), len(data), self.codec)]))
+            self._record(c, url, digest, fetched)
+            self.conn.commit()
+            c.close()
+        return digest
+
+    # records that url was fetched again and still was digest
+    def touch(self, url, digest, fetched=None) -> None:
+        fetched = int(time.time()) if fetched is None else int(fetched)
+        with self._lock:
+            c = self.conn.cursor()
+            self._record(c, url, digest, fetched)
+            self.conn.commit()
+            c.close()
+
+    def get(self, digest) -> bytes:
+        with self._lock:
+            row = self.conn.execute('SELECT `segment`, `offset`, `length`, `codec` FROM `blobs` WHERE `digest`=?', (digest,)).fetchone()
+        if not row:
+            raise KeyError(digest)
+        return self._read(*row)
+
+    # (fetched_unixts, digest) of the newest fetch of url at or before unixts, or
+    # None. fetched_unixts is unixts when the version was still current then
+    def latest(self, url, unixts=2**62):
+        with self._lock:
+            c = self.conn.cursor()
+            url_id = self._url_id(c, url, create=False)
+            c.execute('SELECT MIN(`last_unixts`, ?), `digest` FROM `pages` WHERE `url_id`=? AND `first_unixts`<=? ORDER BY `first_unixts` DESC LIMIT 1', (unixts, url_id, unixts))
+            row = c.fetchone()
+            c.close()
+        return tuple(row) if row else None
+
+    # [(first fetched unixts, last fetched unixts, digest)] of every version of url, oldest first
+    def history(self, url):
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute('SELECT `first_unixts`, `last_unixts`, `digest` FROM `pages` WHERE `url_id`=? ORDER BY `first_unixts`', (self._url_id(c, url, create=False),))
+            rows = [tuple(row) for row in c.fetchall()]
+            c.close()
+        return rows
+
+    def stats(self):
+        with self._lock:
+            c = self.conn.cursor()
+            c.execute('SELECT COUNT(*), COUNT(DISTINCT `url_id`) FROM `pages`')
+            versions, urls = c.fetchone()
+            c.execute('SELECT COUNT(*), COALESCE(SUM(`size`), 0), COALESCE(SUM(`length`), 0) FROM `blobs`')
+            blobs, size, length = c.fetchone()
+            c.execute('SELECT COALESCE(SUM(`blobs`.`size`), 0) FROM `pages` JOIN `blobs` ON `blobs`.`digest`=`pages`.`digest`')
+            versions_size = c.fetchone()[0]
+            c.close()
+        segments = self.segments()
+        return {
+            'urls': urls,
+            'versions': versions,
+            'blobs': blobs,
+            'versions_bytes': versions_size, # what a file per version would take
+            'unique_bytes': size,
+            'compressed_bytes': length,
+            'segments': len(segments),
+            'segment_bytes': sum(os.path.getsize(self._segment_filename(segment)) for segment in segments)
+        }
+
+    # reads every blob back and checks its header and sha256. returns the digests that failed
+    def verify(self):
+        with self._lock:
+            rows = self.conn.execute('SELECT `digest`, `segment`, `offset`, `length`, `codec` FROM `blobs` ORDER BY `segment`, `offset`').fetchall()
+        bad = list()
+        for digest, segment, offset, length, codec in rows:
+            try:
+                with open(self._segment_filename(segment), 'rb') as f:
+                    f.seek(offset - HEADER.size)
+                    magic, codec_id, raw_digest, raw_length = HEADER.unpack(f.read(HEADER.size))
+                    data = _decompress(f.read(length), codec)
+                ok = magic == MAGIC and CODECS.get(codec_id) == codec and raw_digest.hex() == digest and raw_length == length and hashlib.sha256(data).hexdigest() == digest
+            except (OSError, zlib.error, struct.error, RuntimeError) as e:
+                logger.warning('Blob %s is unreadable: %s' % (digest, e))
+                ok = False
+            if not ok:
+                bad.append(digest)
+        return bad
+
+    # rewrites every blob still referenced by a version into fresh segments,
+    # grouped by url so a page's versions sit together, recompressed with
+    # self.codec, and deletes the old segments. with drop_before, versions last
+    # fetched before that are forgotten first (the newest version of every url
+    # is always kept). returns (bytes before, bytes after)
+    def compact(self, drop_before=None, segment_size=SEGMENT_SIZE):
+        with self._lock, self._exclusive():
+            c = self.conn.cursor()
+            if drop_before is not None:
+                c.execute(
+                    'DELETE FROM `pages` WHERE `last_unixts`<? AND `first_unixts`<'
+                    '(SELECT MAX(`first_unixts`) FROM `pages` AS `newest` WHERE `newest`.`url_id`=`pages`.`url_id`)', (int(drop_before),))
+                logger.info('Dropped %d versions from before %d' % (c.rowcount, drop_before))
+            c.execute('DELETE FROM `blobs` WHERE `digest` NOT IN (SELECT `digest` FROM `pages`)')
+            self.conn.commit()
+
+            old_segments = self.segments()
+            before = sum(os.path.getsize(self._segment_filename(segment)) for segment in old_segments)
+            c.execute(
+                'SELECT `blobs`.`digest`, `segment`, `offset`, `length`, `codec` FROM `blobs`'
+                ' JOIN (SELECT `digest`, MIN(`url_id`) AS `url_id`, MIN(`first_unixts`) AS `first` FROM `pages` GROUP BY `digest`) AS `first_fetch` ON `first_fetch`.`digest`=`blobs`.`digest`'
+                ' ORDER BY `url_id`, `first`')
+            rows = c.fetchall()
+
+            # new segments are numbered after the old ones and only replace
+            # them once the index points at them, so a crash leaves a usable store
+            open(self._segment_filename((old_segments[-1] if old_segments else 0) + 1), 'ab').close()
+            for i in range(0, len(rows), 256):
+                batch = list()
+                for digest, segment, offset, length, codec in rows[i:i + 256]:
+                    data = self._read(segment, offset, length, codec)
+                    batch.append((digest, _compress(data, self.codec), len(data), self.codec))
+                c.executemany('UPDATE `blobs` SET `segment`=?, `offset`=?, `length`=?, `size`=?, `codec`=? WHERE `digest`=?',
+                    [(segment, offset, length, size, codec, digest) for digest, segment, offset, length, size, codec in self._write(batch, segment_size)])
+            self.conn.commit()
+            c.close()
+
+            for segment in old_segments:
+                os.unlink(self._segment_filename(segment))
+            self.conn.execute('VACUUM')
+            after = sum(os.path.getsize(self._segment_filename(segment)) for segment in self.segments())
+        return before, after
+
+if __name__ == '__main__':
+    import argparse
+    import datetime
+    import sys
+
+    def timestamp(value):
+        if value.isdigit():
+            return int(value)
+        return int(datetime.datetime.fromisoformat(value).replace(tzinfo=datetime.timezone.utc).timestamp())
+
+    parser = argparse.ArgumentParser(description='Inspect and maintain the page pack store')
+    parser.add_argument('--directory', default=PACK_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help='sizes and counts')
+    subparsers.add_parser('verify', help='read back and check every blob')
+    p = subparsers.add_parser('compact', help='repack the segments, dropping blobs nothing refers to')
+    p.add_argument('--drop-before', type=timestamp, help='first forget versions last fetched before this (unix timestamp or ISO date), except the newest of each url')
+    p = subparsers.add_parser('history', help='every version of a url')
+    p.add_argument('url')
+    p = subparsers.add_parser('cat', help='print a page as it was fetched at a time')
+    p.add_argument('url')
+    p.add_argument('--at', type=timestamp, default=2**62)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = PackStore(args.directory)
+    if args.command == 'stats':
+        for key, value in store.stats().items():
+            print('%-16s %d' % (key, value))
+    elif args.command == 'verify':
+        bad = store.verify()
+        print('%d bad blobs' % len(bad))
+        sys.exit(1 if bad else 0)
+    elif args.command == 'compact':
+        before, after = store.compact(args.drop_before)
+        print('Compacted %d bytes into %d' % (before, after))
+    elif args.command == 'history':
+        for first, last, digest in store.history(args.url):
+            print(datetime.datetime.fromtimestamp(first, datetime.timezone.utc).isoformat(), datetime.datetime.fromtimestamp(last, datetime.timezone.utc).isoformat(), digest)
+    else:
+        latest = store.latest(args.url, args.at)
+        if not latest:
+            sys.exit('%r was never fetched' % args.url)
+        sys.stdout.buffer.write(store.get(latest[1]))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import unicodedata
+
+
+PUBLISH_DIR = 'web/data'
+
+
+def write_atomic(filename, data: bytes) -> None:
+    # write next to the target and rename over it, so readers never see half a file
+    directory = os.path.dirname(filename) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, filename)
+    except:
+        os.unlink(tmp)
+        raise
+
+
+def write_if_changed(filename, data: bytes) -> bool:
+    try:
+        with open(filename, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+
+    write_atomic(filename, data)
+    return True
+
+
+# compact json, the way every published file and api response is encoded
+def dump_json(obj) -> bytes:
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+# write_if_changed() for a json object with a 'time' field: a file that only
+# differs in its time is left alone, so time stays when the contents last
+# changed and an unchanged run doesn't rewrite (and recompress) it. data is
+# dump_json(obj), if the caller has it already
+def write_json_if_changed(filename, obj, data=None) -> bool:
+    data = dump_json(obj) if data is None else data
+    try:
+        with open(filename, 'rb') as f:
+            if dump_json(dict(json.loads(f.read()), time=obj['time'])) == data:
+                return False
+    except (FileNotFoundError, ValueError):
+        pass
+
+    write_atomic(filename, data)
+    return True
+
+
+# "Côte d'Ivoire" -> "cote-d-ivoire", for file names and urls
+def slugify(name):
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+# the yyyy-mm a get_changes() day ('%m/%d/%Y') falls in
+def month_of(day):
+    month, _, year = day.split('/')
+    return '%s-%s' % (year, month)
+
+
+# writes web/data/manifest.json, one web/data/countries/<slug>.json per country
+# and one web/data/changes/<yyyy-mm>.json per month of changes. every entry in
+# the manifest carries the sha256 of its file and a hash-versioned url, so
+# clients can cache shards forever and only refetch the ones whose hash moved.
+# shards are only rewritten when their contents change.
+def publish(statuses, changes, directory=PUBLISH_DIR):
+    manifest = {
+        'time': int(time.time()),
+        'countries': dict(),
+        'changes': dict()
+    }
+    written = 0
+
+    def add(section, key, path, data):
+        nonlocal written
+        if write_if_changed(os.path.join(directory, path), data):
+            written += 1
+        digest = hashlib.sha256(data).hexdigest()
+        manifest[section][key] = {
+            'path': path,
+            'sha256': digest,
+            'url': '%s?v=%s' % (path, digest[:16])
+        }
+
+    for country in statuses:
+        add('countries', country['name'], 'countries/%s.json' % slugify(country['name']), dump_json(country))
+
+    months = dict()
+    for day, counts in changes.items():
+        months.setdefault(month_of(day), dict())[day] = counts
+    for month, days in sorted(months.items()):
+        add('changes', month, 'changes/%s.json' % month, dump_json(days))
+
+    # drop shards of countries that disappeared from the directory
+    published = {entry['path'] for section in ('countries', 'changes') for entry in manifest[section].values()}
+    for section in ('countries', 'changes'):
+        path = os.path.join(directory, section)
+        for name in os.listdir(path) if os.path.isdir(path) else []:
+            if '%s/%s' % (section, name) not in published:
+                os.unlink(os.path.join(path, name))
+
+    write_json_if_changed(os.path.join(directory, 'manifest.json'), manifest)
+    return written
+
+
+if __name__ == '__main__':
+    # re-shard an existing web/data.json
+    with open('web/data.json', 'r') as f:
+        data = json.loads(f.read())
+    print('Wrote %d changed files' % publish(data['countries'], data['changes']))
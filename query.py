@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import collections
+import heapq
+
+import db
+
+
+# range queries over history.db that answer from the indexes instead of scanning
+# history, and stream their rows. every function takes a cursor from
+# main.database() (or any connection to a history.db, see db.connect) and works on both
+# storage layouts (see main._get_storage_layout)
+
+Status = collections.namedtuple('Status', ['unixts', 'name', 'classification', 'test_required', 'quarantine_required'])
+Transition = collections.namedtuple('Transition', ['unixts', 'name', 'old', 'new']) # old is None the first time a country shows up
+
+BATCH = 1000
+
+
+def _layout(c):
+    c.execute("SELECT `type` FROM `sqlite_master` WHERE `name`='countries'")
+    row = c.fetchone()
+    return 'full' if row and row[0] == 'table' else 'dedup'
+
+
+def _stream(c, sql, args=()):
+    c.execute(sql, args)
+    while True:
+        rows = c.fetchmany(BATCH)
+        if not rows:
+            return
+        yield from rows
+
+
+def names(c):
+    c.execute('SELECT `name` FROM `latest_status` ORDER BY `name`')
+    return [row[0] for row in c.fetchall()]
+
+
+# every observation of a country with start <= unixts < end, oldest first
+def country_history(c, name, start=0, end=2**62):
+    if _layout(c) == 'full':
+        rows = _stream(c,
+            'SELECT `unixts`, `classification`, `test_required`, `quarantine_required` FROM `countries`'
+            ' WHERE `name`=? AND `unixts`>=? AND `unixts`<? ORDER BY `unixts`', (name, start, end))
+    else:
+        rows = _stream(c,
+            'SELECT `observations`.`unixts`, `classification`, `test_required`, `quarantine_required` FROM `country_states`'
+            ' JOIN `observations` ON `observations`.`state_id`=`country_states`.`id`'
+            ' WHERE `name`=? AND `last_unixts`>=? AND `first_unixts`<? AND `observations`.`unixts`>=? AND `observations`.`unixts`<?'
+            ' ORDER BY `observations`.`unixts`', (name, start, end, start, end))
+    for unixts, classification, test_required, quarantine_required in rows:
+        yield Status(unixts, name, classification, test_required, quarantine_required)
+
+
+# the newest status of every country observed at or before unixts
+def snapshot(c, unixts):
+    layout = _layout(c)
+    for name in names(c):
+        if layout == 'full':
+            c.execute(
+                'SELECT `unixts`, `classification`, `test_required`, `quarantine_required` FROM `countries`'
+                ' WHERE `name`=? AND `unixts`<=? ORDER BY `unixts` DESC LIMIT 1', (name, unixts))
+        else:
+            c.execute(
+                'SELECT (SELECT MAX(`unixts`) FROM `observations` WHERE `state_id`=`country_states`.`id` AND `unixts`<=?), `classification`, `test_required`, `quarantine_required` FROM `country_states`'
+                ' WHERE `name`=? AND `first_unixts`<=? ORDER BY `id` DESC LIMIT 1', (unixts, name, unixts))
+        row = c.fetchone()
+        if row:
+            yield Status(row[0], name, *row[1:])
+
+
+def _status(row):
+    return tuple(row[-3:])
+
+
+def _full_transitions(c, name, start, end):
+    # the status going into the window, then every change inside it
+    cursor = c.connection.cursor()
+    cursor.execute(
+        'SELECT `classification`, `test_required`, `quarantine_required` FROM `countries`'
+        ' WHERE `name`=? AND `unixts`<? ORDER BY `unixts` DESC LIMIT 1', (name, start))
+    previous = cursor.fetchone()
+    for row in _stream(cursor,
+            'SELECT `unixts`, `classification`, `test_required`, `quarantine_required` FROM `countries`'
+            ' WHERE `name`=? AND `unixts`>=? AND `unixts`<? ORDER BY `unixts`', (name, start, end)):
+        if _status(row) != previous:
+            yield Transition(row[0], name, previous, _status(row))
+        previous = _status(row)
+    cursor.close()
+
+
+# every change of (classification, test_required, quarantine_required) with
+# start <= unixts < end, oldest first
+def transitions(c, start=0, end=2**62):
+    if _layout(c) == 'full':
+        # one index range per country, merged by time
+        yield from heapq.merge(*[_full_transitions(c, name, start, end) for name in names(c)], key=lambda transition: (transition.unixts, transition.name))
+        return
+
+    # in the dedup layout a new country_states row starts at every change, so
+    # only the rows starting inside the window (and the one before each) are read
+    previous = dict()
+    lookup = c.connection.cursor()
+    for state_id, name, unixts, *status in _stream(c,
+            'SELECT `id`, `name`, `first_unixts`, `classification`, `test_required`, `quarantine_required` FROM `country_states`'
+            ' WHERE `first_unixts`>=? AND `first_unixts`<? ORDER BY `first_unixts`, `name`', (start, end)):
+        if name not in previous:
+            lookup.execute(
+                'SELECT `classification`, `test_required`, `quarantine_required` FROM `country_states`'
+                ' WHERE `name`=? AND `id`<? ORDER BY `id` DESC LIMIT 1', (name, state_id))
+            row = lookup.fetchone()
+            previous[name] = tuple(row) if row else None
+        status = tuple(status)
+        # states also start when only the text or url moved
+        if status != previous[name]:
+            yield Transition(unixts, name, previous[name], status)
+        previous[name] = status
+    lookup.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    import datetime
+    import json
+
+    def timestamp(value):
+        if value.isdigit():
+            return int(value)
+        return int(datetime.datetime.fromisoformat(value).replace(tzinfo=datetime.timezone.utc).timestamp())
+
+    parser = argparse.ArgumentParser(description='Query history.db; times are unix timestamps or ISO dates (UTC)')
+    parser.add_argument('--database', default='history.db')
+    subparsers = parser.add_subparsers(dest='query', required=True)
+    p = subparsers.add_parser('history', help='every observation of one country')
+    p.add_argument('name')
+    p.add_argument('--start', type=timestamp, default=0)
+    p.add_argument('--end', type=timestamp, default=2**62)
+    p = subparsers.add_parser('transitions', help='every status change in a window')
+    p.add_argument('--start', type=timestamp, default=0)
+    p.add_argument('--end', type=timestamp, default=2**62)
+    p = subparsers.add_parser('snapshot', help='the status of every country as of a time')
+    p.add_argument('at', type=timestamp)
+    args = parser.parse_args()
+
+    c = db.connect(args.database, read_only=True).cursor()
+    if args.query == 'history':
+        rows = country_history(c, args.name, args.start, args.end)
+    elif args.query == 'transitions':
+        rows = transitions(c, args.start, args.end)
+    else:
+        rows = snapshot(c, args.at)
+    for row in rows:
+        print(json.dumps(row._asdict()))
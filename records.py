@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import array
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# one country as it moves through the pipeline. parse_directory() fills in where
+# to find it, parse_country_contents() its status and get_statuses() how it
+# changed. to_dict() is what ends up in web/data.json
+class CountryStatus:
+    __slots__ = ('name', 'abbreviation', 'url', 'domain', 'filename', 'classification', 'preformatted',
+        'test_required', 'quarantine_required', 'last_changed', 'last_updated', 'old_data', 'followed_urls')
+
+    def __init__(self, name, abbreviation=None, url=None, domain=None, filename=None):
+        self.name = name
+        self.abbreviation = abbreviation
+        self.url = url
+        self.domain = domain
+        self.filename = filename
+        self.classification = None
+        self.preformatted = None
+        self.test_required = None
+        self.quarantine_required = None
+        self.last_changed = None
+        self.last_updated = None
+        self.old_data = None
+        self.followed_urls = False # the parse depended on pages other than filename
+
+    def copy(self):
+        other = CountryStatus.__new__(CountryStatus)
+        for key in self.__slots__:
+            setattr(other, key, getattr(self, key))
+        return other
+
+    def to_dict(self):
+        out = {
+            'name': self.name,
+            'abbreviation': self.abbreviation,
+            'url': self.url,
+            'classification': self.classification,
+            'preformatted': self.preformatted,
+            'test_required': self.test_required,
+            'quarantine_required': self.quarantine_required,
+            'last_changed': self.last_changed
+        }
+        if self.last_updated is not None:
+            out['last_updated'] = self.last_updated
+            out['old_data'] = self.old_data
+        return out
+
+    def __repr__(self):
+        return 'CountryStatus(%s)' % ', '.join('%s=%r' % (key, getattr(self, key)) for key in self.__slots__)
+
+
+# get_changes() output from (day, kind, value, count) rows
+def changes_from_counts(rows):
+    agg_change = dict()
+    for day, kind, value, num_countries in rows:
+        if day not in agg_change:
+            agg_change[day] = {
+                'classification': dict(zip(range(5+1), [None]*6)),
+                'quarantine_required': dict(zip(range(2+1), [None]*3))
+            }
+        agg_change[day][kind][int(value)] = int(num_countries)
+    return agg_change
+
+
+# (unixts, name, classification, test_required, quarantine_required) history
+# rows held as one typed array per column, with names interned to small ints:
+# about 16 bytes a row instead of the ~200 a tuple of python objects takes
+class StatusHistory:
+    def __init__(self):
+        self.names = list()
+        self._name_ids = dict()
+        self.unixts = array.array('q')
+        self.name_id = array.array('H')
+        self.classification = array.array('b')
+        self.test_required = array.array('b')
+        self.quarantine_required = array.array('b')
+
+    def __len__(self):
+        return len(self.unixts)
+
+    def _intern(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def append(self, unixts, name, classification, test_required, quarantine_required) -> None:
+        self.unixts.append(unixts)
+        self.name_id.append(self._intern(name))
+        self.classification.append(classification)
+        self.test_required.append(test_required)
+        self.quarantine_required.append(quarantine_required)
+
+    # reads the countries table (or view) of a history.db cursor, oldest first
+    @classmethod
+    def load(cls, c, start=None, end=None, batch=10000):
+        history = cls()
+        where = ''
+        args = tuple()
+        if start is not None:
+            where = ' WHERE `unixts` >= ? AND `unixts` < ?'
+            args = (start, end)
+        c.execute("SELECT `unixts`, `name`, `classification`, `test_required`, `quarantine_required` FROM `countries`" + where + " ORDER BY `unixts`", args)
+        while True:
+            rows = c.fetchmany(batch)
+            if not rows:
+                break
+            for row in rows:
+                history.append(*row)
+        return history
+
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column) for column in (self.unixts, self.name_id, self.classification, self.test_required, self.quarantine_required))
+
+    # the same (day, kind, value, count) rows main._query_daily_status_counts()
+    # gets from sqlite: each country counts once per UTC day, with the last
+    # status it had that day. like the sql, quarantine_required is counted from
+    # the last row of the day that was open (classification 5), even if the
+    # country closed later that day
+    def daily_status_counts(self):
+        last = dict() # (day number, name id) -> row index
+        last_open = dict()
+        unixts = self.unixts
+        name_id = self.name_id
+        classification = self.classification
+        for i in range(len(unixts)):
+            key = (unixts[i] // (60*60*24), name_id[i])
+            j = last.get(key)
+            if j is None or unixts[i] >= unixts[j]:
+                last[key] = i
+            if classification[i] == 5:
+                j = last_open.get(key)
+                if j is None or unixts[i] >= unixts[j]:
+                    last_open[key] = i
+
+        counts = dict()
+        for (day, _), i in last.items():
+            key = (day, 'classification', classification[i])
+            counts[key] = counts.get(key, 0) + 1
+        for (day, _), i in last_open.items():
+            key = (day, 'quarantine_required', self.quarantine_required[i])
+            counts[key] = counts.get(key, 0) + 1
+
+        days = dict()
+        rows = list()
+        for (day, kind, value), count in counts.items():
+            if day not in days:
+                days[day] = datetime.datetime.fromtimestamp(day * 60*60*24, datetime.timezone.utc).strftime('%m/%d/%Y')
+            rows.append((days[day], kind, value, count))
+        return rows
+
+    def get_changes(self):
+        return changes_from_counts(sorted(self.daily_status_counts(), key=lambda row: (row[1] != 'classification', row[0], row[2])))
+
+    # the columns as numpy arrays sharing the same memory, for heavier analytics
+    def to_numpy(self):
+        if not numpy:
+            raise RuntimeError('numpy is not installed')
+        return {
+            'unixts': numpy.frombuffer(self.unixts, dtype=numpy.int64),
+            'name_id': numpy.frombuffer(self.name_id, dtype=numpy.uint16),
+            'classification': numpy.frombuffer(self.classification, dtype=numpy.int8),
+            'test_required': numpy.frombuffer(self.test_required, dtype=numpy.int8),
+            'quarantine_required': numpy.frombuffer(self.quarantine_required, dtype=numpy.int8)
+        }
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+import datetime
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import time
+
+import publish
+
+
+logger = logging.getLogger(__name__)
+
+# renders the statuses list into static html. web/index.template.html is the
+# template: the country rows, summary counts and loading overlay go between its
+# <!-- render:NAME --> and <!-- /render:NAME --> markers, and the result is
+# written to web/index.html, the page the web server serves. every country also
+# gets a page of its own under web/countries/. both outputs are untracked, so
+# the deploy checkout stays clean for git pull. browsers get content without
+# waiting on data.json, and main.js only adds sorting (plus the map and chart)
+# on top.
+#
+# nothing is rendered unless its input moved: the rendered index's markers
+# carry the hash of the template and data they were rendered from, and each
+# country page's hash and the time it last changed are kept in STATE_FILENAME,
+# which sitemap.py reads for lastmod
+
+SITE_URL = 'https://opencountrieslist.com/'
+INDEX_TEMPLATE = 'web/index.template.html'
+INDEX_FILENAME = 'web/index.html'
+PAGES_DIR = 'web/countries'
+STATE_FILENAME = 'data/render-state.json' # slug -> {name, sha256, modified}
+
+# the same classes and texts main.js uses, keyed by status.
+# test_required and quarantine_required are -1 for closed countries
+CLASSIFICATION_CELLS = {
+    0: ('status-unknown', 'UNKNOWN'),
+    1: ('status-moreinfo', 'SEE URL'),
+    2: ('status-no', 'CLOSED'),
+    3: ('status-rarely', 'MOSTLY CLOSED'),
+    4: ('status-sometimes', 'PARTIALLY OPEN'),
+    5: ('status-yes', 'OPEN')
+}
+REQUIRED_CELLS = {
+    -1: ('status-no', ''),
+    0: ('status-unknown', 'UNKNOWN'),
+    1: ('status-no', 'REQUIRED'),
+    2: ('status-yes', 'NOT REQUIRED')
+}
+TOOLTIP_COLORS = {
+    2: ('color-red', 'color-red-light'),
+    3: ('color-red', 'color-red-light'),
+    4: ('color-orange', 'color-orange-light'),
+    5: ('color-green', 'color-green-light')
+}
+ABBREVIATIONS = {'CHINA': 'CN'}
+
+ROW_TEMPLATE = '<tr><td>%(abbreviation)s</td><td><a rel="noopener noreferer" href="%(url)s">%(name)s</a></td>%(classification)s%(quarantine_required)s%(test_required)s%(last_changed)s</tr>'
+SUMMARY_TEMPLATE = '<p id="summary">Of the %(total)d countries we track, <b class="color-green">%(open)d are open</b>, <b class="color-orange">%(partially_open)d partially open</b> and <b class="color-red">%(closed)d closed or mostly closed</b>; %(unclear)d need a look at their embassy\'s page. Of the open and partially open ones, %(quarantine_required)d require a quarantine on arrival and %(test_required)d a COVID-19 test.</p>'
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+    <head>
+        <title>Can United States travelers visit %(name)s?</title>
+        <meta name="description" content="Whether %(name)s is open to United States citizens, and if a quarantine or COVID-19 test is required">
+        <link rel="canonical" href="%(canonical)s">
+        <meta charset="utf-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1, shrink-to-fit=no">
+        <link rel="stylesheet" href="../lib/bootstrap.min.css">
+        <link href="../styles.css" rel="stylesheet">
+        <meta name="theme-color" content="#f5f5f5">
+        <link rel="icon" href="../favicon.png">
+    </head>
+    <body>
+        <div class="container">
+            <div class="row pt-3 pb-3">
+                <div class="col-12 pb-3">
+                    <h1>Can United States travelers visit %(name)s?</h1>
+                </div>
+                <div class="col-12">
+                    <table class="table">
+                        <tbody>
+                            <tr><th>Open to Travel</th>%(classification)s</tr>
+                            <tr><th>Quarantine</th>%(quarantine_required)s</tr>
+                            <tr><th>COVID Test</th>%(test_required)s</tr>
+                            <tr><th>Last Changed</th>%(last_changed)s</tr>
+                        </tbody>
+                    </table>
+                </div>
+                <div class="col-12">
+%(answers)s
+                    <p>Source: <a rel="noopener noreferer" href="%(url)s">%(url)s</a></p>
+                    <p><a href="../">See every country</a></p>
+                </div>
+            </div>
+        </div>
+    </body>
+</html>
+'''
+ANSWERS_TEMPLATE = '''                    <p><b>Are U.S. citizens permitted to enter the country?</b></p>
+                    <ul>
+%s
+                    </ul>'''
+
+# part of every hash, so changing a template re-renders everything
+TEMPLATES_DIGEST = hashlib.sha256(''.join((ROW_TEMPLATE, SUMMARY_TEMPLATE, PAGE_TEMPLATE, ANSWERS_TEMPLATE, json.dumps(
+    [CLASSIFICATION_CELLS, REQUIRED_CELLS, TOOLTIP_COLORS, ABBREVIATIONS]))).encode()).hexdigest()
+
+RE_BLOCK = re.compile(r'<!-- render:(\w+)(?: (\w+))? -->.*?<!-- /render:\1 -->', re.DOTALL)
+
+
+def _digest(data: bytes):
+    return hashlib.sha256(TEMPLATES_DIGEST.encode() + data).hexdigest()
+
+
+def _cell(class_name, value, text):
+    return '<td class="%s" data-order="%d"><span>%s</span></td>' % (class_name, value, text)
+
+
+# rows are put together from these finished cells, so rendering one is a few dict lookups and a format
+CLASSIFICATION_TDS = {value: _cell(class_name, value, text) for value, (class_name, text) in CLASSIFICATION_CELLS.items()}
+REQUIRED_TDS = {value: _cell(class_name, value, text) for value, (class_name, text) in REQUIRED_CELLS.items()}
+
+
+def _cells(country):
+    # the status cells, with main.js's rules for closed and unknown countries
+    classification = country['classification'] or 0
+    test_required, quarantine_required, last_changed = country['test_required'] or 0, country['quarantine_required'] or 0, country['last_changed'] or 0
+    if classification == 2:
+        test_required = quarantine_required = -1
+    elif classification == 0:
+        test_required = quarantine_required = last_changed = 0
+
+    classification_cell = CLASSIFICATION_TDS[classification]
+    if country['preformatted'] and classification in TOOLTIP_COLORS:
+        color, light = TOOLTIP_COLORS[classification]
+        tooltip = '<div class="%s"><b class="%s">Are U.S. citizens permitted to enter the country?</b><br>%s</div>' % (
+            light, color, '<br>'.join(html.escape(answer) for answer in country['preformatted']))
+        classification_cell = classification_cell.replace('<td ', '<td data-toggle="tooltip" data-placement="right" data-html="true" title="%s" ' % html.escape(tooltip), 1)
+
+    return {
+        'classification': classification_cell,
+        'quarantine_required': REQUIRED_TDS[quarantine_required],
+        'test_required': REQUIRED_TDS[test_required],
+        'last_changed': '<td data-order="%d">%s</td>' % (last_changed, _date(last_changed) if last_changed else '')
+    }
+
+
+def _date(unixts):
+    return datetime.datetime.fromtimestamp(unixts, datetime.timezone.utc).strftime('%Y-%m-%d')
+
+
+def render_row(country) -> str:
+    return ROW_TEMPLATE % dict(_cells(country),
+        abbreviation=html.escape(ABBREVIATIONS.get(country['abbreviation'], country['abbreviation'] or '')),
+        url=html.escape(country['url'] or ''),
+        name=html.escape(country['name']))
+
+
+def summary_counts(statuses) -> dict:
+    counts = dict.fromkeys(('open', 'partially_open', 'closed', 'unclear', 'quarantine_required', 'test_required'), 0)
+    for country in statuses:
+        classification = country['classification']
+        if classification == 5:
+            counts['open'] += 1
+        elif classification == 4:
+            counts['partially_open'] += 1
+        elif classification in (2, 3):
+            counts['closed'] += 1
+        else:
+            counts['unclear'] += 1
+        if classification in (4, 5):
+            counts['quarantine_required'] += country['quarantine_required'] == 1
+            counts['test_required'] += country['test_required'] == 1
+    counts['total'] = len(statuses)
+    return counts
+
+
+def render_page(country) -> str:
+    answers = ''
+    if country['preformatted']:
+        answers = ANSWERS_TEMPLATE % '\n'.join('                        <li>%s</li>' % html.escape(answer) for answer in country['preformatted'])
+    return PAGE_TEMPLATE % dict(_cells(country),
+        name=html.escape(country['name']),
+        url=html.escape(country['url'] or ''),
+        canonical=SITE_URL + 'countries/%s.html' % publish.slugify(country['name']),
+        answers=answers)
+
+
+# fills the render markers of the index template into filename. returns
+# whether filename was rewritten
+def render_index(statuses, template=INDEX_TEMPLATE, filename=INDEX_FILENAME) -> bool:
+    with open(template, 'rb') as f:
+        page = f.read()
+    digest = _digest(page + publish.dump_json(statuses))
+    try:
+        with open(filename, 'r') as f:
+            rendered = list(RE_BLOCK.finditer(f.read()))
+        if rendered and all(match.group(2) == digest for match in rendered):
+            return False
+    except FileNotFoundError:
+        pass
+
+    blocks = {
+        'summary': SUMMARY_TEMPLATE % summary_counts(statuses),
+        'rows': '\n'.join(render_row(country) for country in statuses),
+        'loading': '' # the table is already there, nothing to wait for
+    }
+
+    def replace(match):
+        name = match.group(1)
+        if name not in blocks:
+            logger.warning('Unknown render block %r in %s' % (name, template))
+            return match.group(0)
+        return '<!-- render:%s %s -->%s<!-- /render:%s -->' % (name, digest, blocks[name], name)
+
+    return publish.write_if_changed(filename, RE_BLOCK.sub(replace, page.decode()).encode())
+
+
+def load_state(filename=STATE_FILENAME) -> dict:
+    try:
+        with open(filename, 'r') as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return dict()
+
+
+# writes web/countries/<slug>.html for every country whose data moved since the
+# last run (or whose page is missing) and drops pages of countries that left
+# the directory. returns how many pages were written
+def render_pages(statuses, directory=PAGES_DIR, state_filename=STATE_FILENAME, now=None) -> int:
+    now = int(time.time()) if now is None else now
+    state = load_state(state_filename)
+    new_state = dict()
+    written = 0
+    for country in statuses:
+        slug = publish.slugify(country['name'])
+        filename = os.path.join(directory, slug + '.html')
+        digest = _digest(publish.dump_json(country))
+        entry = state.get(slug)
+        if entry and entry['sha256'] == digest and os.path.exists(filename):
+            new_state[slug] = entry
+            continue
+        publish.write_atomic(filename, render_page(country).encode())
+        new_state[slug] = {'name': country['name'], 'sha256': digest, 'modified': now}
+        written += 1
+
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if name.endswith('.html') and name[:-len('.html')] not in new_state:
+            os.unlink(os.path.join(directory, name))
+
+    if new_state != state:
+        publish.write_atomic(state_filename, json.dumps(new_state, indent=1, sort_keys=True).encode())
+    return written
+
+
+def render(statuses) -> int:
+    written = render_pages(statuses)
+    if render_index(statuses):
+        written += 1
+    logger.debug('Rendered %d pages' % written)
+    return written
+
+
+if __name__ == '__main__':
+    import argparse
+
+    # renders an existing web/data.json
+    parser = argparse.ArgumentParser(description='Render web/data.json into web/index.html and web/countries/')
+    parser.add_argument('--data', default='web/data.json')
+    args = parser.parse_args()
+
+    with open(args.data, 'r') as f:
+        data = json.loads(f.read())
+    print('Wrote %d changed files' % render(data['countries']))
@@ -3,6 +3,16 @@
 import xml.etree.cElementTree as ET
 import datetime
 
+import render
+
+
+def _add(root, loc, lastmod, changefreq, priority):
+    doc = ET.SubElement(root, 'url')
+    ET.SubElement(doc, 'loc').text = loc
+    ET.SubElement(doc, 'lastmod').text = lastmod
+    ET.SubElement(doc, "changefreq").text = changefreq
+    ET.SubElement(doc, 'priority').text = priority
+
 
 def generate_sitemap():
     root = ET.Element('urlset')
@@ -10,11 +20,12 @@ def generate_sitemap():
     root.attrib['xmlns:xhtml'] = 'http://www.w3.org/1999/xhtml'
 
     dt = datetime.datetime.now().strftime('%Y-%m-%d')
-    doc = ET.SubElement(root, 'url')
-    ET.SubElement(doc, 'loc').text = 'https://opencountrieslist.com/'
-    ET.SubElement(doc, 'lastmod').text = dt
-    ET.SubElement(doc, "changefreq").text = 'hourly'
-    ET.SubElement(doc, 'priority').text = '1.0'
+    _add(root, render.SITE_URL, dt, 'hourly', '1.0')
+
+    # one url per country page render.py wrote, last modified when its data last moved
+    for slug, page in sorted(render.load_state().items()):
+        lastmod = datetime.datetime.fromtimestamp(page['modified'], datetime.timezone.utc).strftime('%Y-%m-%d')
+        _add(root, render.SITE_URL + 'countries/%s.html' % slug, lastmod, 'daily', '0.8')
 
     with open('web/sitemap.xml', 'wb') as f:
         f.write(ET.tostring(root, encoding='utf-8', xml_declaration=True))
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import fcntl
+import hashlib
+import logging
+import threading
+import time
+
+import db
+
+
+logger = logging.getLogger(__name__)
+
+API_URL = 'https://api.twitter.com'
+CREDENTIALS = ('api-key', 'api-secret', 'access-token', 'access-secret')
+DEDUP_WINDOW = 60*60*24 # the same text is only queued once per window
+BURST = 5 # tweets that may go out back to back
+INTERVAL = 36 # seconds per tweet after that, twitter allows 300 per 3 hours
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 60 # seconds, doubled on every failed attempt
+
+# outbox states: pending, sent, duplicate (twitter already had it), failed
+
+
+def has_credentials(config) -> bool:
+    return all(key in config for key in CREDENTIALS)
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+# queues texts into the tweet_outbox table (see main._init_database), skipping
+# any text that was already queued in the last DEDUP_WINDOW seconds. returns how
+# many were queued
+def enqueue(c, texts, now=None, dedup_window=DEDUP_WINDOW) -> int:
+    now = int(time.time()) if now is None else now
+    queued = 0
+    for text in texts:
+        digest = _digest(text)
+        c.execute('SELECT 1 FROM `tweet_outbox` WHERE `digest`=? AND `queued_unixts`>?', (digest, now - dedup_window))
+        if c.fetchone():
+            logger.info('Tweet %r was already queued recently, skipping' % text)
+            continue
+        c.execute("INSERT INTO `tweet_outbox` (`text`, `digest`, `queued_unixts`, `attempts`, `next_attempt_unixts`, `state`) VALUES (?, ?, ?, 0, ?, 'pending')", (text, digest, now, now))
+        queued += 1
+    return queued
+
+
+def count_pending(c) -> int:
+    c.execute("SELECT COUNT(*) FROM `tweet_outbox` WHERE `state`='pending'")
+    return c.fetchone()[0]
+
+
+class TokenBucket:
+    def __init__(self, capacity=BURST, interval=INTERVAL):
+        self.capacity = capacity
+        self.interval = interval
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+        self.updated = now
+
+    # seconds until a token is available, 0 if there is one now
+    def wait_time(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        return max(self.paused_until - now, (1 - self.tokens) * self.interval, 0.0)
+
+    def take(self) -> bool:
+        if self.wait_time() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    # twitter told us to back off: nothing goes out for that long
+    def pause(self, seconds) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class SendError(Exception):
+    def __init__(self, message, retry_after=None, permanent=False, duplicate=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+        self.duplicate = duplicate
+
+
+# posts statuses through the v1.1 API. api_url can point at a local fake
+# endpoint (see "benchmark.py tweets")
+class TwitterClient:
+    def __init__(self, config):
+        import requests
+        import tweepy
+
+        auth = tweepy.OAuthHandler(config['api-key'], config['api-secret'])
+        auth.set_access_token(config['access-token'], config['access-secret'])
+        self.auth = auth.apply_auth()
+        self.url = config.get('twitter-api-url', API_URL).rstrip('/') + '/1.1/statuses/update.json'
+        self.session = requests.Session()
+
+    def send(self, text) -> None:
+        import requests
+
+        try:
+            r = self.session.post(self.url, data={'status': text}, auth=self.auth, timeout=30)
+        except requests.RequestException as e:
+            raise SendError(str(e))
+
+        if r.status_code == 200:
+            return
+        if r.status_code == 429:
+            reset = r.headers.get('x-rate-limit-reset')
+            raise SendError('rate limited', retry_after=max(int(reset) - time.time(), 1) if reset else 15*60)
+
+        try:
+            codes = [error.get('code') for error in r.json().get('errors', [])]
+        except (ValueError, AttributeError):
+            codes = []
+        if 187 in codes:
+            raise SendError('duplicate status', duplicate=True)
+        raise SendError('HTTP %d: %s' % (r.status_code, r.text[:200]), permanent=400 <= r.status_code < 500)
+
+
+def _mark(c, row_id, state, error=None, attempts=None, next_attempt=None):
+    c.execute(
+        'UPDATE `tweet_outbox` SET `state`=?, `error`=?, `attempts`=COALESCE(?, `attempts`), `next_attempt_unixts`=COALESCE(?, `next_attempt_unixts`),'
+        ' `sent_unixts`=CASE WHEN ? IN (\'sent\', \'duplicate\') THEN ? ELSE `sent_unixts` END WHERE `id`=?',
+        (state, error, attempts, next_attempt, state, int(time.time()), row_id))
+
+
+# drains the outbox of the database at filename through client, at most as fast
+# as bucket allows. failures are retried with exponential backoff up to
+# max_attempts. with drain it returns once nothing is pending; otherwise it
+# sleeps until the next retry is due, wake is set or stop is set
+def dispatch(filename, client, bucket=None, stop=None, wake=None, drain=False, max_attempts=MAX_ATTEMPTS) -> int:
+    bucket = bucket or TokenBucket()
+    stop = stop or threading.Event()
+    wake = wake or threading.Event()
+    conn = db.connect(filename)
+    c = conn.cursor()
+    sent = 0
+    try:
+        while not stop.is_set():
+            wake.clear()
+            now = int(time.time())
+            c.execute("SELECT `id`, `text`, `attempts` FROM `tweet_outbox` WHERE `state`='pending' AND `next_attempt_unixts`<=? ORDER BY `id` LIMIT 1", (now,))
+            row = c.fetchone()
+            if not row:
+                c.execute("SELECT MIN(`next_attempt_unixts`) FROM `tweet_outbox` WHERE `state`='pending'")
+                due = c.fetchone()[0]
+                if due is None and drain:
+                    break
+                wake.wait(max(due - now, 1) if due is not None else None)
+                continue
+
+            wait = bucket.wait_time()
+            if wait > 0:
+                stop.wait(wait)
+                continue
+            bucket.take()
+
+            row_id, text, attempts = row
+            try:
+                client.send(text)
+            except SendError as e:
+                if e.duplicate:
+                    logger.info('Tweet %r was already posted' % text)
+                    _mark(c, row_id, 'duplicate', None, attempts + 1)
+                elif e.retry_after is not None:
+                    # rate limited: not the tweet's fault, so it keeps its attempts
+                    logger.warning('Rate limited, pausing tweets for %d seconds' % e.retry_after)
+                    bucket.pause(e.retry_after)
+                    _mark(c, row_id, 'pending', str(e))
+                elif e.permanent or attempts + 1 >= max_attempts:
+                    logger.error('Giving up on tweet %r after %d attempts: %s' % (text, attempts + 1, e))
+                    _mark(c, row_id, 'failed', str(e), attempts + 1)
+                else:
+                    logger.warning('Tweet %r failed (%s), retrying' % (text, e))
+                    _mark(c, row_id, 'pending', str(e), attempts + 1, now + RETRY_DELAY * 2**attempts)
+            else:
+                logger.info('Tweeted %r' % text)
+                _mark(c, row_id, 'sent', None, attempts + 1)
+                sent += 1
+            conn.commit()
+    finally:
+        conn.commit()
+        conn.close()
+    return sent
+
+
+# runs dispatch() for the database at filename unless another process already
+# is. returns None if one was, else the number of tweets sent
+def dispatch_exclusive(filename, config, **kwargs):
+    with open(filename + '.tweets.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info('Another tweet dispatcher is running')
+            return None
+        return dispatch(filename, TwitterClient(config), bucket_from_config(config), **kwargs)
+
+
+def bucket_from_config(config):
+    return TokenBucket(config.get('tweet-burst', BURST), config.get('tweet-interval', INTERVAL))
@@ -393,6 +393,12 @@ $(document).ready(function() {
     var ready_end_time = (+ new Date())
     console.log('Document ready time:', (ready_end_time-ready_start_time)/1000)
 
+    // without prerendered rows, keep the empty table out of sight until
+    // DataTables has filled and sized it
+    if (document.getElementById('countries-tbody').rows.length == 0) {
+        $('#countries').addClass('hidden')
+    }
+
     function handleData(data) {
         var data_end_time = (+ new Date())
         console.log('Data ready time:', (data_end_time-ready_end_time)/1000)
@@ -407,7 +413,9 @@ $(document).ready(function() {
         var abbrevs = {
             'CHINA': 'CN'
         }
-        for (var country of data['countries']) {
+        // render.py may have put the rows in index.html already
+        const prerendered = countriesTableBody.rows.length > 0
+        for (var country of (prerendered ? [] : data['countries'])) {
             const tr = document.createElement('tr')
             const cols = [
                 _text_el(abbrevs[country['abbreviation']] || country['abbreviation']),
@@ -467,7 +475,10 @@ $(document).ready(function() {
             $('[data-toggle="tooltip"]').tooltip({ boundary: 'window' }) // #5
         })
 
-        setTimeout(function() { document.getElementById('loading').style.display = 'none'; }, 0)
+        setTimeout(function() {
+            const loading = document.getElementById('loading')
+            if (loading) loading.style.display = 'none'
+        }, 0)
         setTimeout(function(){
             if(top !== self){
                 gtag('event', 'embed', {
@@ -491,7 +502,8 @@ $(document).ready(function() {
             handleData(data);
             if (localStorage) {
                 localStorage.setItem('data', JSON.stringify(data))
-                localStorage.setItem('data_date', ''+(data['time'] * 1e3))
+                // data['time'] is when the data last changed, not when we got it
+                localStorage.setItem('data_date', ''+(+ new Date()))
             }
         }).catch((error) => {
             console.error('Error:', error)